@@ -3,13 +3,28 @@ from PIL import Image
 from streamlit_scroll_to_top import scroll_to_here
 
 from graphics.style import change_label_style
+from helpers.fragments import start_app_run, finish_app_run
+from helpers.dataset_selection import apply_session_dataset
+from helpers.url_state import apply_url_state, sync_url_state
+from helpers.memory_report import (
+    memory_debug_enabled,
+    start_rerun_tracking,
+    stop_unused_tracking,
+    finish_rerun_tracking,
+    render_memory_report,
+    track_memory,
+)
 
 from data_processing.data_processing import (
+    enable_copy_on_write,
     load_and_preprocess_data,
 )
-from tabs import tab_control, home_tab, begin_tab, explore_tab, compare_tab, assumptions_and_details_tab
+from tabs import tab_control, home_tab, begin_tab, explore_tab, compare_tab, portfolio_tab, assumptions_and_details_tab
+
 
 
+# Frames derived from the shared data are copied before they are written to
+enable_copy_on_write()
 
 # Get image used as icon in web browser tab.
 im = Image.open("images/favicon.png")
@@ -17,6 +32,17 @@ im = Image.open("images/favicon.png")
 # Configure Streamlit page settings
 st.set_page_config(page_title="SolarShift", layout="wide", page_icon=im)
 
+# Time full runs, so panels rerunning on their own can show the work they skip
+start_app_run()
+
+# Memory accounting is only switched on when the page is opened with ?debug=memory
+# on a server started with SOLARSHIFT_MEMORY_DEBUG=1
+memory_debug = memory_debug_enabled()
+if memory_debug:
+    start_rerun_tracking()
+else:
+    stop_unused_tracking()
+
 # Set content width to 90% of browser width
 st.html(
     """
@@ -54,12 +80,18 @@ if st.session_state.scroll_to_top:
     scroll_to_here(0, key="top")
     st.session_state.scroll_to_top = False  # Reset the state after scrolling
 
+# Define tabs.
+tab_names = ["Home", "Begin", "Compare", "Advanced explorer", "Portfolio", "Assumptions & details"]
+
+# A link with a state token opens on the same tab and selections
+apply_url_state(tab_names)
+
+# Every run uses the session's dataset, the default unless the URL selected another
+apply_session_dataset()
+
 # Add space that help tabs bar not get hidden.
 st.markdown("<br><br>", unsafe_allow_html=True)
 
-# Define tabs.
-tab_names = ["Home", "Begin", "Compare", "Advanced explorer", "Assumptions & details"]
-
 # Create tab navigation bar
 tab_control.create(tab_names)
 
@@ -84,6 +116,10 @@ if st.session_state["tab"] == "Compare":
 if st.session_state["tab"] == "Advanced explorer":
     explore_tab.render(data)    # Modified by Arastoo
 
+# Portfolio tab: Bulk evaluation of uploaded households
+if st.session_state["tab"] == "Portfolio":
+    portfolio_tab.render()
+
 # Assumptions & details tab: Technical information
 if st.session_state["tab"] == "Assumptions & details":
     assumptions_and_details_tab.render(data)   # Modified by Arastoo
@@ -91,3 +127,15 @@ if st.session_state["tab"] == "Assumptions & details":
 # Apply consistent styling to tab labels
 for name in tab_names:
     change_label_style(name, font_size="20px")
+
+# Keep the URL in step with the selections, so it can be shared
+sync_url_state()
+
+finish_app_run()
+
+# Memory debug panel: attribute bytes to the shared data, caches and sessions
+if memory_debug:
+    track_memory("Scenario dataset", lambda: load_and_preprocess_data()[0])
+    track_memory("Postcode to climate zone table", lambda: load_and_preprocess_data()[1])
+    finish_rerun_tracking()
+    render_memory_report()
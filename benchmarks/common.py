@@ -0,0 +1,93 @@
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app and its packages are imported relative to the repository root
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+# Default location for saved benchmark baselines
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def summarise_timings(timings: List[float]) -> Dict[str, float]:
+    """Summarise a list of timings (seconds) as p50/p95/p99/max latency in milliseconds."""
+    values = np.asarray(timings) * 1000
+    return {
+        "n": int(len(values)),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def run_metadata() -> Dict[str, str]:
+    """Details of the machine and time a benchmark was run, stored with the results."""
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(results: Dict, path: str) -> None:
+    """Write benchmark results to a JSON file, creating its directory if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float = 0.2,
+    stat: str = "p50_ms",
+) -> List[str]:
+    """Compare summarised timings against a baseline.
+
+    Args:
+        current: Mapping of benchmark name to summary (as from summarise_timings)
+        baseline: Mapping of benchmark name to summary from a saved baseline
+        tolerance: Allowed fractional slowdown before a result counts as a regression
+        stat: Summary statistic to compare
+
+    Returns:
+        List of human readable regression messages, empty if nothing regressed.
+    """
+    regressions = []
+    for name, summary in current.items():
+        if name not in baseline:
+            continue
+        old = baseline[name][stat]
+        new = summary[stat]
+        if old > 0 and new > old * (1 + tolerance):
+            regressions.append(
+                f"{name}: {stat} {old:.1f} -> {new:.1f} (+{(new / old - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def print_table(summaries: Dict[str, Dict[str, float]], title: str) -> None:
+    print(f"\n{title}")
+    width = max([len(name) for name in summaries] + [10])
+    print(f"{'':{width}}  {'n':>5}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'max ms':>9}")
+    for name, s in summaries.items():
+        print(
+            f"{name:{width}}  {s['n']:>5}  {s['p50_ms']:>9.1f}  "
+            f"{s['p95_ms']:>9.1f}  {s['p99_ms']:>9.1f}  {s['max_ms']:>9.1f}"
+        )
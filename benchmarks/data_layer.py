@@ -0,0 +1,200 @@
+"""Micro-benchmarks for the data layer at scaled dataset sizes.
+
+Times the data paths behind each tab against synthetic scenario data (see
+benchmarks/synthetic_data.py) at several multiples of the real dataset size:
+
+- load: reading and preprocessing the CSVs (load_and_preprocess_data, uncached)
+- filter cascade: the filtering done by build_interactive_data_filter
+- postcode lookup: get_rep_postcode_from_postcode, and the engine's postcode index
+- scenario lookup: one system from the engine's scenario index
+- payback: the Begin tab's heat pump payback calculation
+- explorer groupby: the Advanced explorer's averaged table
+
+Usage (from the repository root):
+
+    python -m benchmarks.data_layer                        # 1x, 10x and 100x
+    python -m benchmarks.data_layer --scales 1 10 --save-baseline
+    python -m benchmarks.data_layer --compare
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import (
+    BASELINE_DIR,
+    find_regressions,
+    load_results,
+    print_table,
+    run_metadata,
+    save_results,
+    summarise_timings,
+)
+from benchmarks.synthetic_data import DEFAULT_DATA_DIR, write_synthetic_dataset
+from data_processing.data_processing import enable_copy_on_write, metrics, groups, read_and_preprocess_data
+from helpers.data_selectors import filter_data, get_rep_postcode_from_postcode
+from engine.payback import calculate_payback
+from engine.scenarios import build_postcode_index, build_scenario_index
+from tabs.explore_tab import summarise_table
+
+DEFAULT_BASELINE = os.path.join(BASELINE_DIR, "data_layer.json")
+
+# Order of the cascading selectors in build_interactive_data_filter
+CASCADE = [
+    ("household_occupants", "Household occupants"),
+    ("hot_water_usage_pattern", "Hot water usage pattern"),
+    ("solar", "Solar"),
+    ("heater", "Heater"),
+    ("hot_water_billing_type", "Hot water billing type"),
+    ("heater_control", "Heater control"),
+]
+
+
+# Selection keys in the order of the engine's scenario index
+CASCADE_KEYS = ["location"] + [key for key, _ in CASCADE]
+
+
+def time_calls(func: Callable[[], object], repeats: int) -> List[float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def filter_cascade(data: pd.DataFrame, values: Dict[str, object]) -> pd.DataFrame:
+    """The Begin tab's postcode filter plus the non-widget work of build_interactive_data_filter."""
+    data = data[data["Location"] == values["location"]]
+    data = data.copy()
+    data = data.dropna(subset=["Household occupants"])
+    data["Household occupants"] = data["Household occupants"].astype(int)
+    for key, group in CASCADE:
+        list(data[group].unique())  # options shown in the selectbox
+        data = filter_data(data, group, values[key])
+    return data
+
+
+def electric_values(data: pd.DataFrame) -> Dict[str, object]:
+    """Selections for an Electric, flat rate, uncontrolled system at the first location."""
+    row = data[
+        (data["Heater"] == "Electric")
+        & (data["Hot water billing type"] == "Flat rate electricity")
+        & (data["Heater control"] == "Run as needed (no control)")
+        & (data["Solar"] == "No")
+    ].iloc[0]
+    return {
+        "location": row["Location"],
+        "household_occupants": row["Household occupants"],
+        "hot_water_usage_pattern": row["Hot water usage pattern"],
+        "solar": row["Solar"],
+        "heater": row["Heater"],
+        "hot_water_billing_type": row["Hot water billing type"],
+        "heater_control": row["Heater control"],
+    }
+
+
+def run_scale(scale: int, repeats: int, data_dir: str) -> Tuple[Dict[str, Dict[str, float]], int]:
+    """Run every benchmark against synthetic data at `scale`.
+
+    Returns:
+        Tuple of (timing summaries keyed by "<scale>x / <benchmark>", number of rows).
+    """
+    scenario_path, postcode_path = write_synthetic_dataset(scale, data_dir)
+
+    # The full load is slow at large scales, so it is repeated fewer times
+    load_repeats = max(1, repeats // scale) if scale > 1 else repeats
+    load_timings = time_calls(
+        lambda: read_and_preprocess_data(scenario_path, postcode_path), load_repeats
+    )
+    data, postcode_df = read_and_preprocess_data(scenario_path, postcode_path)
+
+    values = electric_values(data)
+    location_data = data[data["Location"] == values["location"]]
+
+    rng = np.random.default_rng(0)
+    sample_postcodes = rng.choice(postcode_df["postcode"].to_numpy(), size=2 * repeats)
+    postcode_iter = iter(sample_postcodes)
+
+    postcode_lookup = build_postcode_index(postcode_df)
+    index = build_scenario_index(data)
+    scenario_key = tuple(values[key] for key in CASCADE_KEYS)
+
+    show_data = data.rename(columns={"Location": "Postcode"})
+    show_data = show_data.loc[:, [g if g != "Location" else "Postcode" for g in groups] + metrics]
+
+    results = {
+        "load_and_preprocess_data": load_timings,
+        "filter cascade": time_calls(lambda: filter_cascade(data, values), repeats),
+        "postcode lookup": time_calls(
+            lambda: get_rep_postcode_from_postcode(int(next(postcode_iter)), postcode_df), repeats
+        ),
+        "postcode index lookup": time_calls(
+            lambda: postcode_lookup.get(int(next(postcode_iter))), repeats
+        ),
+        "scenario index lookup": time_calls(lambda: index.loc[scenario_key], repeats),
+        "payback": time_calls(
+            lambda: calculate_payback(
+                location_data, values, values["location"], "Yes, I just want a more efficient system", 0.04
+            ),
+            repeats,
+        ),
+        "explorer groupby": time_calls(
+            lambda: summarise_table(show_data, ["Heater", "Heater control"], "Average"), repeats
+        ),
+    }
+    summaries = {f"{scale}x / {name}": summarise_timings(t) for name, t in results.items()}
+    return summaries, len(data)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument("--repeats", type=int, default=20, help="Timed calls of each benchmark")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where synthetic CSVs are written")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Save results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Flag regressions against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed fractional p50 slowdown before flagging a regression")
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    summaries, rows = {}, {}
+    for scale in args.scales:
+        # Payback prints diagnostics for missing matches, which would swamp the output
+        with contextlib.redirect_stdout(io.StringIO()):
+            scale_summaries, rows[scale] = run_scale(scale, args.repeats, args.data_dir)
+        summaries.update(scale_summaries)
+        print(f"{scale}x: {rows[scale]:,} scenario rows")
+    print_table(summaries, "Data layer timings")
+
+    results = {"meta": {**run_metadata(), "scales": args.scales, "repeats": args.repeats, "rows": rows},
+               "benchmarks": summaries}
+    if args.output:
+        save_results(results, args.output)
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if args.compare:
+        baseline = load_results(args.baseline)
+        regressions = find_regressions(summaries, baseline["benchmarks"], args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
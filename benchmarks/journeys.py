@@ -0,0 +1,154 @@
+"""Scripted user journeys through app.py, replayed headlessly with Streamlit's AppTest.
+
+Each journey is a list of steps. A step names the tab it exercises and applies one
+user interaction to an AppTest instance; the step's rerun is what gets timed.
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.common import REPO_DIR
+
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+
+
+class Step(NamedTuple):
+    tab: str
+    name: str
+    action: Callable[[AppTest], AppTest]
+
+
+def new_app(timeout: float = 60) -> AppTest:
+    """Create a fresh headless app session (nothing is run yet)."""
+    return AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+
+def _by_label(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled {label!r} on the page")
+
+
+def open_tab(name: str) -> Callable[[AppTest], AppTest]:
+    return lambda at: at.button(key=name).click().run()
+
+
+def enter_postcode(postcode: str) -> Callable[[AppTest], AppTest]:
+    return lambda at: _by_label(at.text_input, "Enter your postcode").input(postcode).run()
+
+
+def select(key: str, value) -> Callable[[AppTest], AppTest]:
+    return lambda at: at.selectbox(key=key).select(value).run()
+
+
+def select_labelled(label: str, value) -> Callable[[AppTest], AppTest]:
+    return lambda at: _by_label(at.selectbox, label).select(value).run()
+
+
+def set_radio(label: str, value: str) -> Callable[[AppTest], AppTest]:
+    return lambda at: _by_label(at.radio, label).set_value(value).run()
+
+
+def click(key: str) -> Callable[[AppTest], AppTest]:
+    return lambda at: at.button(key=key).click().run()
+
+
+def multiselect(key: str, values: list) -> Callable[[AppTest], AppTest]:
+    return lambda at: at.multiselect(key=key).set_value(values).run()
+
+
+# Keys of the compare buttons at the bottom of the Begin tab
+COMPARE_BUTTONS = [
+    "compare_to_a_heat_pump",
+    "compare_with_adding_solar_electric_system_(pv)",
+    "compare_with_electric",
+    "compare_with_solar_thermal",
+    "compare_with_gas_instant",
+]
+
+
+def begin_journey(postcode: str = "2000") -> List[Step]:
+    """Enter a postcode, fill in the Begin cascade and ask for the payback estimate."""
+    return [
+        Step("Home", "open app", lambda at: at.run()),
+        Step("Begin", "open Begin tab", open_tab("Begin")),
+        Step("Begin", "enter postcode", enter_postcode(postcode)),
+        Step("Begin", "household occupants", select("select_household_occupants_one", 4)),
+        Step("Begin", "usage pattern", select("select_hot_water_usage_pattern_one", "Evening dominant")),
+        Step("Begin", "solar", select("select_solar_one", "No")),
+        Step("Begin", "heater", select("select_heater_one", "Electric")),
+        Step("Begin", "billing type", select("select_hot_water_billing_type_one", "Flat rate electricity")),
+        Step("Begin", "heater control", select("select_heater_control_one", "Run as needed (no control)")),
+        Step("Begin", "payback radio", set_radio(
+            "Do you want to change to a heat pump?", "Yes, I just want a more efficient system"
+        )),
+        Step("Begin", "discount rate", select_labelled("Select discount rate:", 0.04)),
+    ]
+
+
+def compare_journey(postcode: str = "2000") -> List[Step]:
+    """Fill in the Begin tab, then click each compare button in turn."""
+    steps = begin_journey(postcode)
+    for key in COMPARE_BUTTONS:
+        steps.append(Step("Compare", key, click(key)))
+        steps.append(Step("Begin", f"back to Begin after {key}", open_tab("Begin")))
+    return steps
+
+
+def explorer_journey() -> List[Step]:
+    """Narrow the Advanced explorer multiselects and switch the table to "Show all"."""
+    return [
+        Step("Home", "open app", lambda at: at.run()),
+        Step("Advanced explorer", "open explorer tab", open_tab("Advanced explorer")),
+        Step("Advanced explorer", "household size", multiselect("multiselect_household", [3, 4])),
+        Step("Advanced explorer", "usage pattern", multiselect("multiselect_pattern", ["Evening dominant"])),
+        Step("Advanced explorer", "billing type", multiselect(
+            "multiselect_tariff", ["Flat rate electricity", "Controlled load discount electricity"]
+        )),
+        Step("Advanced explorer", "solar", multiselect("multiselect_solar", ["Yes"])),
+        Step("Advanced explorer", "heater", multiselect("multiselect_heater", ["Electric", "Premium Heat Pump"])),
+        Step("Advanced explorer", "control", multiselect("multiselect_control", ["On overnight"])),
+        Step("Advanced explorer", "show all", set_radio("Data display option", "Show all")),
+    ]
+
+
+JOURNEYS = {
+    "begin": begin_journey,
+    "compare": compare_journey,
+    "explorer": explorer_journey,
+}
+
+
+def replay(steps: List[Step], at: Optional[AppTest] = None, quiet: bool = True) -> List[Tuple[Step, float]]:
+    """Replay a journey and time the rerun triggered by each step.
+
+    Args:
+        steps: Steps to apply in order
+        at: App session to replay against, a fresh one is created if not given
+        quiet: Swallow anything the app prints while it reruns
+
+    Returns:
+        List of (step, seconds) pairs.
+
+    Raises:
+        RuntimeError: If the app raises an exception during any step.
+    """
+    if at is None:
+        at = new_app()
+    timings = []
+    output = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(output):
+        for step in steps:
+            start = time.perf_counter()
+            at = step.action(at)
+            elapsed = time.perf_counter() - start
+            if at.exception:
+                raise RuntimeError(f"{step.tab} / {step.name}: {at.exception[0].message}")
+            timings.append((step, elapsed))
+    return timings
@@ -0,0 +1,188 @@
+"""Concurrent-session load test.
+
+Drives N simultaneous in-process app sessions (Streamlit AppTest instances, each
+replaying the journeys in benchmarks/journeys.py on its own thread) and reports
+throughput, tail latency and CPU/memory use as the number of sessions rises.
+
+AppTest runs each session's script in this process, the same way the Streamlit
+server runs every session's rerun on a thread of one process, so sessions share
+the GIL, the data caches and memory just as they do in production. Browser to
+server websocket traffic is not included.
+
+Usage (from the repository root):
+
+    python -m benchmarks.load_test                               # 1, 2, 4, 8 sessions
+    python -m benchmarks.load_test --concurrency 1 4 16 --duration 60
+
+share_test_runtime patches Streamlit internals and is validated against Streamlit
+1.43 (see VALIDATED_STREAMLIT_VERSION); it refuses to run if they have changed.
+"""
+import argparse
+import contextlib
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from unittest.mock import MagicMock
+
+import streamlit
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import app_test
+
+from benchmarks.common import print_table, run_metadata, save_results, summarise_timings
+from benchmarks.journeys import JOURNEYS, new_app, replay
+
+# Streamlit version whose internals share_test_runtime was validated against
+VALIDATED_STREAMLIT_VERSION = "1.43"
+
+
+def share_test_runtime() -> None:
+    """Let several AppTest sessions run at the same time.
+
+    Each AppTest run installs a stand-in Streamlit Runtime as a global when it starts
+    and removes it when it finishes, so a session finishing removes the runtime from
+    under the sessions still running. Instead, install one shared stand-in for the
+    whole load test and point AppTest at a subclass whose runtime it is free to swap.
+
+    Raises:
+        RuntimeError: If the Streamlit internals this patches are missing, e.g. after
+                      a Streamlit upgrade, instead of silently measuring the wrong thing
+    """
+    if not streamlit.__version__.startswith(VALIDATED_STREAMLIT_VERSION + "."):
+        print(
+            f"Note: the load test was validated against Streamlit {VALIDATED_STREAMLIT_VERSION}, "
+            f"running with {streamlit.__version__}"
+        )
+    if "_instance" not in vars(Runtime) or not isinstance(getattr(app_test, "Runtime", None), type):
+        raise RuntimeError(
+            f"Streamlit {streamlit.__version__} no longer has Runtime._instance or "
+            f"streamlit.testing.v1.app_test.Runtime, which the load test patches to run "
+            f"sessions concurrently (validated against {VALIDATED_STREAMLIT_VERSION})"
+        )
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    class PerRunRuntime(Runtime):
+        _instance = None
+
+    app_test.Runtime = PerRunRuntime
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident memory of this process in MB (Linux only, None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run_level(sessions: int, journeys: List[str], duration: float) -> Dict:
+    """Run `sessions` concurrent sessions, each replaying journeys until `duration` is up.
+
+    Returns:
+        Dictionary with the latency summary, throughput and resource use for this level.
+    """
+    timings: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def session_worker(worker: int) -> None:
+        i = worker
+        while time.perf_counter() < deadline:
+            journey = journeys[i % len(journeys)]
+            i += 1
+            try:
+                result = replay(JOURNEYS[journey](), new_app(), quiet=False)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{journey}: {e}")
+                continue
+            with lock:
+                timings.extend(seconds for _, seconds in result)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session_worker, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu_seconds = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        "sessions": sessions,
+        "reruns": len(timings),
+        "errors": errors,
+        "throughput_reruns_per_s": len(timings) / wall,
+        "latency": summarise_timings(timings) if timings else None,
+        # 1.0 means one core fully busy; the GIL keeps pure Python work near 1.0
+        "cpu_cores_busy": cpu_seconds / wall,
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8],
+                        help="Numbers of simultaneous sessions to test")
+    parser.add_argument("--journeys", nargs="+", default=list(JOURNEYS), choices=list(JOURNEYS))
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run each level")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    share_test_runtime()
+
+    # Warm the data caches and imports so the first level isn't penalised
+    for journey in args.journeys:
+        replay(JOURNEYS[journey](), new_app())
+
+    levels = []
+    for sessions in args.concurrency:
+        # The app prints diagnostics on some reruns. Redirect once here, since
+        # redirecting stdout separately in each thread is not thread safe.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            level = run_level(sessions, args.journeys, args.duration)
+        levels.append(level)
+        print(
+            f"{sessions:>3} sessions: {level['throughput_reruns_per_s']:6.1f} reruns/s, "
+            f"{level['cpu_cores_busy']:4.2f} cores busy, "
+            f"RSS {level['rss_mb'] or 0:7.1f} MB (peak {level['peak_rss_mb']:7.1f} MB), "
+            f"{len(level['errors'])} errors"
+        )
+        for error in level["errors"][:3]:
+            print(f"      {error}")
+
+    print_table(
+        {f"{level['sessions']} sessions": level["latency"] for level in levels if level["latency"]},
+        "Rerun latency by concurrency",
+    )
+
+    if args.output:
+        save_results({"meta": {**run_metadata(), "journeys": args.journeys, "duration": args.duration},
+                      "levels": levels}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
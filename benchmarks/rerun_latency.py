@@ -0,0 +1,96 @@
+"""Headless rerun latency benchmark over scripted user journeys.
+
+Replays the journeys in benchmarks/journeys.py through app.py with Streamlit's AppTest
+harness and reports p50/p95 rerun latency per step and per tab.
+
+Usage (from the repository root):
+
+    python -m benchmarks.rerun_latency                     # run and print results
+    python -m benchmarks.rerun_latency --save-baseline     # also save as the baseline
+    python -m benchmarks.rerun_latency --compare           # flag regressions vs baseline
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.common import (
+    BASELINE_DIR,
+    find_regressions,
+    load_results,
+    print_table,
+    run_metadata,
+    save_results,
+    summarise_timings,
+)
+from benchmarks.journeys import JOURNEYS, new_app, replay
+
+DEFAULT_BASELINE = os.path.join(BASELINE_DIR, "rerun_latency.json")
+
+
+def run_benchmark(journeys: List[str], repeats: int, warmup: int = 1) -> Dict:
+    """Replay each journey `repeats` times, each time in a fresh app session.
+
+    The first `warmup` replays of each journey are not recorded, so one-off costs
+    such as module imports and the first data load don't dominate the results.
+
+    Returns:
+        Dictionary with per-step and per-tab latency summaries.
+    """
+    step_timings: Dict[str, List[float]] = defaultdict(list)
+    tab_timings: Dict[str, List[float]] = defaultdict(list)
+
+    for journey in journeys:
+        for _ in range(warmup):
+            replay(JOURNEYS[journey](), new_app())
+        for _ in range(repeats):
+            for step, seconds in replay(JOURNEYS[journey](), new_app()):
+                step_timings[f"{journey} / {step.tab} / {step.name}"].append(seconds)
+                tab_timings[step.tab].append(seconds)
+
+    return {
+        "meta": {**run_metadata(), "journeys": journeys, "repeats": repeats, "warmup": warmup},
+        "steps": {name: summarise_timings(t) for name, t in step_timings.items()},
+        "tabs": {name: summarise_timings(t) for name, t in tab_timings.items()},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journeys", nargs="+", default=list(JOURNEYS), choices=list(JOURNEYS))
+    parser.add_argument("--repeats", type=int, default=5, help="Replays of each journey")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded replays of each journey")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Save results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Flag regressions against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed fractional p50 slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.journeys, args.repeats, args.warmup)
+    print_table(results["steps"], "Rerun latency per step")
+    print_table(results["tabs"], "Rerun latency per tab")
+
+    if args.output:
+        save_results(results, args.output)
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if args.compare:
+        baseline = load_results(args.baseline)
+        regressions = find_regressions(results["steps"], baseline["steps"], args.tolerance)
+        regressions += find_regressions(results["tabs"], baseline["tabs"], args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
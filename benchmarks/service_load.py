@@ -0,0 +1,109 @@
+"""Load test for the local JSON HTTP service (service/server.py).
+
+Sends requests from several client threads, each over its own keep-alive
+connection, and reports requests per second and latency percentiles.
+
+Usage (from the repository root), with the service running:
+
+    python -m service.server --port 8600 &
+    python -m benchmarks.service_load --url http://127.0.0.1:8600 --clients 8 --requests 20000
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from typing import List, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from benchmarks.common import print_table, summarise_timings
+
+# A spread of realistic requests: popular postcodes and a few household profiles
+POSTCODES = [2000, 2010, 2150, 3000, 3150, 4000, 5000, 6000, 7000, 2600]
+PROFILES = [
+    {"household_occupants": 2, "hot_water_usage_pattern": "Morning and evening only"},
+    {"household_occupants": 4, "hot_water_usage_pattern": "Evening dominant"},
+]
+ELECTRIC = {
+    "solar": "No",
+    "heater": "Electric",
+    "hot_water_billing_type": "Flat rate electricity",
+    "heater_control": "Run as needed (no control)",
+}
+
+
+def request_mix() -> List[Tuple[str, str, bytes]]:
+    """(method, path, body) for each request in the mix."""
+    requests = []
+    for postcode in POSTCODES:
+        requests.append(("GET", f"/postcode/{postcode}", b""))
+    rep_postcodes = [2010, 3000, 4000, 5000, 6000, 7000, 2600]
+    for location in rep_postcodes:
+        for profile in PROFILES:
+            selection = {"location": location, **profile, **ELECTRIC}
+            requests.append(("GET", "/scenario?" + urlencode(selection), b""))
+            requests.append(("GET", "/payback?" + urlencode(selection), b""))
+            requests.append(("GET", "/counterfactuals?" + urlencode(selection), b""))
+    requests.append(("POST", "/postcodes", json.dumps({"postcodes": POSTCODES}).encode()))
+    return requests
+
+
+def run_client(host: str, port: int, count: int, offset: int, timings: List[float], errors: List[str]) -> None:
+    mix = request_mix()
+    connection = http.client.HTTPConnection(host, port)
+    for i in range(count):
+        method, path, body = mix[(offset + i) % len(mix)]
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body or None,
+                               headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(f"{response.status} {method} {path}")
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(f"{method} {path}: {e}")
+            connection.close()
+            connection = http.client.HTTPConnection(host, port)
+            continue
+        timings.append(time.perf_counter() - start)
+    connection.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8600")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client connections")
+    parser.add_argument("--requests", type=int, default=20000, help="Total requests to send")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    per_client = args.requests // args.clients
+    timings_by_client = [[] for _ in range(args.clients)]
+    errors: List[str] = []
+
+    threads = [
+        threading.Thread(target=run_client, args=(url.hostname, url.port, per_client, i * 7, timings_by_client[i], errors))
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    timings = list(np.concatenate([np.asarray(t) for t in timings_by_client]))
+    print(f"{len(timings)} requests in {wall:.1f}s: {len(timings) / wall:,.0f} requests/s, {len(errors)} errors")
+    for error in errors[:5]:
+        print(f"  {error}")
+    if timings:
+        print_table({f"{args.clients} clients": summarise_timings(timings)}, "Request latency")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
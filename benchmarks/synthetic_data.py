@@ -0,0 +1,82 @@
+"""Synthetic scenario data with the schema of data/all_climatezones_scenario.csv.
+
+The synthetic grid is the real scenario grid repeated over extra climate zones:
+at scale k every location in the real data gets k - 1 synthetic copies with new
+representative postcodes, and every copy's metrics are jittered so the values are
+not identical. The postcode to climate zone table is grown the same way, so postcode
+lookups also scale with the data.
+"""
+import os
+import tempfile
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import REPO_DIR
+from data_processing.data_processing import metric_columns
+
+TEMPLATE_SCENARIO_PATH = os.path.join(REPO_DIR, "data", "all_climatezones_scenario.csv")
+TEMPLATE_POSTCODE_PATH = os.path.join(REPO_DIR, "data", "postcode_to_climatezone.csv")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "solarshift_synthetic_data")
+
+# Synthetic copies of a location are offset by multiples of this, keeping them unique
+LOCATION_OFFSET = 10000
+
+
+def raw_header(path: str = TEMPLATE_SCENARIO_PATH) -> list:
+    """Column names exactly as they appear in the CSV header (including the duplicate ID)."""
+    with open(path) as f:
+        return f.readline().strip().split(",")
+
+
+def generate_scenarios(scale: int, seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Build scenario and postcode tables `scale` times the size of the real data.
+
+    Returns:
+        Tuple of (scenario data in the raw CSV schema, postcode to climate zone table).
+    """
+    template = pd.read_csv(TEMPLATE_SCENARIO_PATH)
+    postcodes = pd.read_csv(TEMPLATE_POSTCODE_PATH)
+    rng = np.random.default_rng(seed)
+
+    numeric_metrics = [c for c in metric_columns if c in template.columns]
+    template[numeric_metrics] = template[numeric_metrics].astype(float)
+    scenario_copies, postcode_copies = [], []
+    for i in range(scale):
+        copy = template.copy()
+        copy["location"] = copy["location"] + i * LOCATION_OFFSET
+        if i > 0:
+            jitter = rng.normal(1.0, 0.05, size=(len(copy), len(numeric_metrics)))
+            copy[numeric_metrics] = copy[numeric_metrics].to_numpy(dtype=float) * jitter
+        scenario_copies.append(copy)
+
+        postcode_copy = postcodes.copy()
+        postcode_copy["postcode"] = postcode_copy["postcode"] + i * LOCATION_OFFSET
+        postcode_copy["rep_postcode"] = postcode_copy["rep_postcode"] + i * LOCATION_OFFSET
+        postcode_copies.append(postcode_copy)
+
+    data = pd.concat(scenario_copies, ignore_index=True)
+    data["ID"] = np.arange(1, len(data) + 1)
+    data["ID.1"] = data["ID"]
+    return data, pd.concat(postcode_copies, ignore_index=True)
+
+
+def write_synthetic_dataset(scale: int, data_dir: str = DEFAULT_DATA_DIR, seed: int = 0) -> Tuple[str, str]:
+    """Write synthetic CSVs for `scale`, reusing files written by an earlier run.
+
+    Returns:
+        Tuple of (scenario CSV path, postcode CSV path).
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    scenario_path = os.path.join(data_dir, f"scenarios_x{scale}_seed{seed}.csv")
+    postcode_path = os.path.join(data_dir, f"postcodes_x{scale}_seed{seed}.csv")
+    if not (os.path.exists(scenario_path) and os.path.exists(postcode_path)):
+        data, postcodes = generate_scenarios(scale, seed)
+        # Write with the real header so the duplicate ID column is reproduced. Files
+        # are renamed into place so an interrupted run never leaves a partial file.
+        data.to_csv(scenario_path + ".tmp", index=False, header=raw_header())
+        postcodes.to_csv(postcode_path + ".tmp", index=False)
+        os.replace(scenario_path + ".tmp", scenario_path)
+        os.replace(postcode_path + ".tmp", postcode_path)
+    return scenario_path, postcode_path
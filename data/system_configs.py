@@ -1,5 +1,5 @@
-def create_basic_heat_pump_config(config):
-    config["heater"] = "Premium Heat Pump"
+def create_basic_heat_pump_config(config, heater="Premium Heat Pump"):
+    config["heater"] = heater
 
     if config["hot_water_billing_type"] == "Flat rate gas":
         config["hot_water_billing_type"] = "Flat rate electricity"
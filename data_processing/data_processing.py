@@ -1,5 +1,23 @@
+import hashlib
+
+import numpy as np
 import pandas as pd
-import streamlit as st
+import pyarrow as pa
+import pyarrow.csv
+
+from data_processing.datasets import POSTCODE_DATA_PATH, active_dataset, dataset_cached, datasets
+from data_processing.shared_data import shared_frame
+
+def enable_copy_on_write() -> None:
+    """Turn on pandas copy-on-write. Called once by each entry point before any data is loaded.
+
+    The preprocessed data is shared between all sessions (see load_and_preprocess_data)
+    and may be memory-mapped read-only (see data_processing.shared_data). Copy-on-write
+    means frames derived from it never write through to the shared copy, and makes the
+    defensive .copy() calls in the tabs cheap.
+    """
+    pd.set_option("mode.copy_on_write", True)
+
 
 group_columns = {
     "location": "Location",
@@ -25,16 +43,199 @@ metric_columns = {
 groups = list(group_columns.values())
 metrics = list(metric_columns.values())
 
-@st.cache_data
+# Raw scenario columns the app uses, with their types. The duplicate ID columns and
+# fields nothing reads (new_system, old_heater, payback_period, ...) are skipped.
+# Coded columns are read dictionary-encoded, so each distinct code is stored once and
+# preprocess_data decodes the handful of distinct values rather than every row.
+_coded = pa.dictionary(pa.int32(), pa.string())
+scenario_column_types = {
+    "location": pa.int64(),
+    "profile_HWD": pa.int64(),
+    "household_size": pa.int64(),
+    "heater_type": _coded,
+    "has_solar": pa.bool_(),
+    "control_type": _coded,
+    "tariff_type": _coded,
+    "net_present_cost": pa.float64(),
+    "capital_cost": pa.int64(),
+    "annual_energy_cost": pa.float64(),
+    "daily_supply_cost": pa.float64(),
+    "oandm_cost": pa.int64(),
+    "rebates": pa.float64(),
+    "disconnection_costs": pa.int64(),
+    "annual_fit_opp_cost": pa.float64(),
+    "emissions_total": pa.float64(),
+    "annual_energy_consumption": pa.float64(),
+}
+
+# Bump when preprocessing changes the frames it produces, so that frames published
+# under the dataset version (see data_processing.shared_data) are rebuilt
+PREPROCESSING_VERSION = 5
+
+# Heaters whose results don't depend on solar PV. The data only has them without
+# solar; the same rows also stand for the system with Solar "Yes". Lookups resolve
+# those selections to the stored rows (see engine.scenarios.physical_keys), and
+# views that list or filter systems add them with with_virtual_rows (or use
+# load_all_rows, which does so once per host and dataset version).
+solar_independent_heaters = ["Gas Storage", "Gas Instant"]
+
+# The main scenario run, the default dataset (see data_processing.datasets for the others)
+SCENARIO_DATA_PATH = datasets["climate_zones"].scenario_path
+
+
+@dataset_cached()
 def load_and_preprocess_data():
-    postcode_df = pd.read_csv("data/postcode_to_climatezone.csv")
-    data = pd.read_csv("data/all_climatezones_scenario.csv")
+    """Load the active dataset's scenario and postcode data once per host.
+
+    The first process on a host preprocesses the data and publishes it (see
+    data_processing.shared_data); every process then memory-maps the same copy.
+    The returned frames are shared by every session and must not be modified in place.
+    """
+    dataset = active_dataset()
+    spec, version = dataset.spec, dataset_version()
+    data = shared_frame(
+        "scenarios", dataset.name, version,
+        lambda: preprocess_data(read_scenarios(spec.scenario_path, spec.cities), spec.duplicates),
+    )
+    postcode_df = shared_frame(
+        "postcodes", dataset.name, version, lambda: read_postcodes(spec.postcode_path, spec.cities)
+    )
+    return data, postcode_df
+
+
+@dataset_cached()
+def load_all_rows() -> pd.DataFrame:
+    """The scenario data with the virtual Solar "Yes" gas rows (see with_virtual_rows), shared between sessions.
+
+    For views that list or filter systems across locations. Published once per host
+    like the scenario data, so its numeric columns are shared by every process
+    rather than copied into each one.
+    """
+    dataset = active_dataset()
+    return shared_frame(
+        "all_rows", dataset.name, dataset_version(),
+        lambda: with_virtual_rows(load_and_preprocess_data()[0]),
+    )
+
+
+@dataset_cached(maxsize=64)
+def load_location_data(location) -> pd.DataFrame:
+    """Scenario rows for one location (representative postcode), shared between sessions.
+
+    Includes the virtual Solar "Yes" rows of gas systems, so the location's options
+    can be filtered like the raw data.
+    """
+    data, _ = load_and_preprocess_data()
+    return with_virtual_rows(data[data["Location"] == location])
+
+
+@dataset_cached()
+def dataset_version() -> str:
+    """Short hash of the active dataset's files (and the preprocessing), which changes whenever the data is updated."""
+    dataset = active_dataset()
+    digest = hashlib.sha1(
+        f"preprocessing {PREPROCESSING_VERSION}\n{dataset.name}\n{dataset.spec.cities}\n{dataset.spec.duplicates}\n".encode()
+    )
+    for path in (dataset.spec.scenario_path, dataset.spec.postcode_path):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def read_and_preprocess_data(
+    scenario_path=SCENARIO_DATA_PATH, postcode_path=POSTCODE_DATA_PATH, cities=None, duplicates="error"
+):
+    """Read the scenario and postcode CSVs and preprocess them (uncached).
+
+    The app should use the cached load_and_preprocess_data, this is for scripts and
+    benchmarks that need to load other files or time the uncached load.
+    """
+    postcode_df = read_postcodes(postcode_path, cities)
+    data = preprocess_data(read_scenarios(scenario_path, cities), duplicates)
+    return data, postcode_df
+
+
+def read_scenarios(path=SCENARIO_DATA_PATH, cities=None) -> pd.DataFrame:
+    """Read the columns of a raw scenario CSV the app uses, with their declared types.
+
+    Uses pyarrow's multithreaded CSV reader. Coded columns come back as categoricals
+    and has_solar as booleans. A file that doesn't match the declared types (e.g. a
+    cost with decimals) is read with pandas' type inference instead.
+
+    Args:
+        cities: For runs keyed by city name, each city's (state, location), see
+                data_processing.datasets.DatasetSpec. Rows of other cities are dropped.
+    """
+    column_types = scenario_column_types
+    if cities is not None:
+        column_types = {**scenario_column_types, "location": pa.string()}
+    convert_options = pyarrow.csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=list(column_types),
+        true_values=["TRUE", "True", "true"],
+        false_values=["FALSE", "False", "false"],
+    )
+    try:
+        scenarios = pyarrow.csv.read_csv(path, convert_options=convert_options).to_pandas()
+    except (pa.ArrowInvalid, KeyError) as e:
+        print(f"Reading {path} without the declared column types: {e}")
+        scenarios = pd.read_csv(path, usecols=lambda column: column in column_types)
+
+    if cities is not None:
+        locations = scenarios["location"].map({city: location for city, (_, location) in cities.items()})
+        scenarios = scenarios[locations.notna()].reset_index(drop=True)
+        scenarios["location"] = locations.dropna().astype("int64").to_numpy()
+    return scenarios
+
+
+def read_postcodes(path=POSTCODE_DATA_PATH, cities=None) -> pd.DataFrame:
+    """Read the postcode to climate zone CSV.
+
+    Args:
+        cities: For runs keyed by city name, each city's (state, location). Every
+                postcode in a city's state gets the city's location as its
+                representative postcode, and postcodes in other states get none.
+    """
+    postcode_df = pd.read_csv(path)
+    if cities is not None:
+        state_locations = {state: location for state, location in cities.values()}
+        postcode_df["rep_postcode"] = postcode_df["state"].map(state_locations)
+    return postcode_df
+
+
+def decode(column: pd.Series, labels: dict) -> pd.Series:
+    """Map coded values to stripped text labels, one lookup per distinct value.
+
+    Values without a label become "nan", as `.map(labels).astype(str)` would give.
+    """
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    decoded = pd.Index(uniques, dtype=object).map(labels).astype(str).str.strip()
+    return pd.Series(np.asarray(decoded, dtype=object)[codes], index=column.index, name=column.name)
+
+
+class DuplicateScenarioError(ValueError):
+    """A scenario run with rows repeating another row's selections."""
+
+
+def preprocess_data(data: pd.DataFrame, duplicates: str = "error") -> pd.DataFrame:
+    """Rename the raw scenario columns and map coded values to display labels.
+
+    Args:
+        data: Raw scenario rows from read_scenarios
+        duplicates: Rows repeating another row's selections are refused with "error",
+                    or with "first"/"last" that row of each repeated scenario (in file
+                    order) is kept and the others dropped (see DatasetSpec.duplicates)
+
+    Raises:
+        DuplicateScenarioError: If selections repeat and `duplicates` is "error"
+    """
     data = data.rename(columns=group_columns)
     data = data.rename(columns=metric_columns)
 
-    data["Heater"] = data["Heater"].map({
+    data["Heater"] = decode(data["Heater"], {
         "resistive": "Electric",
         "premium_heat_pump": "Premium Heat Pump",
+        "primary_heat_pump": "Premium Heat Pump",  # Its name in earlier scenario runs
         "standard_heat_pump": "Standard Heat Pump",
         "heat_pump": "Heat Pump",
         "solar_thermal": "Solar Thermal",
@@ -42,7 +243,7 @@ def load_and_preprocess_data():
         "gas_storage": "Gas Storage",
     })
 
-    data["Heater control"] = data["Heater control"].map({
+    data["Heater control"] = decode(data["Heater control"], {
         "GS": "Run as needed (no control)",
         "CL1": "On overnight",
         "CL2": "Off during peak billing times",
@@ -52,7 +253,7 @@ def load_and_preprocess_data():
         "timer_OP": "On during off-peak billing times",
     })
 
-    data["Hot water usage pattern"] = data["Hot water usage pattern"].map({
+    data["Hot water usage pattern"] = decode(data["Hot water usage pattern"], {
         1: "Morning and evening only",
         2: "Morning and evening with day time",
         3: "Evenly distributed",
@@ -61,26 +262,42 @@ def load_and_preprocess_data():
         6: "Late night",
     })
 
-    data["Hot water billing type"] = data["Hot water billing type"].map({
+    data["Hot water billing type"] = decode(data["Hot water billing type"], {
         "flat": "Flat rate electricity",
         "tou": "Time varying rate electricity",
         "CL": "Controlled load discount electricity",
         "gas": "Flat rate gas",
     })
 
-    data["Solar"] = data["Solar"].map({True: "Yes", False: "No"})
+    data["Solar"] = decode(data["Solar"], {True: "Yes", False: "No"})
 
-    # Add gas heaters with Solar PV
-    gas_data = data[data["Heater"].isin(["Gas Storage", "Gas Instant"])].copy()
-    gas_data["Solar"] = "Yes"
-    data = pd.concat([data, gas_data])
+    data["Household occupants"] = data["Household occupants"].astype(int)
 
-    # Just strip spaces 
-    for col in ["Hot water usage pattern", "Heater control", "Heater", "Hot water billing type", "Solar"]:
-        data[col] = data[col].astype(str).str.strip()
+    # Lookups need one row per selection
+    repeated = data.duplicated(groups, keep=False)
+    if repeated.any():
+        example = data.loc[repeated, groups].iloc[0].to_dict()
+        scenarios = len(data.loc[repeated, groups].drop_duplicates())
+        if duplicates not in ("first", "last"):
+            raise DuplicateScenarioError(
+                f"{int(repeated.sum())} scenario rows repeat the selections of {scenarios} scenarios, e.g. {example}"
+            )
+        dropped = data.duplicated(groups, keep=duplicates)
+        print(f"Keeping the {duplicates} row of {scenarios} repeated scenarios and dropping {int(dropped.sum())} rows")
+        data = data[~dropped].reset_index(drop=True)
 
-    data["Household occupants"] = data["Household occupants"].astype(int)
+    return data
 
-    #st.write("DEBUG after preprocessing sample:", data.head(2))
 
-    return data, postcode_df
+def with_virtual_rows(data: pd.DataFrame) -> pd.DataFrame:
+    """Scenario rows plus a Solar "Yes" copy of each of their solar independent (gas) rows.
+
+    The data stores gas systems once, without solar. Views that filter or group
+    on Solar (the selectors' options, the explorer, rankings) use this to see
+    them under both values, appended after the stored rows. The result is
+    renumbered, so each row keeps a unique label.
+    """
+    virtual = data[data["Heater"].isin(solar_independent_heaters) & (data["Solar"] == "No")]
+    if virtual.empty:
+        return data
+    return pd.concat([data, virtual.assign(Solar="Yes")], ignore_index=True)
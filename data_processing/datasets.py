@@ -0,0 +1,297 @@
+"""Registry of scenario dataset versions, loaded on first use and evicted when memory runs short.
+
+Several scenario runs can be served by one deployment, e.g. the current run and
+a new one being A/B tested. Each is registered in `datasets` under a name, and
+every session (see helpers.dataset_selection) or service request (the `dataset`
+query parameter) selects the one it uses. Code that reads the data doesn't take
+the dataset as an argument: load_and_preprocess_data and everything derived from
+it read the *active* dataset, a context variable set by the session or request.
+
+Each loaded dataset keeps its own caches (see `dataset_cached`), so its frames,
+indexes and rankings are dropped together when it is evicted. Loaded datasets are
+kept in least recently used order, and when their estimated private memory goes
+over the memory budget the least recently used ones are evicted. Frames mapped
+from shared files don't count, as their pages are shared by every process. The dataset in use is
+never evicted, and an evicted dataset is loaded again on its next use (quickly,
+from the files published by data_processing.shared_data).
+
+Environment:
+    SOLARSHIFT_DATASET: Dataset used when a session or request doesn't select one
+    SOLARSHIFT_DATASET_MEMORY_MB: Memory budget of the loaded datasets (default 1024)
+"""
+import contextlib
+import contextvars
+import functools
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from helpers.caching import SingleFlightCache, remove_cache
+
+# Absolute paths so the data loads the same whatever the working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+POSTCODE_DATA_PATH = os.path.join(DATA_DIR, "postcode_to_climatezone.csv")
+
+
+class DatasetSpec(NamedTuple):
+    """Where a dataset version's files are and how to read them.
+
+    Attributes:
+        label: Name shown to users
+        scenario_path: Raw scenario CSV
+        postcode_path: Postcode to climate zone CSV
+        cities: For runs keyed by capital city rather than representative postcode:
+                each city's (state, location). The city's rows get the location as
+                their representative postcode, and every postcode in the state maps
+                to it.
+        duplicates: What to do with rows repeating another row's selections:
+                    "error" to refuse the run, or "first"/"last" to keep that row of
+                    each repeated scenario (in file order) and drop the others
+    """
+    label: str
+    scenario_path: str
+    postcode_path: str = POSTCODE_DATA_PATH
+    cities: Optional[Dict[str, Tuple[str, int]]] = None
+    duplicates: str = "error"
+
+
+# The capital cities' representative postcodes, so city runs line up with the climate zone runs
+_capital_cities = {
+    "Sydney": ("NSW", 2010),
+    "Melbourne": ("VIC", 3000),
+    "Brisbane": ("QLD", 4000),
+    "Canberra": ("ACT", 2600),
+    "Adelaide": ("SA", 5000),
+}
+
+datasets: Dict[str, DatasetSpec] = {
+    "climate_zones": DatasetSpec(
+        "All climate zones", os.path.join(DATA_DIR, "all_climatezones_scenario.csv")
+    ),
+    # The test run repeats a few heat pump scenarios with slightly different results
+    "climate_zones_test": DatasetSpec(
+        "All climate zones (test run)", os.path.join(DATA_DIR, "all_climatezones_scenario_test.csv"),
+        duplicates="first",
+    ),
+    "capital_cities": DatasetSpec(
+        "Capital cities", os.path.join(DATA_DIR, "hotwater_data.csv"), cities=_capital_cities
+    ),
+}
+
+DEFAULT_DATASET = os.environ.get("SOLARSHIFT_DATASET", "climate_zones")
+MEMORY_BUDGET_BYTES = int(float(os.environ.get("SOLARSHIFT_DATASET_MEMORY_MB", "1024")) * 1e6)
+
+# Name of the dataset the current session or request uses (None for the default)
+_active: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("solarshift_dataset", default=None)
+
+
+class UnknownDatasetError(ValueError):
+    """A dataset name that isn't in the registry."""
+
+
+def _array_nbytes(values: np.ndarray) -> int:
+    """Private bytes of an array: 0 for views of Arrow buffers or memory maps.
+
+    Frames attached from data_processing.shared_data are views of memory-mapped
+    files whose pages are shared by every process, so they don't count towards
+    this process's budget.
+    """
+    base = values
+    while base is not None:
+        if isinstance(base, (pa.Array, pa.Buffer, mmap.mmap)):
+            return 0
+        base = getattr(base, "base", None)
+    return int(values.nbytes)
+
+
+def _nbytes(value: Any) -> int:
+    """Approximate private bytes held by a cached value: its frames and arrays (other values count as 0).
+
+    Shallow on purpose, as it is measured on every cache miss: object columns count
+    8 bytes per cell, which is what they cost when the labels are shared. Columns
+    that are views of memory-mapped shared files count 0 (see _array_nbytes).
+    """
+    if isinstance(value, pd.DataFrame):
+        columns = sum(_array_nbytes(column.to_numpy()) for _, column in value.items())
+        return columns + int(value.index.memory_usage())
+    if isinstance(value, pd.Series):
+        return _array_nbytes(value.to_numpy()) + int(value.index.memory_usage())
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage())
+    if isinstance(value, np.ndarray):
+        return _array_nbytes(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    return 0
+
+
+class LoadedDataset:
+    """A dataset in use by this process, holding the caches of everything derived from it."""
+
+    def __init__(self, name: str, spec: DatasetSpec) -> None:
+        self.name = name
+        self.spec = spec
+        self._caches: Dict[str, SingleFlightCache] = {}
+        self._lock = threading.Lock()
+        self._unloaded = False
+
+    def cache(self, name: str, maxsize: Optional[int] = None) -> Optional[SingleFlightCache]:
+        """The dataset's cache called `name`, created on first use.
+
+        Returns None once the dataset is unloaded, so a caller that looked it up
+        before it was evicted doesn't leave a cache behind on it.
+        """
+        try:
+            return self._caches[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if self._unloaded:
+                return None
+            if name not in self._caches:
+                self._caches[name] = SingleFlightCache(f"{name} [{self.name}]", maxsize)
+            return self._caches[name]
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the dataset's caches."""
+        return sum(_nbytes(value) for cache in list(self._caches.values()) for value in cache.values())
+
+    def unload(self) -> None:
+        """Drop every cached value. Sessions still using them keep their references."""
+        with self._lock:
+            caches, self._caches = self._caches, {}
+            self._unloaded = True
+        for cache in caches.values():
+            remove_cache(cache)
+
+
+# Loaded datasets, least recently used first
+_loaded: "OrderedDict[str, LoadedDataset]" = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def active_dataset_name() -> str:
+    return _active.get() or DEFAULT_DATASET
+
+
+def check_dataset(name: str) -> str:
+    """Return `name` if it is a registered dataset.
+
+    Raises:
+        UnknownDatasetError: If it isn't
+    """
+    if name not in datasets:
+        raise UnknownDatasetError(f"Unknown dataset {name!r}, expected one of {', '.join(datasets)}")
+    return name
+
+
+def use_dataset(name: Optional[str]) -> None:
+    """Make `name` (None for the default) the active dataset for the rest of the current context.
+
+    Each Streamlit script run and service request runs in a new context, so this is
+    called at the start of each one.
+    """
+    _active.set(check_dataset(name) if name is not None else None)
+
+
+@contextlib.contextmanager
+def selected_dataset(name: Optional[str]) -> Iterator[None]:
+    """Context manager making `name` the active dataset inside the block."""
+    token = _active.set(check_dataset(name) if name is not None else None)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def active_dataset() -> LoadedDataset:
+    """The active dataset, registered as loaded (and most recently used) if it isn't already."""
+    name = active_dataset_name()
+    with _registry_lock:
+        dataset = _loaded.get(name)
+        if dataset is None:
+            dataset = _loaded[name] = LoadedDataset(name, datasets[check_dataset(name)])
+        else:
+            _loaded.move_to_end(name)
+    return dataset
+
+
+def loaded_datasets() -> List[Tuple[str, int]]:
+    """(name, approximate bytes) of each loaded dataset, least recently used first."""
+    with _registry_lock:
+        loaded = list(_loaded.values())
+    return [(dataset.name, dataset.nbytes()) for dataset in loaded]
+
+
+def evict_dataset(name: str) -> None:
+    """Unload a dataset. It is loaded again the next time it is used."""
+    with _registry_lock:
+        dataset = _loaded.pop(name, None)
+    if dataset is not None:
+        dataset.unload()
+        print(f"Evicted dataset {name}")
+
+
+def enforce_memory_budget(keep: str, pending: int = 0) -> None:
+    """Evict least recently used datasets until the loaded ones fit in the memory budget.
+
+    Args:
+        keep: Dataset that is never evicted (the one in use)
+        pending: Bytes about to be added to the cached values
+    """
+    sizes = dict(loaded_datasets())
+    total = sum(sizes.values()) + pending
+    for name, size in sizes.items():
+        if total <= MEMORY_BUDGET_BYTES:
+            break
+        if name != keep:
+            evict_dataset(name)
+            total -= size
+
+
+def dataset_cached(maxsize: Optional[int] = None) -> Callable[[Callable], Callable]:
+    """Decorator caching a function's results in the active dataset's caches.
+
+    Results are kept in a helpers.caching.SingleFlightCache of the active dataset,
+    so functions of the data (indexes, lookups, rankings) return the active
+    dataset's results, computed once however many threads ask for them, and are
+    dropped with it. The arguments form the cache key, so they must be hashable.
+
+    Example:
+        @dataset_cached(maxsize=64)
+        def load_location_data(location):
+            ...
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Looked up again if the dataset is evicted in between, which registers it anew
+            cache = None
+            while cache is None:
+                dataset = active_dataset()
+                cache = dataset.cache(name, maxsize)
+
+            def compute():
+                value = func(*args, **kwargs)
+                enforce_memory_budget(dataset.name, _nbytes(value))
+                return value
+
+            key = (args, tuple(sorted(kwargs.items())))
+            # If the dataset is evicted while this computes, the cache is cleared and
+            # the value is returned without being stored (see SingleFlightCache.clear)
+            return cache.get_or_compute(key, compute)
+
+        return wrapper
+
+    return decorator
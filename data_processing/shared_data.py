@@ -0,0 +1,153 @@
+"""Preprocessed frames published once per host and memory-mapped by every process.
+
+Several app processes on one host would otherwise each hold their own copy of the
+preprocessed scenario data and the tables built from it. Instead, the first
+process to need a frame writes it to an uncompressed Arrow IPC file, and every
+process (including that one) memory-maps the file and uses its buffers directly:
+
+- numeric columns (and numeric index levels) are zero-copy views of the mapped
+  file, so their pages are shared by every process through the page cache
+- boolean columns are unpacked from Arrow's bitmaps, at 1 byte per cell
+- text columns are stored dictionary-encoded and rebuilt as object columns of the
+  few distinct labels, which costs 8 bytes per cell rather than a string per cell
+
+Files live in SHARED_DATA_DIR under the dataset's name and version, so updated
+data is published next to the old files rather than over them. By default that is
+/dev/shm (memory, not disk) where it exists. Set SOLARSHIFT_SHARED_DATA_DIR to
+use another directory, or to an empty string to keep every frame private to its
+process.
+
+Frames attached this way are read-only; with copy-on-write (turned on by every
+entry point, see data_processing.data_processing.enable_copy_on_write) pandas
+copies before any write, so code using them doesn't change.
+"""
+import json
+import os
+import shutil
+import tempfile
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SHARED_DATA_ENV = "SOLARSHIFT_SHARED_DATA_DIR"
+_default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHARED_DATA_DIR: Optional[str] = os.environ.get(SHARED_DATA_ENV, os.path.join(_default_dir, "solarshift"))
+
+# Schema metadata key holding the names of the columns that make up the index
+_INDEX_METADATA_KEY = b"solarshift_index"
+
+
+def _to_table(frame: pd.DataFrame) -> pa.Table:
+    """Arrow table of a frame with its index as ordinary columns.
+
+    Float columns keep NaN as NaN (not null), so they can be read back without a copy,
+    and text columns are dictionary-encoded (with missing values as nulls).
+    """
+    if frame.index.equals(pd.RangeIndex(len(frame))) and frame.index.name is None:
+        # A default index is recreated on reading rather than stored
+        index_names, flat = [], frame
+    else:
+        index_names = [
+            name if name is not None else f"__index_level_{i}__" for i, name in enumerate(frame.index.names)
+        ]
+        flat = frame.reset_index(names=index_names)
+    arrays = []
+    for column in flat.columns:
+        values = flat[column].to_numpy()
+        if values.dtype == object:
+            arrays.append(pa.array(values, from_pandas=True).dictionary_encode())
+        else:
+            arrays.append(pa.array(values))
+    table = pa.Table.from_arrays(arrays, names=[str(c) for c in flat.columns])
+    return table.replace_schema_metadata({_INDEX_METADATA_KEY: json.dumps(index_names).encode()})
+
+
+def _from_table(table: pa.Table) -> pd.DataFrame:
+    """Frame of a table written by _to_table, sharing the table's numeric buffers."""
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_dictionary(column.type):
+            column = column.combine_chunks()
+            # Missing values (null indices) take the NaN appended after the labels
+            labels = column.dictionary.to_numpy(zero_copy_only=False).astype(object)
+            labels = np.append(labels, np.nan)
+            columns[name] = labels[column.indices.fill_null(-1).to_numpy()]
+        elif column.num_chunks == 1:
+            # Zero-copy for numeric columns without nulls, which is how they're written
+            columns[name] = column.chunk(0).to_numpy(zero_copy_only=False)
+        else:
+            columns[name] = column.to_numpy()
+    frame = pd.DataFrame(columns, copy=False)
+    index_names = json.loads(table.schema.metadata[_INDEX_METADATA_KEY])
+    if index_names:
+        frame = frame.set_index(index_names)
+        frame.index.names = [None if name.startswith("__index_level_") else name for name in index_names]
+    return frame
+
+
+def write_frame(frame: pd.DataFrame, path: str) -> None:
+    """Write a frame to an Arrow IPC file, atomically (readers see all of it or none)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    table = _to_table(frame)
+    try:
+        with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        # Readable by app processes running as other users
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_frame(path: str) -> pd.DataFrame:
+    """Memory-map a frame written by write_frame."""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return _from_table(table)
+
+
+def _remove_old_versions(dataset: str, version: str) -> None:
+    """Delete the dataset's other versions' files. Processes still using them keep their mappings."""
+    dataset_dir = os.path.join(SHARED_DATA_DIR, dataset)
+    for entry in os.listdir(dataset_dir):
+        if entry != version and os.path.isdir(os.path.join(dataset_dir, entry)):
+            shutil.rmtree(os.path.join(dataset_dir, entry), ignore_errors=True)
+
+
+def shared_frame(name: str, dataset: str, version: str, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """A frame built once per host and dataset version, memory-mapped by every process.
+
+    Args:
+        name: File name of the frame, unique among the dataset's shared frames
+        dataset: Name of the dataset the frame was built from (see data_processing.datasets)
+        version: Version of that dataset
+        build: Builds the frame if this host hasn't published it yet
+
+    Returns:
+        The frame, mapped from the shared file. If sharing is turned off or the
+        file can't be written or read, the frame from `build`.
+    """
+    if not SHARED_DATA_DIR:
+        return build()
+    path = os.path.join(SHARED_DATA_DIR, dataset, version, f"{name}.arrow")
+    if os.path.exists(path):
+        try:
+            return read_frame(path)
+        except (OSError, pa.ArrowException) as e:
+            print(f"Rebuilding shared frame {path}: {e}")
+
+    frame = build()
+    try:
+        # Processes starting together may both publish; the files are identical and
+        # the rename is atomic, so either one wins
+        write_frame(frame, path)
+        _remove_old_versions(dataset, version)
+        return read_frame(path)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Couldn't share frame {name} in {SHARED_DATA_DIR}: {e}")
+        return frame
@@ -0,0 +1,138 @@
+"""Net present cost at any discount rate and horizon.
+
+The dataset's "Net present cost ($)" is for one fixed discount rate and horizon.
+It is made up of an up front part and a yearly running cost discounted over the
+horizon:
+
+    net present cost = capital cost - rebates + disconnection costs
+                       + (energy cost + supply cost + O&M cost) x annuity factor
+
+where the annuity factor is sum(1 / (1 + rate)^year for year = 1..horizon). The
+dataset uses 8% over 9 years, which reproduces its values exactly. Recomputing for
+other rates and horizons only needs those two parts per scenario, so every
+scenario can be recomputed for many rates and horizons in one broadcast.
+"""
+from typing import Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from helpers.caching import SingleFlightCache
+
+# Discount rate and horizon the dataset's net present cost was calculated with
+DATASET_DISCOUNT_RATE = 0.08
+DATASET_HORIZON_YEARS = 9
+
+# Cumulative cost curves, keyed by the scenarios' up front and running costs
+cost_curve_cache = SingleFlightCache("Cost curves", maxsize=256)
+
+
+def annuity_factors(rates: Union[float, Sequence[float]], horizons: Union[int, Sequence[int]]) -> np.ndarray:
+    """Present value of 1 per year for each (rate, horizon), shape (rates, horizons)."""
+    rates = np.atleast_1d(np.asarray(rates, dtype=float))[:, None]
+    horizons = np.atleast_1d(np.asarray(horizons, dtype=float))[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factors = (1 - (1 + rates) ** -horizons) / rates
+    # With no discounting every year counts in full
+    return np.where(rates == 0, horizons, factors)
+
+
+def upfront_costs(data: pd.DataFrame) -> np.ndarray:
+    """Costs paid once at the start: capital cost less rebates plus disconnection costs."""
+    return (
+        data["Up front cost ($)"].to_numpy(dtype=float)
+        - data["Rebates ($)"].fillna(0).to_numpy(dtype=float)
+        + data["disconnection_costs"].fillna(0).to_numpy(dtype=float)
+    )
+
+
+def running_costs(data: pd.DataFrame) -> np.ndarray:
+    """Costs paid every year: energy, supply and O&M."""
+    return (
+        data["Annual cost ($/yr)"].to_numpy(dtype=float)
+        + data["Annual supply cost ($/yr)"].fillna(0).to_numpy(dtype=float)
+        + data["oandm_cost"].fillna(0).to_numpy(dtype=float)
+    )
+
+
+def npc_sensitivity(
+    data: pd.DataFrame,
+    rates: Union[float, Sequence[float]],
+    horizons: Union[int, Sequence[int]],
+) -> np.ndarray:
+    """Net present cost of every scenario at every rate and horizon.
+
+    Args:
+        data: Scenario rows
+        rates: Discount rates, e.g. [0.02, 0.04, 0.06]
+        horizons: Horizons in years, e.g. range(1, 21)
+
+    Returns:
+        Array of shape (scenarios, rates, horizons).
+    """
+    factors = annuity_factors(rates, horizons)
+    return upfront_costs(data)[:, None, None] + running_costs(data)[:, None, None] * factors[None, :, :]
+
+
+def with_net_present_cost(data: pd.DataFrame, rate: float, horizon: int) -> pd.DataFrame:
+    """The scenario rows with "Net present cost ($)" recomputed for a rate and horizon.
+
+    Returns the rows unchanged when the rate and horizon are the dataset's own.
+    """
+    if rate == DATASET_DISCOUNT_RATE and horizon == DATASET_HORIZON_YEARS:
+        return data
+    data = data.copy()
+    data["Net present cost ($)"] = npc_sensitivity(data, rate, horizon)[:, 0, 0]
+    return data
+
+
+def cost_curves(data: pd.DataFrame, rate: float, horizon: int) -> np.ndarray:
+    """cumulative_costs, cached by the scenarios' costs so each selection is computed once.
+
+    The result is shared by every session and must not be modified.
+    """
+    upfront, running = upfront_costs(data), running_costs(data)
+    key = (upfront.tobytes(), running.tobytes(), rate, horizon)
+    return cost_curve_cache.get_or_compute(key, lambda: cumulative_costs(data, rate, horizon))
+
+
+def cumulative_costs(data: pd.DataFrame, rate: float, horizon: int) -> np.ndarray:
+    """Cumulative discounted cost of every scenario at the end of each year.
+
+    A (scenarios x years) cash-flow matrix built in one broadcast: the up front
+    costs at year 0 plus the running costs discounted to each year and summed.
+    The last column is the net present cost for the rate and horizon.
+
+    Returns:
+        Array of shape (scenarios, horizon + 1), column y being the cost by year y.
+    """
+    years = np.arange(horizon + 1)
+    discounted_years = np.cumsum(np.where(years == 0, 0.0, (1 + rate) ** -years.astype(float)))
+    return upfront_costs(data)[:, None] + running_costs(data)[:, None] * discounted_years[None, :]
+
+
+def break_even_years(cumulative: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """When each scenario's cumulative cost first drops to the reference's.
+
+    The crossing is interpolated between the years on either side of it.
+
+    Args:
+        cumulative: Cumulative costs, shape (scenarios, years), from cumulative_costs
+        reference: Cumulative costs of the system compared against, shape (years,)
+
+    Returns:
+        Years (fractional) per scenario: 0 if it is never more expensive than the
+        reference, NaN if it never breaks even within the horizon. The difference
+        between two scenarios only moves one way over time, so there is at most
+        one crossing.
+    """
+    difference = cumulative - reference[None, :]
+    crosses = (difference[:, 1:] <= 0) & (difference[:, :-1] > 0)
+    year = crosses.argmax(axis=1)
+    before = difference[np.arange(len(difference)), year]
+    after = difference[np.arange(len(difference)), year + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = year + before / (before - after)
+    crossing = np.where(crosses.any(axis=1), crossing, np.nan)
+    always_cheaper = np.where(difference[:, -1] <= 0, 0.0, np.nan)
+    return np.where(difference[:, 0] <= 0, always_cheaper, crossing)
@@ -0,0 +1,336 @@
+"""Heat pump payback and rebate calculations used by the Begin tab."""
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from data_processing.data_processing import load_location_data
+from data_processing.datasets import dataset_cached
+from engine.scenarios import SystemSelection, heat_pump_types, key_columns, scenario_index
+
+# Define rep_postcode to state mapping (based on postcode_to_climatezone.csv)
+rep_postcode_to_state = {
+    2600: "ACT", 2010: "NSW", 2400: "NSW", 2647: "NSW", 2880: "NSW",
+    800: "NT", 860: "NT", 870: "NT",
+    4000: "QLD", 4220: "QLD", 4720: "QLD", 4480: "QLD", 4822: "QLD",
+    5000: "SA", 5330: "SA", 5270: "SA",
+    7000: "TAS", 7330: "TAS",
+    3000: "VIC", 3570: "VIC", 3500: "VIC",
+    6000: "WA", 6430: "WA", 6640: "WA", 6720: "WA"
+}
+
+# Current heaters the Begin tab offers a heat pump payback for
+payback_heaters = ["Electric", "Gas Instant", "Gas Storage"]
+
+
+def calculate_rebate(state: Optional[str], old_heater: str, hp_type: str, upfront_cost: float) -> float:
+    """State rebate for replacing `old_heater` with a heat pump of type `hp_type`."""
+    rebate_value = 0
+    is_heat_pump = hp_type.endswith("Heat Pump")
+    if is_heat_pump:
+        if state == "NSW":
+            rebate_value = 800 if old_heater == "Electric" else 0
+        elif state == "VIC":
+            rebate_value = 840 if old_heater == "Electric" else 490
+        elif state == "ACT":
+            if (upfront_cost / 2) < 500:
+                rebate_value = 500
+            elif (upfront_cost / 2) <= 2500:
+                rebate_value = upfront_cost / 2
+            else:
+                rebate_value = 2500
+    return rebate_value
+
+
+def discounted_payback_years(upfront_cost: float, annual_savings: float, discount_rate: float) -> int:
+    """Years until discounted annual savings cover the upfront cost (capped at 50)."""
+    cumulative, year = 0, 0
+    while cumulative < upfront_cost and year < 50:
+        year += 1
+        cumulative += annual_savings / (1 + discount_rate) ** year
+    return year
+
+
+def discounted_payback_years_array(
+    upfront_cost: np.ndarray, annual_savings: np.ndarray, discount_rate: float
+) -> np.ndarray:
+    """discounted_payback_years for arrays of costs and savings, without a loop.
+
+    Solves sum(savings / (1 + r)^y for y = 1..n) >= cost for the smallest whole n,
+    giving the same years as the scalar version (0 if there is nothing to pay back,
+    50 if savings never cover the cost).
+    """
+    upfront_cost = np.asarray(upfront_cost, dtype=float)
+    annual_savings = np.asarray(annual_savings, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if discount_rate == 0:
+            years = np.ceil(upfront_cost / annual_savings - 1e-9)
+        else:
+            remaining = 1 - discount_rate * upfront_cost / annual_savings
+            years = np.ceil(-np.log(remaining) / np.log1p(discount_rate) - 1e-9)
+    years = np.where(np.isfinite(years) & (annual_savings > 0), years, 50)
+    return np.clip(np.where(upfront_cost <= 0, 0, years), 0, 50).astype(int)
+
+
+def calculate_payback(
+    all_systems_data: pd.DataFrame,
+    values: Dict[str, Optional[str]],
+    rep_postcode: int,
+    option: str,
+    discount_rate: float,
+) -> List[Dict[str, object]]:
+    """
+    Calculate the payback period of switching from the current system to a heat pump.
+
+    Used by the Begin tab when the current system is Electric, Gas Instant or Gas
+    Storage. Gas systems are compared against a flat rate heat pump without solar,
+    electric systems against a heat pump on the same tariff, solar and control.
+
+    Args:
+        all_systems_data: Scenario data for the user's location
+        values: Current system selections from build_interactive_data_filter
+        rep_postcode: Representative postcode of the user's climate zone
+        option: Answer to "Do you want to change to a heat pump?". If the current
+                system is at the end of its life, the cost of replacing it like for
+                like is deducted from the heat pump cost.
+        discount_rate: Discount rate used for the discounted payback period
+
+    Returns:
+        List of {"Heat Pump Type", "Simple Payback (yrs)", "Discounted Payback (yrs)"}
+        dictionaries, one for each heat pump type that saves money.
+    """
+    payback_data = []
+    if values.get("heater") not in payback_heaters:
+        # No heat pump comparison applies (e.g. a solar thermal or heat pump system)
+        return payback_data
+    for hp_type in heat_pump_types():
+        if values["heater"] in ["Gas Instant", "Gas Storage"]:
+            hp_row = all_systems_data.loc[
+                (all_systems_data["Location"] == rep_postcode) &
+                (all_systems_data["Household occupants"] == values["household_occupants"]) &
+                (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"]) &
+                (all_systems_data["Heater control"] == values["heater_control"]) &
+                (all_systems_data["Heater"] == hp_type) &
+                (all_systems_data["Solar"] == "No") &
+                (all_systems_data["Hot water billing type"] == "Flat rate electricity")
+            ]
+        elif values["heater"] == "Electric":
+            hp_row = all_systems_data.loc[
+                (all_systems_data["Location"] == rep_postcode) &
+                (all_systems_data["Household occupants"] == values["household_occupants"]) &
+                (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"]) &
+                (all_systems_data["Heater control"] == values["heater_control"]) &
+                (all_systems_data["Hot water billing type"] == values["hot_water_billing_type"]) &
+                (all_systems_data["Solar"] == values["solar"]) &
+                (all_systems_data["Heater"] == hp_type)
+            ]
+        if hp_row.empty:
+            print(f"No hp_row match for {hp_type} with filters.")
+            continue
+        hp_row = hp_row.iloc[0]
+
+        try:
+            old_row = all_systems_data.loc[
+                (all_systems_data["Location"] == rep_postcode) &
+                (all_systems_data["Household occupants"] == values["household_occupants"]) &
+                (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"]) &
+                (all_systems_data["Heater control"] == values["heater_control"]) &
+                (all_systems_data["Hot water billing type"] == values["hot_water_billing_type"]) &
+                (all_systems_data["Solar"] == values["solar"]) &
+                (all_systems_data["Heater"] == values["heater"])
+            ]
+        except Exception as e:
+            print(f"Old row fallback triggered: {e}")
+            old_row = all_systems_data.loc[
+                (all_systems_data["Location"] == rep_postcode) &
+                (all_systems_data["Household occupants"] == values["household_occupants"]) &
+                (all_systems_data["Heater"] == values["heater"])
+            ]
+        if old_row.empty:
+            print(f"No old_row match for heater: {values['heater']}")
+            continue
+        old_row = old_row.iloc[0]
+
+        annual_savings = old_row["Annual cost ($/yr)"] + old_row["Annual supply cost ($/yr)"] - hp_row["Annual cost ($/yr)"]
+        if annual_savings <= 0:
+            continue
+
+        upfront_cost = hp_row["Up front cost ($)"]
+
+        state = rep_postcode_to_state.get(rep_postcode)
+        try:
+            rebate_value = calculate_rebate(state, values["heater"], hp_type, upfront_cost)
+        except Exception as e:
+            print(f"Rebate error for {state}: {e}")
+            rebate_value = 0
+
+        upfront_cost -= rebate_value
+
+        simple_payback = (upfront_cost - old_row["Up front cost ($)"]) / annual_savings if option.startswith("Yes, my current") else upfront_cost / annual_savings
+
+        year = discounted_payback_years(upfront_cost, annual_savings, discount_rate)
+
+        payback_data.append({
+            "Heat Pump Type": hp_type,
+            "Simple Payback (yrs)": round(simple_payback, 1),
+            "Discounted Payback (yrs)": year
+        })
+
+    return payback_data
+
+
+def heat_pump_keys(current_keys: pd.DataFrame, hp_type: str) -> pd.DataFrame:
+    """Selections of the heat pump each current system is compared with in calculate_payback.
+
+    Gas systems are compared against a flat rate heat pump without solar, other
+    systems against a heat pump with the same tariff, solar and control.
+    """
+    is_gas = current_keys["Heater"].isin(["Gas Instant", "Gas Storage"]).to_numpy()
+    hp_keys = current_keys[key_columns].copy()
+    hp_keys["Heater"] = hp_type
+    hp_keys.loc[is_gas, "Solar"] = "No"
+    hp_keys.loc[is_gas, "Hot water billing type"] = "Flat rate electricity"
+    return hp_keys
+
+
+def heat_pump_rebates(state: np.ndarray, old_heater: np.ndarray, upfront_cost: np.ndarray) -> np.ndarray:
+    """calculate_rebate for heat pumps on whole arrays (which broadcast against each other)."""
+    is_electric = old_heater == "Electric"
+    return np.select(
+        [state == "NSW", state == "VIC", state == "ACT"],
+        [np.where(is_electric, 800, 0), np.where(is_electric, 840, 490), np.clip(upfront_cost / 2, 500, 2500)],
+        default=0,
+    )
+
+
+def payback_eligible(heater: np.ndarray, heater_control: np.ndarray) -> np.ndarray:
+    """Whether calculate_payback gives a heat pump payback for each current system.
+
+    Only the heaters in payback_heaters are compared, except electric systems
+    with a solar diverter.
+    """
+    return np.isin(heater, payback_heaters) & ~((heater == "Electric") & (heater_control == "Diverter"))
+
+
+def heat_pump_savings(old_energy_cost: np.ndarray, old_supply_cost: np.ndarray, hp_energy_cost: np.ndarray) -> np.ndarray:
+    """Yearly savings of a heat pump as in calculate_payback, on whole arrays.
+
+    The current system's energy and supply cost less the heat pump's energy cost.
+    """
+    return old_energy_cost + old_supply_cost - hp_energy_cost
+
+
+def payback_periods(
+    upfront_cost: np.ndarray,
+    old_upfront_cost: np.ndarray,
+    annual_savings: np.ndarray,
+    option: str,
+    discount_rate: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Simple and discounted payback as in calculate_payback, on whole arrays.
+
+    Args:
+        upfront_cost: Heat pump cost after rebates
+        old_upfront_cost: Current system's cost, deducted for the simple payback
+                          when the current system is at the end of its life
+        annual_savings: Yearly savings of the heat pump
+        option: Answer to "Do you want to change to a heat pump?"
+        discount_rate: Discount rate used for the discounted payback period
+
+    Returns:
+        (simple payback rounded to 0.1 years, discounted payback years), NaN where
+        the heat pump doesn't save money.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if option.startswith("Yes, my current"):
+            simple_payback = (upfront_cost - old_upfront_cost) / annual_savings
+        else:
+            simple_payback = upfront_cost / annual_savings
+    discounted_payback = discounted_payback_years_array(upfront_cost, annual_savings, discount_rate)
+    saves_money = annual_savings > 0
+    return (
+        np.where(saves_money, np.round(simple_payback, 1), np.nan),
+        np.where(saves_money, discounted_payback, np.nan),
+    )
+
+
+def calculate_payback_frame(current: pd.DataFrame, option: str, discount_rate: float) -> pd.DataFrame:
+    """calculate_payback for many current systems at once, with joins instead of a loop.
+
+    Gives the same results as calculate_payback for each row, with the heat pump
+    scenarios looked up in one batch per heat pump type and the rebates and
+    payback periods computed on whole columns.
+
+    Args:
+        current: Current systems' scenario rows, with the selection columns
+                 (key_columns), "Up front cost ($)", "Annual cost ($/yr)" and
+                 "Annual supply cost ($/yr)". Rows with missing metrics are skipped.
+        option: Answer to "Do you want to change to a heat pump?" (see calculate_payback)
+        discount_rate: Discount rate used for the discounted payback period
+
+    Returns:
+        DataFrame with the same index as `current` and "<heat pump type> simple
+        payback (yrs)" and "<heat pump type> discounted payback (yrs)" columns,
+        NaN where calculate_payback would leave that heat pump type out.
+    """
+    index = scenario_index()
+    heater = current["Heater"].to_numpy()
+    eligible = payback_eligible(heater, current["Heater control"].to_numpy())
+    state = current["Location"].map(rep_postcode_to_state).to_numpy()
+
+    results = pd.DataFrame(index=current.index)
+    for hp_type in heat_pump_types():
+        hp_rows = index.reindex(pd.MultiIndex.from_frame(heat_pump_keys(current, hp_type)))
+        annual_savings = heat_pump_savings(
+            current["Annual cost ($/yr)"].to_numpy(), current["Annual supply cost ($/yr)"].to_numpy(),
+            hp_rows["Annual cost ($/yr)"].to_numpy(),
+        )
+        upfront_cost = hp_rows["Up front cost ($)"].to_numpy(dtype=float)
+        upfront_cost = upfront_cost - heat_pump_rebates(state, heater, upfront_cost)
+
+        simple_payback, discounted_payback = payback_periods(
+            upfront_cost, current["Up front cost ($)"].to_numpy(), annual_savings, option, discount_rate
+        )
+        results[f"{hp_type} simple payback (yrs)"] = np.where(eligible, simple_payback, np.nan)
+        results[f"{hp_type} discounted payback (yrs)"] = np.where(eligible, discounted_payback, np.nan)
+    return results
+
+
+@dataset_cached(maxsize=1024)
+def calculate_payback_cached(
+    rep_postcode: int,
+    values_key: Tuple[Tuple[str, Optional[str]], ...],
+    option: str,
+    discount_rate: float,
+) -> Tuple[Dict[str, object], ...]:
+    """calculate_payback for a location's scenarios, cached across sessions.
+
+    Args:
+        values_key: The current system selections as a tuple of (key, value) pairs,
+                    e.g. tuple(sorted(values.items())), so they can be hashed.
+    """
+    values = dict(values_key)
+    return tuple(calculate_payback(load_location_data(rep_postcode), values, rep_postcode, option, discount_rate))
+
+
+def compute_payback(
+    selection: Union[SystemSelection, List[SystemSelection]],
+    option: str,
+    discount_rate: float,
+) -> Union[List[Dict[str, object]], List[List[Dict[str, object]]]]:
+    """Payback of switching the selected current system to a heat pump.
+
+    Args:
+        selection: Current system selections, including "location" (the
+                   representative postcode), or a list of them
+        option: Answer to "Do you want to change to a heat pump?" (see calculate_payback)
+        discount_rate: Discount rate used for the discounted payback period
+
+    Returns:
+        The calculate_payback result, or a list of them for a batch.
+    """
+    if isinstance(selection, list):
+        return [compute_payback(s, option, discount_rate) for s in selection]
+    return list(calculate_payback_cached(
+        selection["location"], tuple(sorted(selection.items())), option, discount_rate
+    ))
@@ -0,0 +1,320 @@
+"""Portfolio evaluation: many households at once, for installers and retailers.
+
+A portfolio is a table with one row per household, giving its postcode and the
+same selections as the Begin tab. Every household is evaluated with whole-column
+operations (a postcode map and two joins against the scenario data), so the cost
+of a portfolio grows with the number of chunks, not the number of rows.
+"""
+from typing import Iterable, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+from data_processing.data_processing import load_and_preprocess_data, metrics
+from data_processing.datasets import dataset_cached
+from engine.payback import (
+    calculate_payback_frame,
+    heat_pump_rebates,
+    heat_pump_savings,
+    payback_eligible,
+    payback_periods,
+    rep_postcode_to_state,
+)
+from engine.rankings import option_rankings
+from engine.scenarios import (
+    key_columns,
+    lookup_scenarios,
+    physical_keys,
+    postcode_index,
+    profile_columns,
+    selection_columns,
+)
+
+# Portfolio columns: the postcode followed by the selections (except location,
+# which comes from the postcode). Uploads may use these names or the app's labels.
+portfolio_columns = {"postcode": "Postcode"}
+portfolio_columns.update({key: column for key, column in selection_columns.items() if key != "location"})
+
+# Rows evaluated at a time when streaming a portfolio
+DEFAULT_CHUNK_SIZE = 5000
+
+_current_metrics = {
+    "Net present cost ($)": "Current net present cost ($)",
+    "Up front cost ($)": "Current up front cost ($)",
+    "Annual cost ($/yr)": "_current_energy_cost",
+    "Annual supply cost ($/yr)": "_current_supply_cost",
+    "CO2 emissions (tons/yr)": "Current CO2 emissions (tons/yr)",
+}
+
+_alternative_columns = {
+    "Heater": "Best alternative heater",
+    "Hot water billing type": "Best alternative billing type",
+    "Heater control": "Best alternative heater control",
+    "Net present cost ($)": "Best alternative net present cost ($)",
+    "Up front cost ($)": "_alternative_up_front_cost",
+    "Annual cost ($/yr)": "_alternative_energy_cost",
+    "Annual supply cost ($/yr)": "_alternative_supply_cost",
+    "CO2 emissions (tons/yr)": "_alternative_emissions",
+}
+
+
+class PortfolioError(ValueError):
+    """An uploaded portfolio that can't be evaluated, e.g. missing columns."""
+
+
+@dataset_cached()
+def best_alternatives() -> pd.DataFrame:
+    """The two systems with the lowest net present cost for every household profile.
+
+    Two rows per (location, occupants, usage pattern, solar): the first two options
+    of each profile in the net present cost ranking, with their "Rank". Households
+    already on the first option are offered the second.
+    """
+    best = option_rankings()["Net present cost ($)"]
+    best = best[best["Rank"] <= 2].reset_index()
+    return best[profile_columns + ["Rank"] + list(_alternative_columns)].rename(columns=_alternative_columns)
+
+
+def _best_alternative(keys: pd.DataFrame) -> pd.DataFrame:
+    """Each household's best alternative: its profile's lowest net present cost system other than its own.
+
+    One row per household, in order, with NaN where the profile has no alternative.
+    """
+    alternatives = best_alternatives()
+    by_rank = [
+        keys[profile_columns].merge(
+            alternatives[alternatives["Rank"] == rank].drop(columns="Rank"),
+            on=profile_columns, how="left", validate="many_to_one",
+        )
+        for rank in (1, 2)
+    ]
+    is_current = np.ones(len(keys), dtype=bool)
+    for column in ["Heater", "Hot water billing type", "Heater control"]:
+        is_current &= keys[column].to_numpy() == by_rank[0][_alternative_columns[column]].to_numpy()
+    # Position of each household's row in the two rankings stacked: its second option if the first is its own
+    positions = np.arange(len(keys)) + np.where(is_current, len(keys), 0)
+    return pd.concat(by_rank, ignore_index=True).iloc[positions].reset_index(drop=True)
+
+
+@dataset_cached()
+def current_systems() -> pd.DataFrame:
+    """Scenario metrics needed for a household's current system, by stored key (see physical_keys)."""
+    data, _ = load_and_preprocess_data()
+    return data[key_columns + list(_current_metrics)].rename(columns=_current_metrics)
+
+
+def normalise_portfolio(households: pd.DataFrame) -> pd.DataFrame:
+    """Rename an uploaded portfolio's columns to the app's labels and clean the values.
+
+    Accepts either the selection keys (postcode, household_occupants, ...) or the
+    labels shown in the app (Postcode, Household occupants, ...), in any case.
+    Other columns (e.g. a customer ID) are kept as they are.
+
+    Raises:
+        PortfolioError: If a required column is missing.
+    """
+    lookup = {}
+    for key, column in portfolio_columns.items():
+        lookup[key] = column
+        lookup[column.lower()] = column
+    households = households.rename(columns=lambda c: lookup.get(str(c).strip().lower(), c))
+
+    missing = [column for column in portfolio_columns.values() if column not in households.columns]
+    if missing:
+        raise PortfolioError(f"Portfolio is missing columns: {', '.join(missing)}")
+
+    households = households.copy()
+    # Nullable integers, so every chunk of a portfolio gets the same types
+    for column in ["Postcode", "Household occupants"]:
+        values = pd.to_numeric(households[column], errors="coerce")
+        households[column] = values.where(values % 1 == 0).astype("Int64")
+    for column in list(portfolio_columns.values())[2:]:
+        households[column] = households[column].astype(str).str.strip()
+    return households
+
+
+def evaluate_portfolio(
+    households: pd.DataFrame,
+    option: str = "Yes, I just want a more efficient system",
+    discount_rate: float = 0.02,
+) -> pd.DataFrame:
+    """Current cost, best alternative, payback and emissions savings for each household.
+
+    The best alternative is the lowest net present cost system open to the
+    household's profile other than its current one. "Annual savings" is the
+    difference in energy plus supply cost between the two.
+
+    A heat pump alternative's payback follows the Begin tab's rules (see
+    engine.payback.calculate_payback): it is only given for the current heaters
+    the Begin tab gives a heat pump payback, its savings are the current energy
+    and supply cost less the heat pump's energy cost, and its cost is after the
+    state rebate. Unlike the Begin tab, which compares a fixed heat pump setup per
+    heat pump type (see engine.payback.heat_pump_keys), the heat pump is the best
+    alternative, with its own tariff and control. The Begin tab has no payback for
+    other alternatives; theirs is from "Annual savings", without a rebate.
+    Postcodes missing from the postcode table are used as they are, as on the
+    Begin tab.
+
+    Args:
+        households: Portfolio rows (see normalise_portfolio for the columns)
+        option: Answer to "Do you want to change to a heat pump?". If the current
+                system is at the end of its life, its like-for-like replacement cost
+                is deducted from the alternative's cost, as on the Begin tab.
+        discount_rate: Discount rate used for the discounted payback period
+
+    Returns:
+        The households with their results appended, one row per household in the
+        same order. "Status" says why a household couldn't be evaluated.
+    """
+    households = normalise_portfolio(households)
+
+    # Representative postcode of every household in one map over the postcode index.
+    # Like the Begin tab, postcodes that aren't in the table are used as they are.
+    location = households["Postcode"].map(postcode_index()).fillna(households["Postcode"])
+    keys = pd.DataFrame({
+        "Location": location.fillna(-1).astype(int).to_numpy(),
+        "Household occupants": households["Household occupants"].fillna(-1).astype(int).to_numpy(),
+    })
+    for column in key_columns[2:]:
+        keys[column] = households[column].to_numpy()
+
+    # Left joins keep one row per household, in order (the right-hand keys are unique)
+    current = physical_keys(keys).merge(current_systems(), on=key_columns, how="left", validate="many_to_one")
+    best = _best_alternative(keys)
+
+    current_cost = (current["_current_energy_cost"] + current["_current_supply_cost"]).to_numpy()
+    alternative_cost = (best["_alternative_energy_cost"] + best["_alternative_supply_cost"]).to_numpy()
+    annual_savings = current_cost - alternative_cost
+
+    # Heat pump alternatives are paid back as on the Begin tab, and only for the heaters it
+    # gives a heat pump payback; other alternatives from their running cost savings, without a rebate
+    upfront_cost = best["_alternative_up_front_cost"].to_numpy(dtype=float)
+    is_heat_pump = best["Best alternative heater"].fillna("").str.endswith("Heat Pump").to_numpy()
+    heater = keys["Heater"].to_numpy()
+    state = keys["Location"].map(rep_postcode_to_state).to_numpy()
+    hp_savings = heat_pump_savings(
+        current["_current_energy_cost"].to_numpy(), current["_current_supply_cost"].to_numpy(),
+        best["_alternative_energy_cost"].to_numpy(),
+    )
+    rebates = np.where(is_heat_pump, heat_pump_rebates(state, heater, upfront_cost), 0)
+    simple_payback, discounted_payback = payback_periods(
+        upfront_cost - rebates, current["Current up front cost ($)"].to_numpy(dtype=float),
+        np.where(is_heat_pump, hp_savings, annual_savings), option, discount_rate,
+    )
+    no_payback = is_heat_pump & ~payback_eligible(heater, keys["Heater control"].to_numpy())
+    simple_payback = np.where(no_payback, np.nan, simple_payback)
+    discounted_payback = np.where(no_payback, np.nan, discounted_payback)
+
+    saves_money = annual_savings > 0
+
+    found = current["Current net present cost ($)"].notna().to_numpy()
+    status = np.select(
+        [location.isna().to_numpy(), households["Household occupants"].isna().to_numpy(), ~found, ~saves_money],
+        ["Invalid postcode", "Invalid household occupants", "No matching scenario", "No annual savings"],
+        default="OK",
+    )
+
+    results = pd.DataFrame({
+        "Representative postcode": location.astype("Int64").to_numpy(),
+        "Current annual cost ($/yr)": current_cost,
+        "Current net present cost ($)": current["Current net present cost ($)"].to_numpy(),
+        "Current CO2 emissions (tons/yr)": current["Current CO2 emissions (tons/yr)"].to_numpy(),
+        "Best alternative heater": best["Best alternative heater"].to_numpy(),
+        "Best alternative billing type": best["Best alternative billing type"].to_numpy(),
+        "Best alternative heater control": best["Best alternative heater control"].to_numpy(),
+        "Best alternative annual cost ($/yr)": alternative_cost,
+        "Best alternative net present cost ($)": best["Best alternative net present cost ($)"].to_numpy(),
+        "Annual savings ($/yr)": annual_savings,
+        "Simple payback (yrs)": simple_payback,
+        "Discounted payback (yrs)": discounted_payback,
+        "Emissions savings (tons/yr)": (
+            current["Current CO2 emissions (tons/yr)"] - best["_alternative_emissions"]
+        ).to_numpy(),
+        "Status": status,
+    }, index=households.index)
+    # Households that couldn't be matched have no results, rather than partial ones
+    results.loc[~found, results.columns[1:-1]] = np.nan
+    return pd.concat([households, results], axis=1)
+
+
+def iter_chunks(households: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Split a portfolio into consecutive chunks of at most chunk_size rows."""
+    for start in range(0, len(households), chunk_size):
+        yield households.iloc[start:start + chunk_size]
+
+
+def stream_portfolio(
+    chunks: Iterable[pd.DataFrame],
+    option: str = "Yes, I just want a more efficient system",
+    discount_rate: float = 0.02,
+) -> Iterator[pd.DataFrame]:
+    """Evaluate a portfolio chunk by chunk, yielding each chunk's results as it is done.
+
+    Args:
+        chunks: Portfolio chunks, e.g. from iter_chunks or pd.read_csv(..., chunksize=...)
+    """
+    for chunk in chunks:
+        yield evaluate_portfolio(chunk, option, discount_rate)
+
+
+def portfolio_template(rows: int = 3) -> pd.DataFrame:
+    """A few example households, for users to download and fill in."""
+    data, postcode_df = load_and_preprocess_data()
+    sample = data[data["Heater"].isin(["Electric", "Gas Storage"])].drop_duplicates("Location").head(rows)
+    template = sample[list(portfolio_columns.values())[1:]].copy()
+    template.insert(0, "Postcode", sample["Location"].to_numpy())
+    template.insert(0, "Customer ID", [f"C{i + 1:04d}" for i in range(len(template))])
+    return template.reset_index(drop=True)
+
+
+def summarise_portfolio(results: List[pd.DataFrame]) -> pd.DataFrame:
+    """Totals over evaluated chunks: households, savings and emissions by status."""
+    results = pd.concat(results, ignore_index=True)
+    return results.groupby("Status").agg(**{
+        "Households": ("Status", "size"),
+        "Annual savings ($/yr)": ("Annual savings ($/yr)", "sum"),
+        "Emissions savings (tons/yr)": ("Emissions savings (tons/yr)", "sum"),
+    }).reset_index()
+
+
+def begin_tab_results(
+    households: pd.DataFrame,
+    option: str = "Yes, I just want a more efficient system",
+    discount_rate: float = 0.02,
+) -> pd.DataFrame:
+    """The Begin tab's results for each household: its scenario metrics and heat pump payback.
+
+    Uses the same postcode resolution (falling back to the postcode itself),
+    scenario lookup and payback calculation as the Begin tab, so a report matches
+    what each household would see in the app, but on whole columns.
+
+    Args:
+        households: Portfolio rows (see normalise_portfolio for the columns)
+        option: Answer to "Do you want to change to a heat pump?"
+        discount_rate: Discount rate used for the discounted payback period
+
+    Returns:
+        The households with "Representative postcode", the scenario metrics, a
+        simple and discounted payback column for each heat pump type, and "Status".
+    """
+    households = normalise_portfolio(households)
+
+    # Like the Begin tab, postcodes that aren't in the table are used as they are
+    location = households["Postcode"].map(postcode_index()).fillna(households["Postcode"])
+    keys = pd.DataFrame({
+        "Location": location.fillna(-1).astype(int).to_numpy(),
+        "Household occupants": households["Household occupants"].fillna(-1).astype(int).to_numpy(),
+    })
+    for column in key_columns[2:]:
+        keys[column] = households[column].to_numpy()
+
+    current = lookup_scenarios(keys)
+    found = current["Net present cost ($)"].notna().to_numpy()
+
+    results = pd.DataFrame({"Representative postcode": location.astype("Int64").to_numpy()})
+    for metric in metrics:
+        results[metric] = current[metric].to_numpy(dtype=float)
+    results = pd.concat([results, calculate_payback_frame(current, option, discount_rate)], axis=1)
+    results["Status"] = np.where(found, "OK", "No matching scenario")
+    results.index = households.index
+    return pd.concat([households, results], axis=1)
@@ -0,0 +1,186 @@
+"""Precomputed rankings and frontiers of the options open to each household profile.
+
+A profile is a (location, occupants, usage pattern, solar) combination: the
+things about a household that don't change when it picks a new hot water system.
+For every profile, the heater / control / tariff options are ranked by each
+ranking metric once, when the data is loaded, so "what are my best options"
+is a slice of a sorted index rather than a filter and sort per request. The
+same goes for each profile's cost vs emissions (Pareto) frontier.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_processing.data_processing import dataset_version, load_all_rows, metrics
+from data_processing.datasets import active_dataset_name, dataset_cached
+from data_processing.shared_data import shared_frame
+from engine.scenarios import key_columns, profile_columns
+
+# Total yearly running cost, used to rank options by annual cost
+TOTAL_ANNUAL_COST = "Total annual cost ($/yr)"
+
+# Metrics options can be ranked by (lowest first), with the names shown in the app
+ranking_metrics = {
+    "Net present cost": "Net present cost ($)",
+    "Annual cost": TOTAL_ANNUAL_COST,
+    "Emissions": "CO2 emissions (tons/yr)",
+}
+
+# Columns that describe an option within a profile
+option_columns = ["Heater", "Heater control", "Hot water billing type"]
+
+# Options kept per profile and metric: about half of a profile's 14-22 options.
+# The most any caller asks for is 5 (the Begin tab's best options; portfolios use
+# the top 2), so this leaves room for a longer list without storing every option.
+TOP_K = 10
+
+
+def metric_values(data: pd.DataFrame, metric: str) -> pd.Series:
+    """A ranking metric for scenario rows, adding up the total annual cost if needed."""
+    if metric == TOTAL_ANNUAL_COST:
+        return data["Annual cost ($/yr)"] + data["Annual supply cost ($/yr)"]
+    return data[metric]
+
+
+def rank_within_profiles(data: pd.DataFrame, metric: str, k: Optional[int] = TOP_K) -> pd.DataFrame:
+    """The best k options of every profile by `metric`, using one grouped argsort.
+
+    Rows are sorted by profile and then by metric with a single np.lexsort, and
+    each row's rank is its position minus the position where its profile starts.
+
+    Returns:
+        The top rows indexed by profile_columns (sorted, so profiles can be
+        sliced with .loc), with a "Rank" column starting at 1.
+    """
+    # Profile codes in sorted order of the profile columns, so the result's index is sorted
+    codes = data.groupby(profile_columns, sort=True).ngroup().to_numpy()
+    order = np.lexsort((data[metric].to_numpy(), codes))
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    rank = np.arange(len(order)) - np.repeat(starts, sizes) + 1
+
+    keep = rank <= k if k is not None else np.ones(len(order), dtype=bool)
+    ranked = data.iloc[order[keep]]
+    ranked.insert(0, "Rank", rank[keep])
+    return ranked.set_index(profile_columns)
+
+
+def build_rankings(data: pd.DataFrame, k: Optional[int] = TOP_K) -> Dict[str, pd.DataFrame]:
+    """rank_within_profiles for every ranking metric, keyed by the metric's column."""
+    data = data[profile_columns + option_columns + metrics].copy()
+    data[TOTAL_ANNUAL_COST] = metric_values(data, TOTAL_ANNUAL_COST)
+    return {column: rank_within_profiles(data, column, k) for column in ranking_metrics.values()}
+
+
+@dataset_cached()
+def option_rankings() -> Dict[str, pd.DataFrame]:
+    """Rankings of the scenario data, built once per host and shared by all sessions."""
+    built = {}
+
+    def ranking(column: str) -> pd.DataFrame:
+        if not built:
+            built.update(build_rankings(load_all_rows()))
+        return built[column]
+
+    return {
+        column: shared_frame(
+            f"ranking_{name.lower().replace(' ', '_')}", active_dataset_name(), dataset_version(),
+            lambda c=column: ranking(c),
+        )
+        for name, column in ranking_metrics.items()
+    }
+
+
+def top_options(profile: Tuple, metric: str = "Net present cost ($)", k: int = 5) -> pd.DataFrame:
+    """The k best options for a profile, best first.
+
+    Args:
+        profile: (location, occupants, usage pattern, solar)
+        metric: A column from ranking_metrics
+        k: Number of options (at most TOP_K)
+
+    Returns:
+        DataFrame with "Rank", option_columns and the metrics. Empty if the
+        profile isn't in the data.
+    """
+    ranking = option_rankings()[metric]
+    try:
+        options = ranking.loc[tuple(profile)]
+    except KeyError:
+        return ranking.iloc[:0].reset_index(drop=True)
+    return options.iloc[:k].reset_index(drop=True)
+
+
+def pareto_mask(
+    data: pd.DataFrame, cost: str = "Net present cost ($)", emissions: str = "CO2 emissions (tons/yr)"
+) -> np.ndarray:
+    """Which rows are Pareto optimal on cost and emissions within their profile.
+
+    A skyline computed for every profile at once: rows are sorted by profile,
+    cost and emissions, and a row is on its profile's frontier if its emissions
+    are lower than every cheaper (or equally cheap) row's, i.e. lower than the
+    running minimum of its profile so far.
+
+    Returns:
+        Boolean array aligned with the rows of `data`.
+    """
+    codes = data.groupby(profile_columns, sort=False).ngroup().to_numpy()
+    cost_values = data[cost].to_numpy(dtype=float)
+    emission_values = data[emissions].to_numpy(dtype=float)
+    order = np.lexsort((emission_values, cost_values, codes))
+
+    sorted_codes = codes[order]
+    sorted_emissions = emission_values[order]
+    group_start = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    running_min = pd.Series(sorted_emissions).groupby(sorted_codes).cummin().to_numpy()
+    # Lowest emissions of the cheaper rows in the same profile (none at a profile's first row)
+    previous_min = np.where(group_start, np.inf, np.r_[np.inf, running_min[:-1]])
+
+    mask = np.zeros(len(data), dtype=bool)
+    mask[order] = sorted_emissions < previous_min
+    return mask
+
+
+def build_pareto_index(data: pd.DataFrame) -> pd.DataFrame:
+    """The cost vs emissions frontier of every profile, indexed by profile_columns.
+
+    Each profile's frontier rows are sorted from cheapest (highest emissions) to
+    cleanest (most expensive).
+    """
+    frontier = data.loc[pareto_mask(data), profile_columns + option_columns + metrics]
+    return frontier.sort_values(profile_columns + ["Net present cost ($)"]).set_index(profile_columns)
+
+
+@dataset_cached()
+def pareto_index() -> pd.DataFrame:
+    """Frontiers of the scenario data, built once per host and shared by all sessions."""
+    return shared_frame(
+        "pareto_frontiers", active_dataset_name(), dataset_version(),
+        lambda: build_pareto_index(load_all_rows()),
+    )
+
+
+@dataset_cached()
+def _pareto_keys() -> pd.MultiIndex:
+    frontier = pareto_index().reset_index()
+    return pd.MultiIndex.from_frame(frontier[key_columns])
+
+
+def pareto_frontier(profile: Tuple) -> pd.DataFrame:
+    """A profile's cost vs emissions frontier, cheapest first (empty if unknown).
+
+    Args:
+        profile: (location, occupants, usage pattern, solar)
+    """
+    frontier = pareto_index()
+    try:
+        return frontier.loc[tuple(profile)].reset_index(drop=True)
+    except KeyError:
+        return frontier.iloc[:0].reset_index(drop=True)
+
+
+def is_pareto_optimal(rows: pd.DataFrame) -> np.ndarray:
+    """Whether each scenario row is on its profile's frontier, by looking up its selection."""
+    return pd.MultiIndex.from_frame(rows[key_columns]).isin(_pareto_keys())
@@ -0,0 +1,367 @@
+"""Scenario lookups shared by the app, scripts and services.
+
+Nothing in the engine package imports Streamlit. Selections use the same
+dictionary keys as the values returned by build_interactive_data_filter, so a
+tab's selections can be passed straight to these functions.
+
+Functions accept a single query or a batch (a list of queries) and return a
+single result or a list of results to match.
+"""
+from typing import Any, Dict, List, Optional, Sequence, TypedDict, Union
+
+import numpy as np
+import pandas as pd
+
+from data.system_configs import (
+    create_basic_heat_pump_config,
+    create_solar_electric,
+    create_electric,
+    create_solar_thermal,
+    create_gas_instant,
+)
+from data_processing.data_processing import (
+    dataset_version,
+    load_all_rows,
+    load_and_preprocess_data,
+    load_location_data,
+    solar_independent_heaters,
+)
+from data_processing.datasets import active_dataset_name, dataset_cached
+from data_processing.shared_data import shared_frame
+
+# Selection keys and the data columns they select on, in the order of the cascading
+# selectors (each selector's options depend on the selections before it).
+selection_columns = {
+    "location": "Location",
+    "household_occupants": "Household occupants",
+    "hot_water_usage_pattern": "Hot water usage pattern",
+    "solar": "Solar",
+    "heater": "Heater",
+    "hot_water_billing_type": "Hot water billing type",
+    "heater_control": "Heater control",
+}
+
+key_columns = list(selection_columns.values())
+_solar_position = key_columns.index("Solar")
+_heater_position = key_columns.index("Heater")
+
+# Households with the same profile can choose between the same systems
+profile_columns = ["Location", "Household occupants", "Hot water usage pattern", "Solar"]
+
+# Heat pump types in the order they are shown. Datasets label their heat pumps
+# differently (e.g. a single "Heat Pump"), see heat_pump_types.
+preferred_heat_pump_types = ["Premium Heat Pump", "Standard Heat Pump"]
+
+
+@dataset_cached()
+def heat_pump_types() -> List[str]:
+    """The heat pump types in the active dataset: the preferred ones it has, then any others."""
+    heaters = list(load_and_preprocess_data()[0]["Heater"].unique())
+    others = [h for h in heaters if h.endswith("Heat Pump") and h not in preferred_heat_pump_types]
+    return [h for h in preferred_heat_pump_types if h in heaters] + others
+
+
+def basic_heat_pump_config(config: dict) -> dict:
+    """create_basic_heat_pump_config with the active dataset's first heat pump type."""
+    return create_basic_heat_pump_config(config, (heat_pump_types() or preferred_heat_pump_types)[0])
+
+
+# Alternatives offered by the compare buttons on the Begin tab, and the functions
+# that turn the current system into each alternative.
+counterfactual_configs = {
+    "Compare to a Heat Pump": basic_heat_pump_config,
+    "Compare with adding solar electric system (PV)": create_solar_electric,
+    "Compare with Electric": create_electric,
+    "Compare with Solar Thermal": create_solar_thermal,
+    "Compare with Gas Instant": create_gas_instant,
+}
+
+
+class SystemSelection(TypedDict, total=False):
+    """A hot water system and household, i.e. one row of the scenario data."""
+
+    location: int
+    household_occupants: int
+    hot_water_usage_pattern: str
+    solar: str
+    heater: str
+    hot_water_billing_type: str
+    heater_control: str
+
+
+def build_postcode_index(postcode_df: pd.DataFrame) -> Dict[int, int]:
+    """Mapping of every postcode to its climate zone's representative postcode.
+
+    Postcodes without a representative postcode are left out.
+    """
+    postcode_df = postcode_df.dropna(subset=["rep_postcode"]).drop_duplicates("postcode")
+    return dict(zip(postcode_df["postcode"].tolist(), postcode_df["rep_postcode"].astype(int).tolist()))
+
+
+def build_scenario_index(data: pd.DataFrame) -> pd.DataFrame:
+    """The scenario data indexed (and sorted) by the selection columns.
+
+    The stored rows have a unique key. Look selections up through physical_keys,
+    as gas systems with solar are stored under Solar "No".
+    """
+    return data.set_index(key_columns).sort_index()
+
+
+def physical_key(key: tuple) -> tuple:
+    """Key (in key_columns order) of the stored row holding a selection's scenario.
+
+    Solar independent (gas) systems are stored once, under Solar "No", which
+    also stands for the same system with Solar "Yes".
+    """
+    if key[_heater_position] in solar_independent_heaters:
+        return key[:_solar_position] + ("No",) + key[_solar_position + 1:]
+    return key
+
+
+def physical_keys(keys: pd.DataFrame) -> pd.DataFrame:
+    """physical_key for a frame of keys (with key_columns), on whole columns."""
+    return keys.assign(Solar=keys["Solar"].where(~keys["Heater"].isin(solar_independent_heaters), "No"))
+
+
+def lookup_scenarios(keys: pd.DataFrame) -> pd.DataFrame:
+    """Scenario rows for a frame of keys, one per key in order, with NaN metrics where there is none.
+
+    Returns:
+        DataFrame with the requested key_columns (so virtual Solar "Yes" gas rows
+        keep their Solar value) followed by the scenario columns.
+    """
+    rows = scenario_index().reindex(pd.MultiIndex.from_frame(physical_keys(keys[key_columns])))
+    rows.index = pd.MultiIndex.from_frame(keys[key_columns])
+    return rows.reset_index()
+
+
+@dataset_cached()
+def postcode_index() -> Dict[int, int]:
+    return build_postcode_index(load_and_preprocess_data()[1])
+
+
+def _shareable(index: pd.Index) -> pd.Index:
+    """Build an index's lookup table before it is shared between threads.
+
+    pandas builds it lazily on the first lookup, and threads racing to build it
+    (e.g. prefetch jobs) can see a half-built one and fail with InvalidIndexError.
+    """
+    index.is_unique
+    return index
+
+
+@dataset_cached()
+def scenario_index() -> pd.DataFrame:
+    """build_scenario_index of the scenario data, built once per host and shared by all processes."""
+    index = shared_frame(
+        "scenario_index", active_dataset_name(), dataset_version(),
+        lambda: build_scenario_index(load_and_preprocess_data()[0]),
+    )
+    _shareable(index.index)
+    return index
+
+
+def build_option_tree(data: pd.DataFrame) -> Dict[tuple, list]:
+    """The options of every selector in the cascade, keyed by the selections before it.
+
+    Keys are (location, *earlier selections), with location None for options across
+    all locations. Options are in the order they first appear in the data, as the
+    cascading selectors list them.
+    """
+    tree = {}
+    cascade = key_columns[1:]
+    for by_location in (False, True):
+        for level, column in enumerate(cascade):
+            prefix = (["Location"] if by_location else []) + cascade[:level]
+            options = data.drop_duplicates(prefix + [column])[prefix + [column]]
+            for *key, option in options.itertuples(index=False, name=None):
+                key = tuple(_python_value(k) for k in key)
+                tree.setdefault(key if by_location else (None,) + key, []).append(_python_value(option))
+    return tree
+
+
+def _python_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+@dataset_cached()
+def option_tree() -> Dict[tuple, list]:
+    return build_option_tree(load_all_rows())
+
+
+def resolve_selection(selection: SystemSelection) -> SystemSelection:
+    """The selection the cascading selectors end up showing for `selection`.
+
+    Going down the cascade, a value that isn't one of the options left by the
+    earlier selections is replaced by the first option, as the selectors do.
+    """
+    tree = option_tree()
+    resolved = {}
+    prefix = (selection.get("location"),)
+    for key in selection_columns:
+        if key == "location":
+            continue
+        options = tree.get(prefix, [])
+        value = selection.get(key)
+        resolved[key] = value if value in options else (options[0] if options else None)
+        prefix += (resolved[key],)
+    resolved["location"] = selection.get("location")
+    return resolved
+
+
+@dataset_cached()
+def _row_keys() -> pd.MultiIndex:
+    """Key of every stored row of the scenario data, in row order (unique)."""
+    return _shareable(pd.MultiIndex.from_frame(load_and_preprocess_data()[0][key_columns]))
+
+
+def lookup_systems(data: pd.DataFrame, selections: List[SystemSelection], labels: List[str]) -> pd.DataFrame:
+    """The scenario rows of several systems, found with one batched index lookup.
+
+    Args:
+        data: The scenario data, or a dataset derived from it with the same rows in
+              the same order (e.g. a what-if dataset)
+        selections: Selections with every key in selection_columns. A location of
+                    None selects the system in every location.
+        labels: Name of each system, put in a "System" column
+
+    Returns:
+        The matching rows in selection order, preceded by a "System" column.
+        Selections without a scenario have no rows.
+    """
+    locations = _row_keys().get_level_values("Location").unique()
+    keys, owners = [], []
+    for owner, selection in enumerate(selections):
+        key = physical_key(_selection_key(selection))
+        for location in ([key[0]] if key[0] is not None else locations):
+            keys.append((location,) + key[1:])
+            owners.append(owner)
+    positions = _row_keys().get_indexer(pd.MultiIndex.from_tuples(keys, names=key_columns)) if keys else np.array([], dtype=int)
+    found = positions >= 0
+    owners = np.asarray(owners, dtype=int)[found]
+    rows = data.iloc[positions[found]].copy()
+    # Gas systems selected with solar come from their stored Solar "No" rows
+    rows["Solar"] = np.asarray([selection["solar"] for selection in selections], dtype=object)[owners]
+    rows.insert(0, "System", np.asarray(labels, dtype=object)[owners])
+    return rows
+
+
+def _selection_key(selection: SystemSelection) -> tuple:
+    return tuple(selection.get(key) for key in selection_columns)
+
+
+def postcode_number(postcode: Any) -> Optional[int]:
+    """A postcode as an int, or None if it is missing (None, NaN, blank) or not a whole number."""
+    if isinstance(postcode, str):
+        postcode = postcode.strip()
+        return int(postcode) if postcode.isdigit() else None
+    if isinstance(postcode, bool) or postcode is None or pd.isna(postcode):
+        return None
+    try:
+        number = int(postcode)
+    except (TypeError, ValueError):
+        return None
+    return number if number == postcode else None
+
+
+def resolve_postcode(
+    postcode: Union[int, Sequence[int]]
+) -> Union[Optional[int], List[Optional[int]]]:
+    """Representative postcode of a postcode's climate zone.
+
+    None for postcodes that don't resolve: unknown, missing (None, NaN or blank)
+    or not a whole number.
+
+    Args:
+        postcode: A postcode, or a list/array of postcodes (an empty one gives an empty list)
+    """
+    index = postcode_index()
+    if isinstance(postcode, (list, tuple, np.ndarray, pd.Series)):
+        return [index.get(postcode_number(p)) for p in postcode]
+    return index.get(postcode_number(postcode))
+
+
+def list_options(
+    selection: Union[SystemSelection, List[SystemSelection]], field: str
+) -> Union[list, List[list]]:
+    """Valid options for `field` given the selections made before it in the cascade.
+
+    Args:
+        selection: Selections (only those before `field` are used), or a list of them
+        field: Selection key, e.g. "heater"
+    """
+    if isinstance(selection, list):
+        return [list_options(s, field) for s in selection]
+
+    location = selection.get("location")
+    data = load_location_data(location) if location is not None else load_all_rows()
+    for key, column in selection_columns.items():
+        if key == field:
+            break
+        if key != "location" and selection.get(key) is not None:
+            data = data[data[column] == selection[key]]
+    return list(data[selection_columns[field]].unique())
+
+
+def get_scenario(
+    selection: Union[SystemSelection, List[SystemSelection]]
+) -> Union[Optional[pd.Series], pd.DataFrame]:
+    """Look up the scenario results for a fully specified system.
+
+    Args:
+        selection: A selection with every key in selection_columns, or a list of them
+
+    Returns:
+        For one selection, its row (None if there is no such scenario). For a list,
+        a DataFrame with one row per selection in the same order, with NaN metrics
+        for selections that have no scenario.
+    """
+    if isinstance(selection, list):
+        return lookup_scenarios(pd.DataFrame([_selection_key(s) for s in selection], columns=key_columns))
+    try:
+        row = scenario_index().loc[physical_key(_selection_key(selection))]
+    except KeyError:
+        return None
+    return pd.concat([pd.Series(_selection_key(selection), index=key_columns), row])
+
+
+def compare_systems(
+    current: Union[SystemSelection, List[SystemSelection]],
+    alternative: Union[SystemSelection, List[SystemSelection]],
+) -> Union[pd.DataFrame, List[pd.DataFrame]]:
+    """Scenario results for a current and alternative system, labelled as in the Compare tab.
+
+    Returns:
+        DataFrame with a "System" column ("Current system" / "Alternative system")
+        followed by the scenario columns, or a list of them for a batch.
+    """
+    if isinstance(current, list):
+        rows = get_scenario([s for pair in zip(current, alternative) for s in pair])
+        return [rows.iloc[i:i + 2].reset_index(drop=True).pipe(_label_systems) for i in range(0, len(rows), 2)]
+    return _label_systems(get_scenario([current, alternative]))
+
+
+def _label_systems(rows: pd.DataFrame) -> pd.DataFrame:
+    rows = rows.copy()
+    rows.insert(0, "System", ["Current system", "Alternative system"])
+    return rows
+
+
+def compare_counterfactuals(
+    selection: Union[SystemSelection, List[SystemSelection]]
+) -> Union[Dict[str, pd.DataFrame], List[Dict[str, pd.DataFrame]]]:
+    """Compare the current system with each alternative offered by the Begin tab.
+
+    Returns:
+        Mapping of compare button label to compare_systems result, or a list of
+        them for a batch. All comparisons are looked up in one batch.
+    """
+    selections = selection if isinstance(selection, list) else [selection]
+    currents, alternatives = [], []
+    for s in selections:
+        for make_config in counterfactual_configs.values():
+            currents.append(s)
+            alternatives.append(make_config(dict(s)))
+    comparisons = iter(compare_systems(currents, alternatives))
+    results = [{name: next(comparisons) for name in counterfactual_configs} for _ in selections]
+    return results if isinstance(selection, list) else results[0]
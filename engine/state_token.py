@@ -0,0 +1,135 @@
+"""Compact, URL-safe tokens for app state and the shared result cache keyed by them.
+
+A state (the tab, postcode and system selections, or anything else made of
+JSON values) is put into a canonical form first: selections keep only the
+selection keys, numpy values become plain Python values, and dictionary keys
+are sorted. Two sessions with the same selections therefore get the same token,
+however they got there. The canonical JSON is compressed and base64url-encoded,
+so a token can be put in a link and decoded back to the state.
+
+Tokens plus the dataset version key `shared_results`, a process-wide cache of
+computed results. A result computed for one session (or prefetched for it) is
+served to every other session with the same state, including sessions opened
+from a shared link.
+"""
+import base64
+import binascii
+import json
+import zlib
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from data_processing.data_processing import dataset_version
+from engine.scenarios import SystemSelection, selection_columns
+from helpers.caching import SingleFlightCache
+
+# Bumped if the encoding changes, so old links are rejected rather than misread
+TOKEN_VERSION = "1"
+
+# Largest decoded state accepted, so a crafted link can't expand into a huge allocation
+MAX_STATE_BYTES = 64_000
+
+# Results keyed by (dataset version, token). Comparisons hold a few rows and
+# charts, so a few hundred of them take tens of MB.
+shared_results = SingleFlightCache("Shared results by state token", maxsize=512)
+
+
+class StateTokenError(ValueError):
+    """A token that can't be decoded, e.g. a truncated or edited link."""
+
+
+def _plain(value: Any) -> Any:
+    """JSON-compatible copy of a value, with numpy scalars and tuples converted."""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def selection_value(key: str, value: Any) -> Any:
+    """A selection value in canonical form: an int for location and occupants, otherwise a string.
+
+    Raises:
+        ValueError: If the value isn't of the key's type
+    """
+    if key in ("location", "household_occupants"):
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+    elif isinstance(value, str):
+        return value
+    raise ValueError(f"Invalid {key}: {value!r}")
+
+
+def canonical_selection(selection: SystemSelection) -> Dict[str, Any]:
+    """A selection with only the selection keys, unset keys dropped, in a fixed order.
+
+    Raises:
+        ValueError: If a value isn't of its key's type
+    """
+    canonical = {}
+    for key in selection_columns:
+        value = _plain(selection.get(key))
+        if value is None:
+            continue
+        canonical[key] = selection_value(key, value)
+    return canonical
+
+
+def canonical_selections(selections: List[SystemSelection]) -> List[Dict[str, Any]]:
+    return [canonical_selection(selection) for selection in selections]
+
+
+def encode_state(state: Dict[str, Any]) -> str:
+    """Token for a state of JSON-compatible values (numpy values are converted)."""
+    canonical = json.dumps(_plain(state), sort_keys=True, separators=(",", ":"))
+    compressed = zlib.compress(canonical.encode(), 9)
+    return TOKEN_VERSION + base64.urlsafe_b64encode(compressed).decode().rstrip("=")
+
+
+def decode_state(token: str) -> Dict[str, Any]:
+    """The state a token was made from.
+
+    Raises:
+        StateTokenError: If the token is malformed, from another token version or
+                         decodes to more than MAX_STATE_BYTES
+    """
+    if not token or token[:1] != TOKEN_VERSION:
+        raise StateTokenError("Unknown state token version")
+    body = token[1:]
+    try:
+        compressed = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+        decompressor = zlib.decompressobj()
+        canonical = decompressor.decompress(compressed, MAX_STATE_BYTES)
+    except (binascii.Error, zlib.error, ValueError) as e:
+        raise StateTokenError(f"Invalid state token: {e}") from e
+    if decompressor.unconsumed_tail:
+        raise StateTokenError("Invalid state token: state too large")
+    if not decompressor.eof:
+        raise StateTokenError("Invalid state token: truncated")
+    try:
+        state = json.loads(canonical)
+    except ValueError as e:
+        raise StateTokenError(f"Invalid state token: {e}") from e
+    if not isinstance(state, dict):
+        raise StateTokenError("Invalid state token: not a state")
+    return state
+
+
+def cached_result(token: str, compute: Callable[[], Any], part: Optional[Hashable] = None) -> Any:
+    """A result for a state, computed once per dataset version and shared by all sessions.
+
+    Args:
+        token: Token of the state the result depends on
+        compute: Computes the result on a miss. The result is shared, so it must
+                 not be modified afterwards.
+        part: Distinguishes different results for the same state
+    """
+    return shared_results.get_or_compute((dataset_version(), token, part), compute)
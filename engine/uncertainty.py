@@ -0,0 +1,237 @@
+"""Monte Carlo uncertainty ranges for cost and payback.
+
+The scenario data gives a single estimate per system. To show how far those
+estimates could move, the inputs that are least certain are sampled many times:
+
+- energy prices: one lognormal multiplier per sample for electricity and one for
+  gas, shared by every system (prices rise or fall for everyone at once)
+- hot water usage: one lognormal multiplier per sample, shared by every system
+  (the household uses the same hot water whichever system heats it)
+- capital cost: a normal multiplier per sample and system (installation quotes vary)
+- rebate eligibility: whether each system's rebate is received, per sample and system
+
+Annual energy cost, net present cost and payback are then evaluated for every
+(sample, system) pair at once as arrays of shape (samples, systems), and reduced
+to the 10th, 50th and 90th percentiles. The random draws use a fixed seed, so the
+same systems always get the same ranges, and results are cached by the input rows.
+"""
+import hashlib
+import warnings
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from engine.npv import DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS, annuity_factors
+from engine.payback import (
+    heat_pump_keys,
+    heat_pump_rebates,
+    payback_periods,
+    rep_postcode_to_state,
+)
+from engine.scenarios import heat_pump_types, key_columns, scenario_index
+from engine.what_if import gas_heaters
+from helpers.caching import SingleFlightCache
+
+N_SAMPLES = 5000
+SEED = 42
+
+# Spread of the sampled multipliers (standard deviation, as a fraction of the estimate)
+PRICE_SD = 0.15
+USAGE_SD = 0.10
+CAPITAL_COST_SD = 0.10
+# Capital cost multipliers are kept above this, so a wide spread can't make systems free
+MIN_CAPITAL_COST_FACTOR = 0.5
+# Chance that a household receives the rebate it is entitled to
+REBATE_PROBABILITY = 0.8
+
+PERCENTILES = [10, 50, 90]
+
+# Columns the simulations read, which make up the cache key
+simulated_columns = [
+    "Heater",
+    "Location",
+    "Up front cost ($)",
+    "Rebates ($)",
+    "disconnection_costs",
+    "Annual cost ($/yr)",
+    "Annual supply cost ($/yr)",
+    "oandm_cost",
+]
+
+# Percentile bands, keyed by (rows hash, what was simulated and its settings)
+uncertainty_cache = SingleFlightCache("Uncertainty bands", maxsize=1024)
+
+
+def _rows_hash(rows: pd.DataFrame) -> str:
+    hashes = pd.util.hash_pandas_object(rows[simulated_columns], index=False)
+    return hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()[:16]
+
+
+def _lognormal(rng: np.random.Generator, sd: float, size) -> np.ndarray:
+    """Multipliers with a median of 1 and roughly `sd` spread."""
+    return rng.lognormal(mean=0.0, sigma=sd, size=size)
+
+
+def sample_inputs(n_systems: int, n_samples: int = N_SAMPLES, seed: int = SEED) -> Dict[str, np.ndarray]:
+    """Random multipliers for one simulation.
+
+    Returns:
+        "electricity_price", "gas_price" and "usage" of shape (samples, 1), and
+        "capital_cost" and "rebate_received" of shape (samples, systems), so they
+        broadcast against per-system arrays.
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        "electricity_price": _lognormal(rng, PRICE_SD, (n_samples, 1)),
+        "gas_price": _lognormal(rng, PRICE_SD, (n_samples, 1)),
+        "usage": _lognormal(rng, USAGE_SD, (n_samples, 1)),
+        "capital_cost": np.maximum(
+            rng.normal(1.0, CAPITAL_COST_SD, (n_samples, n_systems)), MIN_CAPITAL_COST_FACTOR
+        ),
+        "rebate_received": rng.random((n_samples, n_systems)) < REBATE_PROBABILITY,
+    }
+
+
+def _energy_costs(rows: pd.DataFrame, draws: Dict[str, np.ndarray]) -> np.ndarray:
+    """Sampled annual energy costs, shape (samples, systems)."""
+    is_gas = rows["Heater"].isin(gas_heaters).to_numpy()
+    price = np.where(is_gas, draws["gas_price"], draws["electricity_price"])
+    return rows["Annual cost ($/yr)"].to_numpy(dtype=float) * price * draws["usage"]
+
+
+def simulate_costs(
+    rows: pd.DataFrame,
+    discount_rate: float = DATASET_DISCOUNT_RATE,
+    horizon: int = DATASET_HORIZON_YEARS,
+    n_samples: int = N_SAMPLES,
+) -> Dict[str, np.ndarray]:
+    """Sampled annual energy cost and net present cost of scenario rows.
+
+    Args:
+        rows: Scenario rows, one per system
+        discount_rate: Discount rate for the net present cost
+        horizon: Horizon in years for the net present cost
+        n_samples: Number of samples
+
+    Returns:
+        {"Annual cost ($/yr)": ..., "Net present cost ($)": ...}, each of shape
+        (samples, systems).
+    """
+    draws = sample_inputs(len(rows), n_samples)
+    annual_cost = _energy_costs(rows, draws)
+    upfront = (
+        rows["Up front cost ($)"].to_numpy(dtype=float) * draws["capital_cost"]
+        - rows["Rebates ($)"].fillna(0).to_numpy(dtype=float) * draws["rebate_received"]
+        + rows["disconnection_costs"].fillna(0).to_numpy(dtype=float)
+    )
+    running = (
+        annual_cost
+        + rows["Annual supply cost ($/yr)"].fillna(0).to_numpy(dtype=float)
+        + rows["oandm_cost"].fillna(0).to_numpy(dtype=float)
+    )
+    factor = annuity_factors(discount_rate, horizon)[0, 0]
+    return {"Annual cost ($/yr)": annual_cost, "Net present cost ($)": upfront + running * factor}
+
+
+def percentile_bands(samples: np.ndarray) -> np.ndarray:
+    """10th, 50th and 90th percentiles of each system, shape (3, systems).
+
+    Samples that are NaN (e.g. a payback that never happens) are left out; a system
+    with no valid samples gets NaN.
+    """
+    with warnings.catch_warnings():
+        # Columns with no valid samples warn about an all-NaN slice
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanpercentile(samples, PERCENTILES, axis=0)
+
+
+def cost_bands(
+    rows: pd.DataFrame,
+    discount_rate: float = DATASET_DISCOUNT_RATE,
+    horizon: int = DATASET_HORIZON_YEARS,
+) -> Dict[str, np.ndarray]:
+    """p10/p50/p90 of annual energy cost and net present cost for scenario rows.
+
+    Returns:
+        {"Annual cost ($/yr)": ..., "Net present cost ($)": ...}, each of shape
+        (3, systems) in the order of `rows`. Shared by every session.
+    """
+    key = ("costs", _rows_hash(rows), discount_rate, horizon, N_SAMPLES, SEED)
+    return uncertainty_cache.get_or_compute(
+        key,
+        lambda: {
+            metric: percentile_bands(samples)
+            for metric, samples in simulate_costs(rows, discount_rate, horizon).items()
+        },
+    )
+
+
+def simulate_payback(
+    current: pd.Series, option: str, discount_rate: float, n_samples: int = N_SAMPLES
+) -> Dict[str, np.ndarray]:
+    """Sampled heat pump payback periods for a current system (see calculate_payback).
+
+    Args:
+        current: The current system's scenario row
+        option: Answer to "Do you want to change to a heat pump?"
+        discount_rate: Discount rate used for the discounted payback period
+        n_samples: Number of samples
+
+    Returns:
+        {"Simple Payback (yrs)": ..., "Discounted Payback (yrs)": ..., "Saves money": ...},
+        each of shape (samples, heat pump types) with the columns in heat_pump_types()
+        order. Paybacks are NaN in samples where the heat pump doesn't save money,
+        and for heat pump types missing from the data.
+    """
+    current_keys = current[key_columns].to_frame().T
+    hp_keys = pd.concat([heat_pump_keys(current_keys, hp_type) for hp_type in heat_pump_types()])
+    hp_rows = scenario_index().reindex(pd.MultiIndex.from_frame(hp_keys)).reset_index()
+    found = hp_rows["Annual cost ($/yr)"].notna().to_numpy()
+
+    # Heat pumps are the first systems and the current system the last, so they get
+    # their own capital cost and rebate draws
+    systems = pd.concat([hp_rows[simulated_columns], current[simulated_columns].to_frame().T], ignore_index=True)
+    draws = sample_inputs(len(systems), n_samples)
+    energy_costs = _energy_costs(systems, draws)
+    capital_costs = systems["Up front cost ($)"].to_numpy(dtype=float) * draws["capital_cost"]
+
+    hp_capital = capital_costs[:, :-1]
+    state = np.array(rep_postcode_to_state.get(current["Location"]), dtype=object)
+    rebates = heat_pump_rebates(state, np.array(current["Heater"], dtype=object), hp_capital)
+    upfront_cost = hp_capital - rebates * draws["rebate_received"][:, :-1]
+
+    old_annual_cost = energy_costs[:, -1:] + float(current["Annual supply cost ($/yr)"])
+    annual_savings = old_annual_cost - energy_costs[:, :-1]
+    simple, discounted = payback_periods(upfront_cost, capital_costs[:, -1:], annual_savings, option, discount_rate)
+    return {
+        "Simple Payback (yrs)": np.where(found, simple, np.nan),
+        "Discounted Payback (yrs)": np.where(found, discounted, np.nan),
+        "Saves money": (annual_savings > 0) & found,
+    }
+
+
+def payback_bands(current: pd.Series, option: str, discount_rate: float) -> pd.DataFrame:
+    """p10/p50/p90 heat pump payback periods for a current system.
+
+    Returns:
+        DataFrame indexed by heat pump type with "<payback> p10", "<payback> p50" and
+        "<payback> p90" columns for the simple and discounted payback, and "Chance of
+        saving money" (the share of samples in which the heat pump saves money).
+        Shared by every session.
+    """
+    current = current[simulated_columns + [c for c in key_columns if c not in simulated_columns]]
+    hp_types = tuple(heat_pump_types())
+    key = ("payback", _rows_hash(current.to_frame().T), tuple(current[key_columns]), hp_types, option, discount_rate, N_SAMPLES, SEED)
+
+    def compute() -> pd.DataFrame:
+        samples = simulate_payback(current, option, discount_rate)
+        bands = pd.DataFrame(index=pd.Index(hp_types, name="Heat Pump Type"))
+        for payback in ["Simple Payback (yrs)", "Discounted Payback (yrs)"]:
+            values = percentile_bands(samples[payback])
+            for percentile, row in zip(PERCENTILES, values):
+                bands[f"{payback} p{percentile}"] = row
+        bands["Chance of saving money"] = samples["Saves money"].mean(axis=0)
+        return bands
+
+    return uncertainty_cache.get_or_compute(key, compute)
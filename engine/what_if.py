@@ -0,0 +1,121 @@
+"""What-if overrides for energy prices and grid emissions.
+
+Prices and grid emissions change faster than the simulations can be rerun, so
+users can scale them instead. Each override is a multiplier on the simulated
+values (1.0 leaves them unchanged):
+
+- tariffs: energy price by hot water billing type, scaling "Annual cost ($/yr)"
+- feed_in: solar feed-in tariff, scaling "Decrease in solar export revenue ($/yr)"
+  (the solar export a system uses up, shown in the spending charts but not part
+  of net present cost)
+- grid_emissions: grid emissions intensity by state, scaling the emissions of
+  systems that use grid electricity (gas systems' emissions are left as they are)
+
+Price changes scale each scenario's simulated energy cost rather than pricing
+its consumption at a new rate: the simulated cost already reflects when the
+energy is used (time of use, solar), so there is no single rate per kWh to
+replace. The UI says so next to the sliders.
+
+Net present cost is recomputed from the new annual cost. Overridden datasets are
+cached by a hash of the overrides, so switching back to a scenario that has been
+used before is a dictionary lookup.
+"""
+import hashlib
+import json
+from typing import Dict, Optional, TypedDict
+
+import numpy as np
+import pandas as pd
+
+from data_processing.data_processing import dataset_version, load_all_rows, load_and_preprocess_data, with_virtual_rows
+from engine.npv import DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS, npc_sensitivity
+from engine.payback import rep_postcode_to_state
+from helpers.caching import SingleFlightCache
+
+tariff_types = [
+    "Flat rate electricity",
+    "Time varying rate electricity",
+    "Controlled load discount electricity",
+    "Flat rate gas",
+]
+
+states = sorted(set(rep_postcode_to_state.values()))
+
+gas_heaters = ["Gas Instant", "Gas Storage"]
+
+# Overridden datasets, keyed by (dataset version, overrides hash) or, with the virtual
+# rows, (dataset version, overrides hash, "virtual rows"). Each is the size of the
+# scenario data, so only a few are kept.
+what_if_cache = SingleFlightCache("What-if datasets", maxsize=16)
+
+
+class Overrides(TypedDict):
+    """Multipliers applied to the simulated prices and emissions."""
+
+    tariffs: Dict[str, float]
+    feed_in: float
+    grid_emissions: Dict[str, float]
+
+
+def default_overrides() -> Overrides:
+    """Overrides that leave the data unchanged."""
+    return {
+        "tariffs": {tariff: 1.0 for tariff in tariff_types},
+        "feed_in": 1.0,
+        "grid_emissions": {state: 1.0 for state in states},
+    }
+
+
+def is_default(overrides: Optional[Overrides]) -> bool:
+    return overrides is None or overrides == default_overrides()
+
+
+def overrides_hash(overrides: Overrides) -> str:
+    """Stable hash of a set of overrides, the same whatever order they were given in."""
+    canonical = json.dumps(overrides, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def apply_overrides(data: pd.DataFrame, overrides: Overrides) -> pd.DataFrame:
+    """Scenario data with prices and emissions scaled by the overrides, on whole columns.
+
+    Tariffs and states missing from the overrides are left unchanged.
+    """
+    data = data.copy()
+
+    tariff_scale = data["Hot water billing type"].map(overrides["tariffs"]).fillna(1.0).to_numpy()
+    data["Annual cost ($/yr)"] = data["Annual cost ($/yr)"].to_numpy() * tariff_scale
+
+    data["Decrease in solar export revenue ($/yr)"] = (
+        data["Decrease in solar export revenue ($/yr)"].to_numpy() * overrides.get("feed_in", 1.0)
+    )
+
+    grid_scale = data["Location"].map(rep_postcode_to_state).map(overrides["grid_emissions"]).fillna(1.0).to_numpy()
+    uses_grid = ~data["Heater"].isin(gas_heaters).to_numpy()
+    data["CO2 emissions (tons/yr)"] = data["CO2 emissions (tons/yr)"].to_numpy() * np.where(uses_grid, grid_scale, 1.0)
+
+    data["Net present cost ($)"] = npc_sensitivity(data, DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS)[:, 0, 0]
+    return data
+
+
+def what_if_data(overrides: Optional[Overrides] = None) -> pd.DataFrame:
+    """The scenario data with overrides applied, shared by every session using the same overrides.
+
+    Returns the preprocessed data itself when there are no overrides.
+    """
+    data, _ = load_and_preprocess_data()
+    if is_default(overrides):
+        return data
+    key = (dataset_version(), overrides_hash(overrides))
+    return what_if_cache.get_or_compute(key, lambda: apply_overrides(data, overrides))
+
+
+def what_if_rows(overrides: Optional[Overrides] = None) -> pd.DataFrame:
+    """what_if_data with the virtual Solar "Yes" gas rows (see with_virtual_rows), shared the same way.
+
+    For views that list or filter systems. Returns load_all_rows() when there are no overrides.
+    """
+    if is_default(overrides):
+        return load_all_rows()
+    key = (dataset_version(), overrides_hash(overrides), "virtual rows")
+    return what_if_cache.get_or_compute(key, lambda: with_virtual_rows(what_if_data(overrides)))
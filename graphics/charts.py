@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 def apply_chart_formatting(chart, show_legend=True, yaxes_title=None, height=None):
@@ -42,3 +43,35 @@ def apply_chart_formatting(chart, show_legend=True, yaxes_title=None, height=Non
             outsidetextfont=dict(color="black"),
             insidetextfont=dict(color="white"),
         )
+
+
+def add_uncertainty_bands(chart, trace_name, bands):
+    """Draw p10-p90 ranges as error bars on a bar trace, with the p10/p50/p90 values on hover.
+
+    Args:
+        chart: Plotly figure, already formatted with apply_chart_formatting
+        trace_name: Name of the bar trace (the column plotted)
+        bands: Array-like of shape (3, bars) holding p10, p50 and p90, in the trace's bar order
+    """
+    p10, p50, p90 = (np.asarray(band, dtype=float) for band in bands)
+    for trace in chart.data:
+        if trace.type != "bar" or trace.name != trace_name:
+            continue
+        y = np.asarray(trace.y, dtype=float)
+        trace.update(
+            error_y=dict(
+                type="data", symmetric=False,
+                array=np.nan_to_num(np.maximum(p90 - y, 0)),
+                arrayminus=np.nan_to_num(np.maximum(y - p10, 0)),
+                color="#555555", thickness=1.5, width=6,
+            ),
+            customdata=np.column_stack([p10, p50, p90]),
+            hovertemplate=f"{trace_name}: %{{y:,.1f}}<br>"
+                          "p10: %{customdata[0]:,.1f}<br>p50: %{customdata[1]:,.1f}<br>"
+                          "p90: %{customdata[2]:,.1f}<extra></extra>",
+        )
+
+    # Make room for the top of the ranges, which may be above the tallest bar
+    if np.isfinite(p90).any():
+        y_max = max(chart.layout.yaxis.range[1] if chart.layout.yaxis.range else 0, np.nanmax(p90) * 1.15)
+        chart.update_yaxes(range=[0, y_max])
@@ -0,0 +1,169 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# Every cache created in this process, so they can be listed in the memory report
+_all_caches: List["SingleFlightCache"] = []
+
+# Stands for a missing entry, as None can be a cached value
+_MISSING = object()
+
+
+class _Flight:
+    """A computation in progress that other threads can wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlightCache:
+    """A process-wide LRU cache shared by every session, with single-flight misses.
+
+    When several threads miss on the same key at the same time, only the first
+    computes the value and the others wait for its result, so a burst of identical
+    requests (e.g. the first page loads after a deploy) costs one computation
+    instead of one per session. Hits are served without taking the lock: their
+    recency and hit count are updated without it, so both are approximate. Misses
+    take a short lock.
+
+    clear() starts a new generation: computations already running when it is called
+    still return their value to the threads waiting on them, but don't store it.
+
+    Cached values are shared between all sessions and threads and must be treated
+    as read-only. DataFrames should be copied (or derived with a new operation, as
+    filtering does) before being modified.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: Optional[int] = None,
+        maxbytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Hashable, Any], int]] = None,
+    ) -> None:
+        """
+        Args:
+            name: Name shown in the memory report
+            maxsize: Maximum number of entries. When full, the least recently used
+                     entry is evicted. None means unbounded.
+            maxbytes: Maximum total size of the entries, as measured by `sizeof`.
+                      Least recently used entries are evicted to stay under it, and
+                      an entry bigger than it on its own isn't stored.
+            sizeof: Bytes held by an entry, given its key and value (required with maxbytes)
+        """
+        if maxbytes is not None and sizeof is None:
+            raise ValueError("maxbytes needs a sizeof function")
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._values: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self.nbytes = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _all_caches.append(self)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, computing it once if it is missing."""
+        values = self._values
+        value = values.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            try:
+                values.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread since; it was still a hit
+                pass
+            return value
+
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return self._values[key]
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            generation = self._generation
+
+        if not is_leader:
+            return flight.wait()
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            # Waiting threads get the same error; the next call retries
+            flight.error = e
+            with self._lock:
+                self._end_flight(key, flight)
+            flight.done.set()
+            raise
+
+        with self._lock:
+            self._end_flight(key, flight)
+            # Values computed before a clear() may be stale, so only the current generation is stored
+            if generation == self._generation:
+                self._store(key, flight.value)
+        flight.done.set()
+        return flight.value
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        if self.maxbytes is not None:
+            size = self._sizeof(key, value)
+            if size > self.maxbytes:
+                return
+            self._sizes[key] = size
+            self.nbytes += size
+        self._values[key] = value
+        while (self.maxsize is not None and len(self._values) > self.maxsize) or (
+            self.maxbytes is not None and self.nbytes > self.maxbytes
+        ):
+            evicted, _ = self._values.popitem(last=False)
+            self.nbytes -= self._sizes.pop(evicted, 0)
+
+    def _end_flight(self, key: Hashable, flight: _Flight) -> None:
+        # A clear() may have let a newer flight for the key start; leave that one in place
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._values.values())
+
+    def clear(self) -> None:
+        """Drop every entry, and stop computations already running from storing theirs."""
+        with self._lock:
+            self._values = OrderedDict()
+            self._sizes = {}
+            self.nbytes = 0
+            self._flights = {}
+            self._generation += 1
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+def all_caches() -> List[SingleFlightCache]:
+    """Every SingleFlightCache created in this process."""
+    return list(_all_caches)
+
+
+def remove_cache(cache: SingleFlightCache) -> None:
+    """Clear a cache and stop listing it in the memory report, e.g. when its data is unloaded."""
+    cache.clear()
+    if cache in _all_caches:
+        _all_caches.remove(cache)
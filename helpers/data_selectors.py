@@ -4,6 +4,64 @@ from typing import Dict, List, Optional, Union
 import pandas as pd
 import numpy as np
 
+from engine.npv import DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS
+from engine.scenarios import option_tree, selection_columns
+from engine.what_if import Overrides, default_overrides, states, tariff_types
+
+
+def select_with_state(
+    group: str,
+    options: list,
+    key_version: str,
+    prefill_values: Dict[str, Optional[str]],
+    label_visibility: str = "visible",
+    help_text: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Create a select box for a filter group that keeps its value across reruns.
+
+    The selection is kept in session state under "SELECT_<GROUP>_<KEY_VERSION>",
+    so it survives the widget being hidden, and is dropped if it is no longer one
+    of the options.
+    """
+    # Create consistent key for session state
+    group_key = group.lower().replace(" ", "_")
+    key = f"select_{group_key}_{key_version}"
+    KEY = key.upper()
+
+    # Preload from prefill_values
+    default_value = prefill_values.get(group_key)
+    if default_value and default_value in options:
+        st.session_state[KEY] = default_value
+
+    # Remove invalid value (e.g. a heater the session's dataset doesn't have)
+    if KEY in st.session_state and st.session_state[KEY] not in options:
+        st.session_state.pop(KEY)
+    if key in st.session_state and st.session_state[key] not in options:
+        st.session_state.pop(key)
+
+    if KEY not in st.session_state:
+        st.selectbox(group, options, key=key, label_visibility=label_visibility, help=help_text)
+    else:
+        selected_value = st.session_state[KEY]
+        if selected_value in options:
+            index = options.index(selected_value)
+        else:
+            index = 0
+        st.selectbox(group, options, index=index, key=key, label_visibility=label_visibility, help=help_text)
+
+    # Final value from session
+    selected = st.session_state[key]
+    if selected == "---":
+        st.session_state[KEY] = None
+    else:
+        st.session_state[KEY] = selected
+
+    if isinstance(selected, np.generic):
+        selected = selected.item()
+
+    return selected
+
 
 def filter_data(data: pd.DataFrame, group: str, value: str) -> pd.DataFrame:
     if value is not None:
@@ -78,42 +136,7 @@ def build_interactive_data_filter(
 
         # Get unique values for dropdown options
         options = list(data[group].unique())
-
-        # Create consistent key for session state
-        group_key = group.lower().replace(" ", "_")
-        key = f"select_{group_key}_{key_version}"
-        KEY = key.upper()
-
-        # Preload from prefill_values
-        default_value = prefill_values.get(group_key)
-        if default_value and default_value in options:
-            st.session_state[KEY] = default_value
-
-        # Remove invalid value
-        if KEY in st.session_state and st.session_state[KEY] not in options:
-            st.session_state.pop(KEY)
-
-        if KEY not in st.session_state:
-            st.selectbox(group, options, key=key, label_visibility=label_visibility, help=help_text)
-        else:
-            selected_value = st.session_state[KEY]
-            if selected_value in options:
-                index = options.index(selected_value)
-            else:
-                index = 0
-            st.selectbox(group, options, index=index, key=key, label_visibility=label_visibility, help=help_text)
-
-        # Final value from session
-        selected = st.session_state[key]
-        if selected == "---":
-            st.session_state[KEY] = None
-        else:
-            st.session_state[KEY] = selected
-
-        if isinstance(selected, np.generic):
-            selected = selected.item()
-
-        return selected
+        return select_with_state(group, options, key_version, prefill_values, label_visibility, help_text)
 
     # Store selected values
     values = {}
@@ -181,6 +204,47 @@ def build_interactive_data_filter(
     return data, values
 
 
+def build_system_selector(
+    key_version: str, location: Optional[int] = None, prefill_values: Optional[Dict[str, Optional[str]]] = None
+) -> Dict[str, Optional[str]]:
+    """
+    Cascading selectors for one system, like build_interactive_data_filter but
+    without filtering the data.
+
+    Each selector's options come from the precomputed option tree, so a selector
+    costs a few dictionary lookups however large the data is. The system's rows
+    are looked up afterwards (see engine.scenarios.lookup_systems), which lets
+    several systems be looked up in one batch.
+
+    Args:
+        key_version: String identifier for the session state keys, as in
+                     build_interactive_data_filter (the keys are the same)
+        location: Representative postcode, or None for every location
+        prefill_values: Optional selections to start from
+
+    Returns:
+        Dictionary of selected values for each filter, including "location".
+    """
+    if prefill_values is None:
+        prefill_values = {}
+    tree = option_tree()
+    values = {}
+    prefix = (location,)
+    for key, group in selection_columns.items():
+        if key == "location":
+            continue
+        values[key] = select_with_state(group, tree.get(prefix, []), key_version, prefill_values)
+        prefix += (values[key],)
+    values["location"] = location
+    return values
+
+
+# Systems the Compare tab can compare, and the session state key versions of their
+# selectors. The Begin tab's compare buttons export to the first two.
+MAX_COMPARE_SYSTEMS = 8
+compare_key_versions = ["two", "three"] + [f"compare_{i}" for i in range(3, MAX_COMPARE_SYSTEMS + 1)]
+
+
 def export_settings_to_compare_tab(
     values_to_export: Dict[str, Optional[str]], version: str
 ) -> None:
@@ -211,3 +275,107 @@ def get_rep_postcode_from_postcode(user_postcode: int, postcode_df: pd.DataFrame
         return row.iloc[0]["rep_postcode"]
     else:
         return None
+
+
+def build_npv_settings(key_version: str) -> tuple[float, int]:
+    """
+    Sliders for the discount rate and horizon used for net present cost.
+
+    The defaults are the dataset's own rate and horizon, so the net present cost
+    shown is the dataset's until a slider is moved.
+
+    Args:
+        key_version: String identifier for the session state keys to differentiate
+                     between multiple instances of this component
+
+    Returns:
+        tuple containing the discount rate (as a fraction) and the horizon in years
+    """
+    rate_percent = st.slider(
+        "Discount rate (%)",
+        min_value=0.0,
+        max_value=12.0,
+        value=DATASET_DISCOUNT_RATE * 100,
+        step=0.5,
+        key=f"slider_discount_rate_{key_version}",
+        help="Rate used to discount future running costs in the net present cost.",
+    )
+    horizon = st.slider(
+        "Years",
+        min_value=1,
+        max_value=25,
+        value=DATASET_HORIZON_YEARS,
+        key=f"slider_horizon_{key_version}",
+        help="Number of years of running costs included in the net present cost.",
+    )
+    return round(rate_percent / 100, 4), horizon
+
+
+def npv_settings(key_version: str) -> tuple[float, int]:
+    """The rate and horizon build_npv_settings would return, read from session state without drawing the sliders."""
+    rate_percent = st.session_state.get(f"slider_discount_rate_{key_version}", DATASET_DISCOUNT_RATE * 100)
+    horizon = st.session_state.get(f"slider_horizon_{key_version}", DATASET_HORIZON_YEARS)
+    return round(rate_percent / 100, 4), horizon
+
+
+def build_what_if_overrides(key_version: str) -> Overrides:
+    """
+    Sliders for what-if changes to energy prices and grid emissions.
+
+    The overrides are kept in st.session_state["what_if_overrides"] (shared by
+    every tab that shows these sliders) and updated by the sliders' callbacks, so
+    tabs can read them at the top of the script, before the sliders are drawn.
+
+    Args:
+        key_version: String identifier for the session state keys to differentiate
+                     between multiple instances of this component
+
+    Returns:
+        The current overrides (see engine.what_if)
+    """
+    overrides = st.session_state.get("what_if_overrides") or default_overrides()
+
+    def slider_key(name: str) -> str:
+        return f"slider_what_if_{name}_{key_version}"
+
+    def save() -> None:
+        st.session_state["what_if_overrides"] = {
+            "tariffs": {tariff: 1 + st.session_state[slider_key(tariff)] / 100 for tariff in tariff_types},
+            "feed_in": 1 + st.session_state[slider_key("feed_in")] / 100,
+            "grid_emissions": {state: 1 + st.session_state[slider_key(state)] / 100 for state in states},
+        }
+
+    def reset() -> None:
+        st.session_state["what_if_overrides"] = default_overrides()
+        for key in list(st.session_state.keys()):
+            if key.startswith("slider_what_if_"):
+                del st.session_state[key]
+
+    def percent_slider(label: str, name: str, value: float) -> None:
+        st.slider(
+            label, min_value=-50, max_value=100, value=int(round((value - 1) * 100)), step=5,
+            format="%d%%", key=slider_key(name), on_change=save,
+        )
+
+    st.markdown(
+        "**Energy price change**",
+        help="Scales each system's simulated annual energy cost on the tariff by this much. "
+        "Costs aren't recalculated from energy use at a new price, as the simulated costs "
+        "already reflect when the energy is used.",
+    )
+    for tariff in tariff_types:
+        percent_slider(tariff, tariff, overrides["tariffs"][tariff])
+
+    st.markdown(
+        "**Solar feed-in tariff change**",
+        help="Scales the solar export revenue each system gives up (the \"Decrease in solar export "
+        "revenue\" bar of the spending chart). It isn't part of net present cost.",
+    )
+    percent_slider("Solar feed-in tariff", "feed_in", overrides.get("feed_in", 1.0))
+
+    st.markdown("**Grid emissions change**", help="Changes the emissions of systems that use grid electricity.")
+    for state in states:
+        percent_slider(state, state, overrides["grid_emissions"][state])
+
+    st.button("Reset prices and emissions", key=f"button_what_if_reset_{key_version}", on_click=reset)
+    return overrides
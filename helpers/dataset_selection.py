@@ -0,0 +1,30 @@
+"""The scenario dataset each session uses.
+
+A session uses the default dataset (see data_processing.datasets) unless it is
+opened with ?dataset=<name>, e.g. to try a new scenario run, or from a shared
+link made in a session using another dataset. The choice is kept in the session
+and made the active dataset at the start of every script run, including panels
+rerunning on their own, as each run gets a fresh context.
+"""
+import streamlit as st
+
+from data_processing.datasets import DEFAULT_DATASET, datasets, use_dataset
+
+QUERY_PARAM = "dataset"
+SESSION_KEY = "dataset"
+
+
+def session_dataset() -> str:
+    """The session's dataset, taken from the URL on the session's first run."""
+    if SESSION_KEY not in st.session_state:
+        name = st.query_params.get(QUERY_PARAM)
+        if name is not None and name not in datasets:
+            print(f"Ignoring unknown dataset in URL: {name}")
+            name = None
+        st.session_state[SESSION_KEY] = name or DEFAULT_DATASET
+    return st.session_state[SESSION_KEY]
+
+
+def apply_session_dataset() -> None:
+    """Make the session's dataset the active one for this run. Call before any data is loaded."""
+    use_dataset(session_dataset())
@@ -0,0 +1,85 @@
+"""Panels that rerun on their own, and how much work that skips.
+
+A widget inside a Streamlit fragment reruns only that fragment, not the whole
+script (tab bar, styling, data load and every other panel). Panels are wrapped
+with `panel_fragment`, which times each run. When a panel reruns on its own, it
+shows how long it took against the last full page run, i.e. the work skipped.
+
+Fragments are rerun with the arguments of the last full run (or of the enclosing
+fragment's last run), so anything a panel's widgets change must be read inside
+the panel.
+"""
+import functools
+import time
+from typing import Callable
+
+import streamlit as st
+
+from helpers.dataset_selection import apply_session_dataset
+
+
+def start_app_run() -> None:
+    """Mark the start of a full script run. Call at the top of app.py."""
+    st.session_state["app_runs"] = st.session_state.get("app_runs", 0) + 1
+    st.session_state["_app_run_started"] = time.perf_counter()
+
+
+def finish_app_run() -> None:
+    """Record how long the full script run took. Call at the end of app.py."""
+    started = st.session_state.pop("_app_run_started", None)
+    if started is not None:
+        st.session_state["last_app_run_seconds"] = time.perf_counter() - started
+
+
+def show_skipped_work(name: str, seconds: float) -> None:
+    """Caption saying that only `name` was rerun, and the page work that was skipped."""
+    full_run = st.session_state.get("last_app_run_seconds")
+    if full_run is None:
+        return
+    skipped = max(full_run - seconds, 0.0)
+    st.session_state["skipped_seconds"] = st.session_state.get("skipped_seconds", 0.0) + skipped
+    st.caption(
+        f"Only the {name} was updated ({seconds * 1000:.0f} ms), skipping about "
+        f"{skipped * 1000:.0f} ms of page work ({st.session_state['skipped_seconds']:.1f} s skipped this session)."
+    )
+
+
+def panel_fragment(name: str) -> Callable[[Callable], Callable]:
+    """Decorator making a panel a fragment that reports the work its reruns skip.
+
+    Args:
+        name: Name of the panel in the caption, e.g. "payback section"
+
+    Example:
+        @panel_fragment("chart column")
+        def render_charts(selections):
+            ...
+    """
+
+    def decorator(func: Callable) -> Callable:
+        last_run_key = f"_fragment_app_run_{func.__module__}.{func.__qualname__}"
+
+        @st.fragment
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # A panel that already ran during this full run is now rerunning on its own.
+            # Panels nested in another rerunning panel leave the caption to the outer one.
+            rerun_alone = st.session_state.get(last_run_key) == st.session_state.get("app_runs")
+            is_outermost = not st.session_state.get("_panel_running", False)
+            st.session_state[last_run_key] = st.session_state.get("app_runs")
+
+            # Runs of the panel alone don't go through app.py, which sets the dataset
+            apply_session_dataset()
+            st.session_state["_panel_running"] = True
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                st.session_state["_panel_running"] = not is_outermost
+            if rerun_alone and is_outermost:
+                show_skipped_work(name, time.perf_counter() - started)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,274 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from helpers.caching import all_caches
+
+# Query parameter value that turns on the memory debug panel, i.e. ?debug=memory
+DEBUG_QUERY_VALUE = "memory"
+
+# Environment variable that allows the panel on this server (set to 1). Without it
+# ?debug=memory is ignored, so visitors can't slow the process down or see other
+# sessions' sizes.
+MEMORY_DEBUG_ENV = "SOLARSHIFT_MEMORY_DEBUG"
+
+# Number of reruns kept in each session's peak allocation history
+RERUN_HISTORY_LENGTH = 20
+
+# Named objects (datasets, derived indexes, caches) included in the memory report.
+# Each entry maps a display name to a function returning the object to measure, so
+# objects are only looked up when a report is built.
+_tracked_objects: Dict[str, Callable[[], Any]] = {}
+
+# Sessions showing the debug panel. tracemalloc runs while any of them is live.
+_debug_sessions: Set[str] = set()
+_debug_sessions_lock = threading.Lock()
+
+
+def track_memory(name: str, getter: Callable[[], Any]) -> None:
+    """Register a shared object to be included in the memory report.
+
+    Args:
+        name: Display name used in the report, e.g. "Scenario dataset"
+        getter: Function returning the object to measure. It is called each time
+                a report is built, so it should be cheap (e.g. a cache hit).
+    """
+    _tracked_objects[name] = getter
+
+
+def deep_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """Estimate the number of bytes held by an object and everything it references.
+
+    DataFrames and Series are measured with ``memory_usage(deep=True)`` so that the
+    Python strings inside object columns are counted. Containers are walked
+    recursively and objects referenced more than once are only counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, _seen) + deep_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_size(item, _seen)
+    return size
+
+
+def _session_id() -> Optional[str]:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def _active_session_ids() -> Optional[Set[str]]:
+    """Ids of the live sessions on this server, or None if they can't be listed."""
+    try:
+        from streamlit.runtime import Runtime
+
+        return {info.session.id for info in Runtime.instance()._session_mgr.list_active_sessions()}
+    except Exception:
+        return None
+
+
+def start_rerun_tracking() -> None:
+    """Start measuring allocations for the current script rerun.
+
+    tracemalloc is only switched on once the debug panel has been requested, since
+    tracing every allocation slows the whole process down, and is switched off
+    again by stop_unused_tracking once no session shows the panel.
+    """
+    with _debug_sessions_lock:
+        session_id = _session_id()
+        if session_id is not None:
+            _debug_sessions.add(session_id)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    tracemalloc.reset_peak()
+    current, _ = tracemalloc.get_traced_memory()
+    st.session_state["_memory_rerun_start"] = (time.time(), current)
+
+
+def finish_rerun_tracking() -> None:
+    """Record the peak allocation of the current rerun in session state.
+
+    Note:
+        tracemalloc is process wide, so when several sessions rerun at the same time
+        their allocations are included in each other's peaks.
+    """
+    start = st.session_state.pop("_memory_rerun_start", None)
+    if start is None or not tracemalloc.is_tracing():
+        return
+    started_at, start_bytes = start
+    current, peak = tracemalloc.get_traced_memory()
+
+    history = st.session_state.setdefault("memory_rerun_history", [])
+    history.append({
+        "Rerun started": time.strftime("%H:%M:%S", time.localtime(started_at)),
+        "Tab": st.session_state.get("tab"),
+        "Peak allocation (MB)": (peak - start_bytes) / 1e6,
+        "Retained after rerun (MB)": (current - start_bytes) / 1e6,
+        "Duration (s)": time.time() - started_at,
+    })
+    del history[:-RERUN_HISTORY_LENGTH]
+
+
+def stop_unused_tracking() -> None:
+    """Switch tracemalloc off if no live session shows the debug panel any more.
+
+    Called on every rerun without the panel. Sessions don't report closing, so
+    tracing stops on the first rerun of any session after the last debug session
+    closes or drops ?debug=memory.
+    """
+    if not tracemalloc.is_tracing():
+        return
+    with _debug_sessions_lock:
+        _debug_sessions.discard(_session_id())
+        active = _active_session_ids()
+        if active is not None:
+            _debug_sessions.intersection_update(active)
+        if not _debug_sessions:
+            tracemalloc.stop()
+
+
+def _streamlit_cache_sizes() -> List[Dict[str, Any]]:
+    """Bytes held by st.cache_data / st.cache_resource, as reported by Streamlit."""
+    try:
+        from streamlit.runtime import Runtime
+
+        stats = Runtime.instance().stats_mgr.get_stats()
+    except Exception:
+        return []
+
+    totals: Dict[tuple, int] = {}
+    for stat in stats:
+        key = (stat.category_name, stat.cache_name)
+        totals[key] = totals.get(key, 0) + stat.byte_length
+    return [
+        {"Object": f"{category}: {name}", "Size (MB)": size / 1e6}
+        for (category, name), size in totals.items()
+    ]
+
+
+def _session_sizes() -> List[Dict[str, Any]]:
+    """Bytes held in session state by every live session on this server."""
+    try:
+        from streamlit.runtime import Runtime
+
+        session_infos = Runtime.instance()._session_mgr.list_active_sessions()
+    except Exception:
+        return []
+
+    rows = []
+    for info in session_infos:
+        state = info.session.session_state.filtered_state
+        rows.append({
+            "Session": info.session.id[:8],
+            "Keys": len(state),
+            "Size (MB)": deep_size(state) / 1e6,
+        })
+    return rows
+
+
+def build_memory_report() -> Dict[str, Any]:
+    """Collect the memory accounting for this server process.
+
+    Returns:
+        Dictionary with:
+            - "objects": size of each tracked dataset and index
+            - "caches": entries, hit counts and size of each shared result cache
+            - "streamlit_caches": size of the pickled st.cache_data entries
+            - "sessions": size of each live session's state
+            - "traced": current and peak bytes traced by tracemalloc (if tracing)
+    """
+    # Objects are only counted the first time they are seen, so a cache entry that
+    # is also a tracked object (e.g. the dataset) is not counted twice.
+    seen: set = set()
+    objects = []
+    for name, getter in _tracked_objects.items():
+        try:
+            size = deep_size(getter(), seen)
+        except Exception as e:
+            print(f"Memory report could not measure {name}: {e}")
+            continue
+        objects.append({"Object": name, "Size (MB)": size / 1e6})
+
+    caches = [
+        {
+            "Cache": cache.name,
+            "Entries": len(cache),
+            "Hits": cache.hits,
+            "Misses": cache.misses,
+            "Size (MB)": deep_size(cache.values(), seen) / 1e6,
+        }
+        for cache in all_caches()
+    ]
+
+    traced = None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        traced = {"current_mb": current / 1e6, "peak_mb": peak / 1e6}
+
+    return {
+        "objects": objects,
+        "caches": caches,
+        "streamlit_caches": _streamlit_cache_sizes(),
+        "sessions": _session_sizes(),
+        "traced": traced,
+    }
+
+
+def memory_debug_enabled() -> bool:
+    """True if the page was opened with ?debug=memory on a server that allows it (see MEMORY_DEBUG_ENV)."""
+    if os.environ.get(MEMORY_DEBUG_ENV) != "1":
+        return False
+    return st.query_params.get("debug") == DEBUG_QUERY_VALUE
+
+
+def render_memory_report() -> None:
+    """Render the memory debug panel at the bottom of the page."""
+    report = build_memory_report()
+
+    with st.expander("Memory report", expanded=True):
+        st.markdown("#### Shared datasets and indexes")
+        st.dataframe(pd.DataFrame(report["objects"]), hide_index=True)
+
+        st.markdown("#### Shared caches (not counting objects listed above)")
+        st.dataframe(pd.DataFrame(report["caches"]), hide_index=True)
+
+        st.markdown("#### Streamlit caches (pickled copies)")
+        st.dataframe(pd.DataFrame(report["streamlit_caches"]), hide_index=True)
+
+        st.markdown("#### Live sessions")
+        st.dataframe(pd.DataFrame(report["sessions"]), hide_index=True)
+
+        st.markdown("#### Peak allocation per rerun (this session)")
+        st.dataframe(
+            pd.DataFrame(st.session_state.get("memory_rerun_history", [])),
+            hide_index=True,
+        )
+
+        if report["traced"]:
+            st.markdown(
+                f"Traced by tracemalloc: {report['traced']['current_mb']:.1f} MB "
+                f"current, {report['traced']['peak_mb']:.1f} MB peak."
+            )
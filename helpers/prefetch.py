@@ -0,0 +1,63 @@
+"""Results computed in the background before a session asks for them.
+
+A session queues the results it is likely to need next (e.g. the Begin tab
+queues what each compare button would show), and they are computed on a shared
+thread pool while the user reads the page. The futures are kept in the
+session, so a later rerun can pick up a finished result instead of computing it;
+a result that isn't ready yet is computed by the rerun rather than waited for.
+
+Jobs run outside the script thread, so they must not call Streamlit. They run
+in a copy of the session's context, so they use the session's dataset (see
+data_processing.datasets).
+"""
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import streamlit as st
+
+# Shared by every session. Kept small so background work doesn't starve the
+# threads serving reruns.
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+
+SESSION_KEY = "prefetched_results"
+
+
+def prefetch(jobs: Dict[Hashable, Callable[[], Any]]) -> None:
+    """Start computing each job in the background, unless it has been started already.
+
+    Earlier jobs that aren't in `jobs` are cancelled (if they haven't started) and
+    dropped, so a session only keeps the results for its latest selections.
+    """
+    started: Dict[Hashable, Future] = st.session_state.get(SESSION_KEY, {})
+    for key, future in started.items():
+        if key not in jobs:
+            future.cancel()
+    st.session_state[SESSION_KEY] = {
+        key: started[key]
+        if key in started and not started[key].cancelled()
+        else executor.submit(contextvars.copy_context().run, job)
+        for key, job in jobs.items()
+    }
+
+
+def prefetched(key: Hashable) -> Optional[Any]:
+    """The result of a prefetched job, if it has finished.
+
+    Returns None if the job wasn't prefetched, failed or is still running, and the
+    caller should compute the result itself. A job that hasn't started yet is
+    cancelled, as it is no longer needed; the rerun never waits on the pool.
+    """
+    future = st.session_state.get(SESSION_KEY, {}).get(key)
+    if future is None:
+        return None
+    if not future.done():
+        future.cancel()
+        return None
+    if future.cancelled():
+        return None
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Prefetch failed, computing instead: {e}")
+        return None
@@ -0,0 +1,123 @@
+"""The app's selections kept in the URL, so a link reopens the same view.
+
+The tab, postcode, the Begin and Compare tabs' selections and the dataset (when
+it isn't the default) are encoded into a single state token (see engine.state_token) in the `s` query parameter. A
+session opened with a token starts from its state, through the same session
+state keys the selectors and the Begin tab's compare buttons use.
+"""
+from typing import Any, Dict, List
+
+import streamlit as st
+
+from data_processing.datasets import DEFAULT_DATASET, datasets
+from engine.state_token import StateTokenError, canonical_selection, canonical_selections, decode_state, encode_state
+from engine.scenarios import selection_columns
+from helpers.data_selectors import compare_key_versions, export_settings_to_compare_tab
+from helpers.dataset_selection import SESSION_KEY as DATASET_SESSION_KEY
+
+QUERY_PARAM = "s"
+
+
+def current_state() -> Dict[str, Any]:
+    """The session's shareable state, in canonical form."""
+    state: Dict[str, Any] = {"tab": st.session_state.get("tab", "Home")}
+    dataset = st.session_state.get(DATASET_SESSION_KEY, DEFAULT_DATASET)
+    if dataset != DEFAULT_DATASET:
+        state["dataset"] = dataset
+    if st.session_state.get("postcode"):
+        state["postcode"] = st.session_state["postcode"]
+    begin = canonical_selection(st.session_state.get("begin_tab_values", {}))
+    if begin:
+        state["begin"] = begin
+    compare = canonical_selections(st.session_state.get("compare_selections", []))
+    if compare:
+        state["compare"] = compare
+    return state
+
+
+def _selection(value: Any) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise StateTokenError("Invalid state token: a selection isn't an object")
+    try:
+        return canonical_selection(value)
+    except ValueError as e:
+        raise StateTokenError(f"Invalid state token: {e}") from e
+
+
+def parse_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The app state in a decoded token, with each field checked and selections in canonical form.
+
+    Raises:
+        StateTokenError: If a field has the wrong type or a selection an invalid value
+    """
+    parsed: Dict[str, Any] = {"tab": state.get("tab", "Home")}
+    if not isinstance(parsed["tab"], str):
+        raise StateTokenError("Invalid state token: tab isn't a string")
+    if "dataset" in state:
+        if not isinstance(state["dataset"], str):
+            raise StateTokenError("Invalid state token: dataset isn't a string")
+        parsed["dataset"] = state["dataset"]
+    if "postcode" in state:
+        postcode = state["postcode"]
+        if isinstance(postcode, bool) or not isinstance(postcode, (str, int)):
+            raise StateTokenError("Invalid state token: postcode isn't a string or number")
+        parsed["postcode"] = str(postcode)
+    if "begin" in state:
+        parsed["begin"] = _selection(state["begin"])
+    if "compare" in state:
+        if not isinstance(state["compare"], list):
+            raise StateTokenError("Invalid state token: compare isn't a list")
+        parsed["compare"] = [_selection(selection) for selection in state["compare"]]
+    return parsed
+
+
+def apply_url_state(tab_names: List[str]) -> None:
+    """Start a new session from the state in the URL, if there is one. Call before any widgets.
+
+    Args:
+        tab_names: The app's tabs. A link to a tab that isn't one of them (e.g. one
+                   since renamed) opens on "Home".
+    """
+    if st.session_state.get("_url_state_applied"):
+        return
+    st.session_state["_url_state_applied"] = True
+    token = st.query_params.get(QUERY_PARAM)
+    if not token:
+        return
+    try:
+        state = parse_state(decode_state(token))
+    except StateTokenError as e:
+        # A broken or edited link opens the app from the start rather than failing
+        print(f"Ignoring state in URL: {e}")
+        st.warning("The view saved in this link couldn't be read, so the app has opened from the start.")
+        return
+
+    if state["tab"] in tab_names:
+        st.session_state["tab"] = state["tab"]
+    else:
+        print(f"Ignoring unknown tab in URL state: {state['tab']}")
+        st.session_state["tab"] = "Home"
+    if state.get("dataset") in datasets:
+        st.session_state[DATASET_SESSION_KEY] = state["dataset"]
+    if "postcode" in state:
+        st.session_state["postcode"] = state["postcode"]
+    if "begin" in state:
+        st.session_state["begin_tab_values"] = state["begin"]
+    systems = state.get("compare", [])[:len(compare_key_versions)]
+    for selection, key_version in zip(systems, compare_key_versions):
+        if all(key in selection for key in selection_columns if key != "location"):
+            export_settings_to_compare_tab(selection, key_version)
+    if len(systems) >= 2:
+        st.session_state["number_compare_systems"] = len(systems)
+
+
+def sync_url_state() -> None:
+    """Put the session's current state in the URL (only when it has changed)."""
+    state = current_state()
+    if state == {"tab": "Home"}:
+        if QUERY_PARAM in st.query_params:
+            del st.query_params[QUERY_PARAM]
+        return
+    token = encode_state(state)
+    if st.query_params.get(QUERY_PARAM) != token:
+        st.query_params[QUERY_PARAM] = token
@@ -0,0 +1,238 @@
+"""Batch report: the Begin tab's results for every household in a file.
+
+Runs the same postcode resolution, scenario lookup and payback calculation as the
+Begin tab (engine.portfolio.begin_tab_results) over a household CSV, in parallel
+across a process pool. The input is read and the output written a chunk at a
+time, so neither has to fit in memory.
+
+Usage (from the repository root):
+
+    python -m reports.batch_report households.csv report.csv --workers 8
+    python -m reports.batch_report households.csv report.parquet
+
+The input uses the same columns as the Portfolio tab. A CSV report is written to
+a single file; a Parquet report is written as a directory of part files.
+
+An interrupted run picks up where it stopped when run again with the same
+arguments: completed chunks are recorded next to the output and are not redone.
+Use --restart to start from scratch.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+import pandas as pd
+
+from data_processing.data_processing import enable_copy_on_write
+from engine.portfolio import DEFAULT_CHUNK_SIZE, PortfolioError, begin_tab_results
+
+OPTIONS = {
+    "efficiency": "Yes, I just want a more efficient system",
+    "end-of-life": "Yes, my current system comes to the end of life and needs a replacement",
+}
+
+
+def _load_worker_data() -> None:
+    """Process pool initializer: load the data and indexes once per worker."""
+    from engine.scenarios import postcode_index, scenario_index
+
+    enable_copy_on_write()
+    postcode_index()
+    scenario_index()
+
+
+def evaluate_chunk(chunk: pd.DataFrame, option: str, discount_rate: float) -> pd.DataFrame:
+    return begin_tab_results(chunk, option, discount_rate)
+
+
+class CsvReport:
+    """A CSV report written chunk by chunk, resumable after an interruption.
+
+    After each chunk is written and flushed, the number of chunks done and the
+    file size are saved to a progress file. On resume, anything written after
+    the last saved chunk (a partly written chunk) is truncated away.
+    """
+
+    def __init__(self, path: str, settings: Dict[str, object], restart: bool) -> None:
+        self.path = path
+        self.progress_path = path + ".progress.json"
+        self.settings = settings
+        self.chunks_done = 0
+        size = 0
+        if not restart and os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+            if progress["settings"] != settings:
+                raise SystemExit(
+                    f"{path} was started with different settings; use --restart to start again"
+                )
+            self.chunks_done, size = progress["chunks_done"], progress["bytes"]
+        elif not restart and os.path.exists(path):
+            raise SystemExit(f"{path} already exists; use --restart to overwrite it")
+        self.file = open(path, "r+b" if size else "wb")
+        self.file.truncate(size)
+        self.file.seek(size)
+
+    def write(self, index: int, results: pd.DataFrame) -> None:
+        self.file.write(results.to_csv(index=False, header=(index == 0)).encode())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.chunks_done = index + 1
+        self._save_progress()
+
+    def _save_progress(self) -> None:
+        tmp_path = self.progress_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": self.settings, "chunks_done": self.chunks_done, "bytes": self.file.tell()}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def close(self, finished: bool) -> None:
+        self.file.close()
+        if finished and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+
+class ParquetReport:
+    """A Parquet report written as a directory of part files, one per chunk.
+
+    Each part is written to a temporary name and renamed when complete, so the
+    parts that exist are exactly the chunks that are done.
+    """
+
+    def __init__(self, path: str, settings: Dict[str, object], restart: bool) -> None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or write a .csv report")
+        self.path = path
+        self.settings_path = os.path.join(path, "_settings.json")
+        os.makedirs(path, exist_ok=True)
+        if restart:
+            for name in os.listdir(path):
+                if name.startswith("part-") or name == "_settings.json":
+                    os.remove(os.path.join(path, name))
+        if os.path.exists(self.settings_path):
+            with open(self.settings_path) as f:
+                if json.load(f) != settings:
+                    raise SystemExit(
+                        f"{path} was started with different settings; use --restart to start again"
+                    )
+        with open(self.settings_path, "w") as f:
+            json.dump(settings, f)
+        self.done = {
+            int(name[len("part-"):-len(".parquet")])
+            for name in os.listdir(path)
+            if name.startswith("part-") and name.endswith(".parquet")
+        }
+        # Chunks are written in order, so the completed ones are a prefix
+        self.chunks_done = 0
+        while self.chunks_done in self.done:
+            self.chunks_done += 1
+
+    def write(self, index: int, results: pd.DataFrame) -> None:
+        part_path = os.path.join(self.path, f"part-{index:06d}.parquet")
+        results.to_parquet(part_path + ".tmp", index=False)
+        os.replace(part_path + ".tmp", part_path)
+        self.chunks_done = index + 1
+
+    def close(self, finished: bool) -> None:
+        pass
+
+
+def read_chunks(input_path: str, chunk_size: int, skip_chunks: int) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """Numbered chunks of the input, skipping chunks that are already done."""
+    # Everything is read as text so chunks don't infer different types
+    reader = pd.read_csv(input_path, chunksize=chunk_size, dtype=str)
+    for index, chunk in enumerate(reader):
+        if index >= skip_chunks:
+            yield index, chunk
+
+
+def run_report(
+    input_path: str,
+    output_path: str,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    option: str = OPTIONS["efficiency"],
+    discount_rate: float = 0.02,
+    restart: bool = False,
+) -> int:
+    """Write the report for input_path to output_path. Returns the number of households done."""
+    settings = {
+        "input": os.path.abspath(input_path),
+        "input_bytes": os.path.getsize(input_path),
+        "chunk_size": chunk_size,
+        "option": option,
+        "discount_rate": discount_rate,
+    }
+    report_class = ParquetReport if output_path.endswith(".parquet") else CsvReport
+    report = report_class(output_path, settings, restart)
+    if report.chunks_done:
+        print(f"Resuming after {report.chunks_done} completed chunks")
+
+    workers = workers or os.cpu_count() or 1
+    households, finished = 0, False
+    start = time.perf_counter()
+    # Only a few chunks are in flight at once, so memory use doesn't grow with the input
+    pending: Deque[Tuple[int, Future]] = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_worker_data) as pool:
+        try:
+            for index, chunk in read_chunks(input_path, chunk_size, report.chunks_done):
+                pending.append((index, pool.submit(evaluate_chunk, chunk, option, discount_rate)))
+                if len(pending) >= workers * 2:
+                    households += _write_next(report, pending)
+            while pending:
+                households += _write_next(report, pending)
+            finished = True
+        finally:
+            report.close(finished)
+            if not finished:
+                for _, future in pending:
+                    future.cancel()
+
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {households:,} households to {output_path} in {elapsed:.1f}s "
+          f"({households / max(elapsed, 1e-9):,.0f} households/s, {workers} workers)")
+    return households
+
+
+def _write_next(report, pending: Deque[Tuple[int, Future]]) -> int:
+    # Results are written in input order so the completed chunks are always a prefix
+    index, future = pending.popleft()
+    results = future.result()
+    report.write(index, results)
+    return len(results)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="Household CSV (same columns as the Portfolio tab)")
+    parser.add_argument("output", help="Report path: .csv for a CSV file, .parquet for a Parquet directory")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Households per chunk")
+    parser.add_argument("--option", choices=list(OPTIONS), default="efficiency",
+                        help="Why the systems are being replaced (affects the simple payback)")
+    parser.add_argument("--discount-rate", type=float, default=0.02)
+    parser.add_argument("--restart", action="store_true", help="Ignore any earlier progress and start again")
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    try:
+        run_report(args.input, args.output, args.workers, args.chunk_size,
+                   OPTIONS[args.option], args.discount_rate, args.restart)
+    except PortfolioError as e:
+        print(f"Error: {e}")
+        return 1
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume")
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Dataset diff: what changed between two scenario runs, scenario by scenario.
+
+Aligns two scenario datasets on the scenario key (the selection columns, see
+engine.scenarios.key_columns) and reports:
+
+- scenarios only in the old run (removed) and only in the new run (added)
+- for scenarios in both, each metric's absolute and relative change, with
+  summary statistics per metric and counts of changed scenarios per location
+
+The join is a hash join on one int64 code per row: each key column is factorized
+over both runs and the codes are combined, so matching 100k-row runs is a single
+hash table lookup rather than a merge on seven text columns. Changed scenarios
+are written to the output a chunk at a time, so the first rows are out before the
+rest are formatted and the CSV text is never held in memory at once.
+
+Usage (from the repository root):
+
+    python -m reports.dataset_diff climate_zones new_run.csv --output changes.csv
+    python -m reports.dataset_diff old_run.csv new_run.csv --output - > changes.csv
+
+Each run is a scenario CSV or the name of a registered dataset (see
+data_processing.datasets). The summary is printed (to stderr when the changes go
+to stdout).
+"""
+import argparse
+import contextlib
+import sys
+import time
+from typing import BinaryIO, Iterator, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv
+
+from data_processing.data_processing import (
+    DuplicateScenarioError,
+    enable_copy_on_write,
+    metrics,
+    preprocess_data,
+    read_scenarios,
+)
+from data_processing.datasets import datasets
+from engine.scenarios import key_columns
+
+# Changed scenarios formatted and written per chunk
+DEFAULT_CHUNK_SIZE = 20_000
+
+# Locations listed in the summary, those with the most differences first
+SUMMARY_LOCATIONS = 25
+
+
+class DatasetDiff(NamedTuple):
+    """Two runs aligned on the scenario key.
+
+    Attributes:
+        old, new: The preprocessed runs
+        old_matched, new_matched: Positions of the scenarios in both runs, pairwise
+        removed: Positions in `old` of scenarios missing from `new`
+        added: Positions in `new` of scenarios missing from `old`
+    """
+    old: pd.DataFrame
+    new: pd.DataFrame
+    old_matched: np.ndarray
+    new_matched: np.ndarray
+    removed: np.ndarray
+    added: np.ndarray
+
+
+def read_run(source: str, duplicates: str = "error") -> pd.DataFrame:
+    """A run's preprocessed scenarios, from a registered dataset's name or a scenario CSV path.
+
+    Registered datasets handle repeated scenarios as their spec says, CSVs as `duplicates`
+    says (see preprocess_data).
+    """
+    if source in datasets:
+        spec = datasets[source]
+        return preprocess_data(read_scenarios(spec.scenario_path, spec.cities), spec.duplicates)
+    return preprocess_data(read_scenarios(source), duplicates)
+
+
+def key_codes(old: pd.DataFrame, new: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """One int64 code per scenario key, comparable between the two runs.
+
+    Each key column is factorized over both runs together, and the per-column codes
+    are combined in mixed radix, so equal keys get equal codes.
+    """
+    old_codes = np.zeros(len(old), dtype=np.int64)
+    new_codes = np.zeros(len(new), dtype=np.int64)
+    combinations = 1
+    for column in key_columns:
+        codes, uniques = pd.factorize(np.concatenate([old[column].to_numpy(), new[column].to_numpy()]))
+        # NaN keys get code -1; shift so they get a code of their own
+        radix = len(uniques) + 1
+        combinations *= radix
+        if combinations >= 2**63:
+            raise ValueError("Too many distinct scenario keys to combine into one code")
+        old_codes = old_codes * radix + codes[:len(old)] + 1
+        new_codes = new_codes * radix + codes[len(old):] + 1
+    return old_codes, new_codes
+
+
+def diff_datasets(old: pd.DataFrame, new: pd.DataFrame) -> DatasetDiff:
+    """Align two runs on the scenario key (keys must be unique within each run, as preprocess_data ensures)."""
+    old_codes, new_codes = key_codes(old, new)
+    # Hash join: one lookup of every old key in a hash table of the new keys
+    positions = pd.Index(new_codes).get_indexer(old_codes)
+    matched = positions >= 0
+    in_old = np.zeros(len(new), dtype=bool)
+    in_old[positions[matched]] = True
+    return DatasetDiff(
+        old=old,
+        new=new,
+        old_matched=np.flatnonzero(matched),
+        new_matched=positions[matched],
+        removed=np.flatnonzero(~matched),
+        added=np.flatnonzero(~in_old),
+    )
+
+
+def metric_changes(diff: DatasetDiff, metric: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(old values, new values, absolute change, relative change) of a metric for the matched scenarios.
+
+    The relative change is NaN where the old value is 0.
+    """
+    old_values = diff.old[metric].to_numpy(dtype=float)[diff.old_matched]
+    new_values = diff.new[metric].to_numpy(dtype=float)[diff.new_matched]
+    change = new_values - old_values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.where(old_values != 0, change / np.abs(old_values), np.nan)
+    return old_values, new_values, change, relative
+
+
+def changed_mask(diff: DatasetDiff, rtol: float = 1e-9, atol: float = 1e-9) -> np.ndarray:
+    """Whether each matched scenario has any metric that changed by more than the tolerances."""
+    changed = np.zeros(len(diff.old_matched), dtype=bool)
+    for metric in metrics:
+        old_values, new_values, _, _ = metric_changes(diff, metric)
+        changed |= ~np.isclose(new_values, old_values, rtol=rtol, atol=atol, equal_nan=True)
+    return changed
+
+
+def summarise_metrics(diff: DatasetDiff, rtol: float = 1e-9, atol: float = 1e-9) -> pd.DataFrame:
+    """Summary statistics of each metric's changes over the matched scenarios."""
+    rows = {}
+    for metric in metrics:
+        old_values, new_values, change, relative = metric_changes(diff, metric)
+        changed = ~np.isclose(new_values, old_values, rtol=rtol, atol=atol, equal_nan=True)
+        absolute = np.abs(change)
+        relative = np.abs(relative[np.isfinite(relative)])
+        rows[metric] = {
+            "Changed": int(changed.sum()),
+            "Mean change": np.nanmean(change) if len(change) else np.nan,
+            "Mean abs change": np.nanmean(absolute) if len(change) else np.nan,
+            "Max abs change": np.nanmax(absolute) if changed.any() else 0.0,
+            "Median abs relative": np.median(relative) if len(relative) else np.nan,
+            "95th pct abs relative": np.percentile(relative, 95) if len(relative) else np.nan,
+            "Max abs relative": relative.max() if len(relative) else np.nan,
+        }
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def summarise_locations(diff: DatasetDiff, changed: np.ndarray) -> pd.DataFrame:
+    """Changed, added and removed scenarios per location, most differences first (locations with none left out)."""
+    counts = pd.DataFrame({
+        "Changed": pd.Series(diff.old["Location"].to_numpy()[diff.old_matched[changed]]).value_counts(),
+        "Added": pd.Series(diff.new["Location"].to_numpy()[diff.added]).value_counts(),
+        "Removed": pd.Series(diff.old["Location"].to_numpy()[diff.removed]).value_counts(),
+    })
+    counts = counts.fillna(0).astype(int)
+    counts.index.name = "Location"
+    return counts.loc[counts.sum(axis=1).sort_values(ascending=False, kind="stable").index]
+
+
+def _change_frame(
+    diff: DatasetDiff, change: str, old_positions: np.ndarray, new_positions: np.ndarray
+) -> pd.DataFrame:
+    """Rows of the changes output: the key, the kind of change and each metric's old and new value."""
+    keys = diff.new if change == "added" else diff.old
+    key_positions = new_positions if change == "added" else old_positions
+    frame = keys[key_columns].iloc[key_positions].reset_index(drop=True)
+    frame.insert(len(key_columns), "Change", change)
+    for metric in metrics:
+        old_values = diff.old[metric].to_numpy(dtype=float)[old_positions] if len(old_positions) else np.nan
+        new_values = diff.new[metric].to_numpy(dtype=float)[new_positions] if len(new_positions) else np.nan
+        old_values = np.broadcast_to(old_values, len(frame))
+        new_values = np.broadcast_to(new_values, len(frame))
+        frame[f"{metric} old"] = old_values
+        frame[f"{metric} new"] = new_values
+        frame[f"{metric} change"] = new_values - old_values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frame[f"{metric} relative change"] = np.where(
+                old_values != 0, (new_values - old_values) / np.abs(old_values), np.nan
+            )
+    return frame
+
+
+def iter_changes(
+    diff: DatasetDiff, changed: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """The changed, removed and added scenarios, `chunk_size` rows at a time.
+
+    The first chunk is yielded even if nothing changed, so the output always has its columns.
+    """
+    empty = np.array([], dtype=np.int64)
+    old_changed, new_changed = diff.old_matched[changed], diff.new_matched[changed]
+    for start in range(0, max(len(old_changed), 1), chunk_size):
+        stop = start + chunk_size
+        yield _change_frame(diff, "changed", old_changed[start:stop], new_changed[start:stop])
+    for start in range(0, len(diff.removed), chunk_size):
+        yield _change_frame(diff, "removed", diff.removed[start:start + chunk_size], empty)
+    for start in range(0, len(diff.added), chunk_size):
+        yield _change_frame(diff, "added", empty, diff.added[start:start + chunk_size])
+
+
+def write_changes(chunks: Iterator[pd.DataFrame], output: BinaryIO) -> int:
+    """Write the change chunks to a CSV as they are produced. Returns the number of rows written.
+
+    Uses pyarrow's CSV writer, which formats numbers far faster than DataFrame.to_csv.
+    """
+    rows, writer = 0, None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pyarrow.csv.CSVWriter(output, table.schema)
+        writer.write_table(table)
+        rows += len(chunk)
+    if writer is not None:
+        writer.close()
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", help="Old run: scenario CSV or registered dataset name")
+    parser.add_argument("new", help="New run: scenario CSV or registered dataset name")
+    parser.add_argument("--output", help='CSV of changed, removed and added scenarios ("-" for stdout)')
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Output rows per chunk")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="Relative tolerance for a metric to count as changed")
+    parser.add_argument("--atol", type=float, default=1e-9, help="Absolute tolerance for a metric to count as changed")
+    parser.add_argument("--duplicates", choices=["error", "first", "last"], default="error",
+                        help="Rows of a CSV run repeating a scenario: refuse the run, or keep the first or last row")
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    log = sys.stderr if args.output == "-" else sys.stdout
+    start = time.perf_counter()
+    # Notes printed while reading (e.g. dropped rows) mustn't end up in CSV written to stdout
+    try:
+        with contextlib.redirect_stdout(log):
+            old, new = read_run(args.old, args.duplicates), read_run(args.new, args.duplicates)
+    except DuplicateScenarioError as e:
+        print(f"Error: {e} (see --duplicates)", file=sys.stderr)
+        return 1
+    read_seconds = time.perf_counter() - start
+    diff = diff_datasets(old, new)
+    changed = changed_mask(diff, args.rtol, args.atol)
+
+    print(f"Old: {len(old):,} scenarios, new: {len(new):,} scenarios", file=log)
+    print(f"In both: {len(diff.old_matched):,} ({int(changed.sum()):,} changed), "
+          f"removed: {len(diff.removed):,}, added: {len(diff.added):,}", file=log)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:,.4g}".format):
+        print("\nChanges by metric (over the scenarios in both runs):", file=log)
+        print(summarise_metrics(diff, args.rtol, args.atol).to_string(), file=log)
+        locations = summarise_locations(diff, changed)
+        if not locations.empty:
+            print(f"\nScenarios with differences by location ({len(locations)} locations, "
+                  f"first {min(len(locations), SUMMARY_LOCATIONS)} shown):", file=log)
+            print(locations.head(SUMMARY_LOCATIONS).to_string(), file=log)
+
+    if args.output:
+        chunks = iter_changes(diff, changed, args.chunk_size)
+        if args.output == "-":
+            rows = write_changes(chunks, sys.stdout.buffer)
+        else:
+            with open(args.output, "wb") as f:
+                rows = write_changes(chunks, f)
+        print(f"\nWrote {rows:,} changed, removed and added scenarios to {args.output}", file=log)
+    print(f"Done in {time.perf_counter() - start:.1f}s (reading {read_seconds:.1f}s)", file=log)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
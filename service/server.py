@@ -0,0 +1,350 @@
+"""Local JSON HTTP service for scenario and payback queries.
+
+Exposes the lookups behind the Begin and Compare tabs over HTTP using only the
+standard library, so partners can embed SolarShift estimates without the UI.
+
+Usage (from the repository root):
+
+    python -m service.server --port 8600
+
+Endpoints (all responses are JSON):
+
+    GET  /health                        {"status": "ok", "dataset": ..., "dataset_version": ...}
+    GET  /postcode/<postcode>           representative postcode of a postcode
+    POST /postcodes                     {"postcodes": [...]}
+    GET  /scenario?<selection>          scenario metrics for one system
+    POST /scenarios                     {"selections": [...]}
+    GET  /payback?<selection>&option=...&discount_rate=...
+    POST /paybacks                      {"selections": [...], "option": ..., "discount_rate": ...}
+    GET  /counterfactuals?<selection>   the Begin tab's compare button comparisons
+    POST /counterfactuals               {"selections": [...]}
+    POST /compare                       {"pairs": [{"current": {...}, "alternative": {...}}, ...]}
+
+A selection needs every key the app uses, e.g. location=2010&household_occupants=4
+&hot_water_usage_pattern=Evening dominant&solar=No&heater=Electric
+&hot_water_billing_type=Flat rate electricity&heater_control=Run as needed (no control)
+
+Any request can select a dataset version with ?dataset=<name> (see
+data_processing.datasets), e.g. to compare a new scenario run with the current
+one. Requests without it use the default dataset.
+
+Responses carry an ETag derived from the dataset version and the request, so
+clients can revalidate with If-None-Match and get a 304 without any work being
+done. Responses are also kept in an in-process cache, bounded by total bytes;
+requests with large bodies bypass it.
+"""
+import argparse
+import hashlib
+import json
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from data_processing.data_processing import dataset_version, enable_copy_on_write
+from data_processing.datasets import UnknownDatasetError, active_dataset_name, selected_dataset
+from engine.payback import compute_payback, payback_heaters
+from engine.scenarios import (
+    SystemSelection,
+    compare_counterfactuals,
+    compare_systems,
+    get_scenario,
+    postcode_number,
+    resolve_postcode,
+    selection_columns,
+)
+from engine.state_token import selection_value
+from helpers.caching import SingleFlightCache
+from service.warmup import warm_up_data
+
+# Answer used for payback requests that don't say why the system is being replaced
+DEFAULT_PAYBACK_OPTION = "Yes, I just want a more efficient system"
+
+# Upper limit on request body size, to stop a single request exhausting memory
+MAX_BODY_BYTES = 10_000_000
+
+# Requests with bigger bodies are answered without the response cache, as their
+# body would be held in the cache key
+MAX_CACHED_BODY_BYTES = 64_000
+
+# Memory held by the response cache: request bodies in its keys plus encoded responses
+RESPONSE_CACHE_BYTES = 64_000_000
+
+
+def _response_size(key: Tuple, value: Tuple[int, bytes]) -> int:
+    return len(key[-1]) + len(value[1])
+
+
+# Encoded responses, keyed by (dataset version, method, path, query, body)
+response_cache = SingleFlightCache(
+    "HTTP service responses", maxsize=50_000, maxbytes=RESPONSE_CACHE_BYTES, sizeof=_response_size
+)
+
+
+class RequestError(Exception):
+    """An invalid request, reported to the client as a 400."""
+
+
+def _to_json(value: Any) -> Any:
+    """Convert pandas/numpy results into plain JSON types (NaN becomes null)."""
+    if isinstance(value, pd.DataFrame):
+        return [_to_json(row) for row in value.to_dict(orient="records")]
+    if isinstance(value, pd.Series):
+        return _to_json(value.to_dict())
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def parse_selection(params: Any) -> SystemSelection:
+    """Build a selection from query parameters or a JSON object, which must have every selection key."""
+    if not isinstance(params, dict):
+        raise RequestError("Each selection must be an object")
+    selection = _require_complete({key: params[key] for key in selection_columns if key in params})
+    try:
+        return {key: selection_value(key, value) for key, value in selection.items()}
+    except ValueError as e:
+        raise RequestError(f"{e} (location and household_occupants must be whole numbers, the other keys strings)")
+
+
+def _require_complete(selection: SystemSelection) -> SystemSelection:
+    missing = [key for key in selection_columns if key not in selection]
+    if missing:
+        raise RequestError(f"Selection is missing {', '.join(missing)}")
+    return selection
+
+
+def _payback(selections: Union[SystemSelection, List[SystemSelection]], option: str, discount_rate: float) -> list:
+    """compute_payback, with [] for systems no heat pump payback applies to."""
+    if isinstance(selections, list):
+        return [_payback(s, option, discount_rate) for s in selections]
+    if selections["heater"] not in payback_heaters:
+        return []
+    return compute_payback(selections, option, discount_rate)
+
+
+def _selections(body: Dict[str, Any]) -> list:
+    selections = body.get("selections")
+    if not isinstance(selections, list):
+        raise RequestError('Expected {"selections": [...]}')
+    return [parse_selection(s) for s in selections]
+
+
+def _payback_args(params: Dict[str, Any]) -> Tuple[str, float]:
+    option = params.get("option", DEFAULT_PAYBACK_OPTION)
+    if not isinstance(option, str):
+        raise RequestError("option must be a string")
+    discount_rate = params.get("discount_rate", 0.02)
+    try:
+        # bool is an int, but true isn't a rate
+        if isinstance(discount_rate, bool):
+            raise ValueError
+        discount_rate = float(discount_rate)
+    except (TypeError, ValueError):
+        raise RequestError("discount_rate must be a number")
+    if not math.isfinite(discount_rate) or discount_rate < 0:
+        raise RequestError("discount_rate must be a finite number of at least 0")
+    return option, discount_rate
+
+
+def _postcode_value(value: Any) -> int:
+    postcode = postcode_number(value)
+    if postcode is None:
+        raise RequestError("Postcodes must be whole numbers")
+    return postcode
+
+
+def _postcode(path: str) -> Dict[str, Any]:
+    postcode = _postcode_value(path.rsplit("/", 1)[1])
+    return {"postcode": postcode, "rep_postcode": resolve_postcode(postcode)}
+
+
+def _postcodes(body: Dict[str, Any]) -> list:
+    postcodes = body.get("postcodes")
+    if not isinstance(postcodes, list):
+        raise RequestError('Expected {"postcodes": [...]}')
+    postcodes = [_postcode_value(p) for p in postcodes]
+    return [
+        {"postcode": p, "rep_postcode": rep}
+        for p, rep in zip(postcodes, resolve_postcode(postcodes))
+    ]
+
+
+def _compare(body: Dict[str, Any]) -> list:
+    pairs = body.get("pairs")
+    if not isinstance(pairs, list):
+        raise RequestError('Expected {"pairs": [{"current": {...}, "alternative": {...}}, ...]}')
+    try:
+        currents = [parse_selection(p["current"]) for p in pairs]
+        alternatives = [parse_selection(p["alternative"]) for p in pairs]
+    except (KeyError, TypeError):
+        raise RequestError('Each pair needs "current" and "alternative" selections')
+    return compare_systems(currents, alternatives) if pairs else []
+
+
+# Route table: (method, path or path prefix ending in "/") -> handler(params, body)
+routes: Dict[Tuple[str, str], Callable[[Dict[str, Any], Dict[str, Any], str], Any]] = {
+    ("GET", "/health"): lambda params, body, path: {
+        "status": "ok", "dataset": active_dataset_name(), "dataset_version": dataset_version()
+    },
+    ("GET", "/postcode/"): lambda params, body, path: _postcode(path),
+    ("POST", "/postcodes"): lambda params, body, path: _postcodes(body),
+    ("GET", "/scenario"): lambda params, body, path: get_scenario(parse_selection(params)),
+    ("POST", "/scenarios"): lambda params, body, path: get_scenario(_selections(body)),
+    ("GET", "/payback"): lambda params, body, path: _payback(parse_selection(params), *_payback_args(params)),
+    ("POST", "/paybacks"): lambda params, body, path: _payback(_selections(body), *_payback_args(body)),
+    ("GET", "/counterfactuals"): lambda params, body, path: compare_counterfactuals(parse_selection(params)),
+    ("POST", "/counterfactuals"): lambda params, body, path: compare_counterfactuals(_selections(body)),
+    ("POST", "/compare"): lambda params, body, path: _compare(body),
+}
+
+
+def find_route(method: str, path: str) -> Optional[Callable]:
+    handler = routes.get((method, path))
+    if handler is None:
+        prefix = path.rsplit("/", 1)[0] + "/"
+        handler = routes.get((method, prefix))
+    return handler
+
+
+def handle_request(method: str, path: str, query: str, body: bytes) -> Tuple[int, bytes]:
+    """Run a request through its route and return (status, encoded JSON body)."""
+    handler = find_route(method, path)
+    if handler is None:
+        return 404, json.dumps({"error": f"No route for {method} {path}"}).encode()
+    try:
+        params = dict(parse_qsl(query))
+        json_body = json.loads(body) if body else {}
+        if not isinstance(json_body, dict):
+            raise RequestError("Request body must be a JSON object")
+        result = handler(params, json_body, path)
+    except (RequestError, json.JSONDecodeError) as e:
+        return 400, json.dumps({"error": str(e)}).encode()
+    if result is None:
+        return 404, json.dumps({"error": "No matching scenario"}).encode()
+    return 200, json.dumps(_to_json(result)).encode()
+
+
+def request_etag(version: str, method: str, path: str, query: str, body: bytes) -> str:
+    """ETag for a request's response, known without computing the response.
+
+    Responses only depend on the request and the data, so the same request against
+    the same dataset version always gives the same response.
+    """
+    digest = hashlib.sha1(f"{version}\n{method}\n{path}\n{query}\n".encode() + body).hexdigest()
+    return f'"{version}-{digest[:16]}"'
+
+
+class ScenarioRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests, which load tests rely on
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY the body waits
+    # on the client's delayed ACK and every keep-alive response takes ~40ms
+    disable_nagle_algorithm = True
+    verbose = False
+
+    def do_GET(self) -> None:
+        self._respond("GET")
+
+    def do_POST(self) -> None:
+        self._respond("POST")
+
+    def _respond(self, method: str) -> None:
+        url = urlsplit(self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body can't be skipped without its length, so the connection can't be reused
+            self.close_connection = True
+            self._send(400, b'{"error": "Invalid Content-Length"}', None)
+            return
+        if length > MAX_BODY_BYTES:
+            self._send(413, b'{"error": "Request body too large"}', None)
+            return
+        body = self.rfile.read(length) if length else b""
+
+        try:
+            with selected_dataset(dict(parse_qsl(url.query)).get("dataset")):
+                self._respond_with_dataset(method, url.path, url.query, body)
+        except UnknownDatasetError as e:
+            self._send(400, json.dumps({"error": str(e)}).encode(), None)
+
+    def _respond_with_dataset(self, method: str, path: str, query: str, body: bytes) -> None:
+        version = dataset_version()
+        etag = request_etag(version, method, path, query, body)
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", etag)
+            return
+
+        key = (version, method, path, query, body)
+        try:
+            if len(body) > MAX_CACHED_BODY_BYTES:
+                status, payload = handle_request(method, path, query, body)
+            else:
+                status, payload = response_cache.get_or_compute(
+                    key, lambda: handle_request(method, path, query, body)
+                )
+        except Exception as e:
+            print(f"Error handling {method} {self.path}: {e}")
+            self._send(500, b'{"error": "Internal server error"}', None)
+            return
+        self._send(status, payload, etag if status == 200 else None)
+
+    def _send(self, status: int, payload: bytes, etag: Optional[str]) -> None:
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:
+        # Logging every request to stderr costs more than answering a cached one
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8600) -> ThreadingHTTPServer:
+    """Load the data and indexes, then create (but don't start) the server."""
+    # Build everything up front so the first requests don't pay for it
+    warm_up_data()
+    return ThreadingHTTPServer((host, port), ScenarioRequestHandler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    ScenarioRequestHandler.verbose = args.verbose
+    server = create_server(args.host, args.port)
+    print(f"Serving SolarShift scenarios on http://{args.host}:{args.port} "
+          f"(dataset version {dataset_version()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
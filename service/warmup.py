@@ -0,0 +1,197 @@
+"""Warm-up before serving: build the data and precompute popular results.
+
+The first users after a deploy would otherwise pay for every cold path: reading
+the CSVs, building the indexes, the first lookups and the first charts. Warm-up
+does all of that once, before the app accepts connections:
+
+1. the dataset, its version and every derived structure (postcode and scenario
+   indexes, selector options, rankings, Pareto frontiers, portfolio tables)
+2. for each configured high-traffic configuration, e.g. the top postcodes from
+   the logs: the location's rows, heat pump payback and the comparison behind
+   every Begin tab compare button, charts included
+
+Usage (from the repository root):
+
+    python -m service.warmup --configurations data/warmup_configurations.csv -- --server.port 8501
+
+This warms up and then starts the Streamlit app in the same process, so the
+process-wide caches (see helpers.caching) are already filled when the server
+starts listening. Streamlit's health check (/_stcore/health) only answers once
+warm-up is complete, and --ready-file writes a file at that point for readiness
+probes that check for one. Arguments after "--" are passed to `streamlit run`.
+
+The configurations file is a CSV with a postcode column and, optionally, any of
+the Begin tab's selection columns (named as in the Portfolio tab). Selections
+left out get the Begin tab's defaults, so a list of postcodes is enough.
+
+Only the default dataset is warmed up, unless --datasets names others (see
+data_processing.datasets), e.g. a new scenario run that some sessions are
+trying. Each is warmed up for the same configurations.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+import pandas as pd
+
+from data_processing.data_processing import (
+    dataset_version,
+    enable_copy_on_write,
+    load_and_preprocess_data,
+    load_location_data,
+)
+from data_processing.datasets import DEFAULT_DATASET, datasets, selected_dataset
+from engine.npv import DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS
+from engine.payback import compute_payback
+from engine.portfolio import best_alternatives, current_systems, portfolio_columns
+from engine.rankings import option_rankings, pareto_index
+from engine.scenarios import (
+    SystemSelection,
+    counterfactual_configs,
+    option_tree,
+    postcode_index,
+    resolve_postcode,
+    resolve_selection,
+    scenario_index,
+)
+
+DEFAULT_CONFIGURATIONS_PATH = "data/warmup_configurations.csv"
+
+# Heat pump payback is offered for these current heaters (see tabs.begin_tab),
+# for both "Yes" answers, at the Begin tab's default discount rate
+PAYBACK_HEATERS = ["Electric", "Gas Instant", "Gas Storage"]
+PAYBACK_OPTIONS = [
+    "Yes, my current system comes to the end of life and needs a replacement",
+    "Yes, I just want a more efficient system",
+]
+PAYBACK_DISCOUNT_RATE = 0.02
+
+def warm_up_data() -> None:
+    """Load the active dataset and build every structure derived from it."""
+    load_and_preprocess_data()
+    dataset_version()
+    postcode_index()
+    scenario_index()
+    option_tree()
+    option_rankings()
+    pareto_index()
+    best_alternatives()
+    current_systems()
+
+
+def read_configurations(path: str) -> List[SystemSelection]:
+    """Begin tab selections for the configurations in a CSV.
+
+    Postcodes are resolved to their representative postcode as the Begin tab does,
+    and selections that are missing (or not offered there) get the Begin tab's
+    defaults. Postcodes without data are skipped.
+    """
+    configurations = pd.read_csv(path)
+    lookup = {}
+    for key, column in portfolio_columns.items():
+        lookup[key] = key
+        lookup[column.lower()] = key
+    configurations = configurations.rename(columns=lambda c: lookup.get(str(c).strip().lower(), c))
+    if "postcode" not in configurations.columns:
+        raise ValueError(f"{path} has no postcode column")
+
+    selections = []
+    for row in configurations.to_dict(orient="records"):
+        postcode = int(row.pop("postcode"))
+        location = resolve_postcode(postcode) or postcode
+        if (location,) not in option_tree():
+            print(f"Skipping warm-up configuration with postcode {postcode}: no data")
+            continue
+        selection = {key: value for key, value in row.items() if key in portfolio_columns and pd.notna(value)}
+        if "household_occupants" in selection:
+            selection["household_occupants"] = int(selection["household_occupants"])
+        selections.append(resolve_selection({**selection, "location": location}))
+    return selections
+
+
+def warm_up_configuration(selection: SystemSelection) -> None:
+    """Precompute what the Begin tab shows for a selection, and its compare buttons' results."""
+    # Imported here so the JSON service can warm up its data without Streamlit
+    from engine.what_if import what_if_data
+    from tabs.compare_tab import comparison_job
+
+    load_location_data(selection["location"])
+
+    if selection["heater"] in PAYBACK_HEATERS and not (
+        selection["heater"] == "Electric" and selection["heater_control"] == "Diverter"
+    ):
+        for option in PAYBACK_OPTIONS:
+            compute_payback(selection, option, PAYBACK_DISCOUNT_RATE)
+
+    # As the compare buttons leave them: no what-if changes, ranges off, default rate and horizon
+    for make_config in counterfactual_configs.values():
+        alternative = {**make_config(dict(selection)), "location": selection["location"]}
+        _, job = comparison_job(
+            what_if_data(), [selection, alternative], None, False, DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS
+        )
+        job()
+
+
+def warm_up(configurations: List[SystemSelection]) -> None:
+    """Build the active dataset's data and precompute results for the configurations."""
+    started = time.perf_counter()
+    warm_up_data()
+    print(f"Warm-up: data and indexes built in {time.perf_counter() - started:.1f} s")
+
+    for selection in configurations:
+        try:
+            warm_up_configuration(selection)
+        except Exception as e:
+            # A bad configuration shouldn't stop the app from starting
+            print(f"Warm-up failed for {selection}: {e}")
+    print(
+        f"Warm-up complete in {time.perf_counter() - started:.1f} s "
+        f"({len(configurations)} configurations, dataset version {dataset_version()})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog='Arguments after "--" are passed to streamlit run, e.g. -- --server.port 8501',
+    )
+    parser.add_argument(
+        "--configurations", default=DEFAULT_CONFIGURATIONS_PATH,
+        help=f"CSV of high-traffic configurations to precompute (default {DEFAULT_CONFIGURATIONS_PATH})",
+    )
+    parser.add_argument(
+        "--datasets", nargs="+", default=[DEFAULT_DATASET], choices=list(datasets), metavar="NAME",
+        help=f"Datasets to warm up (default {DEFAULT_DATASET}), from: {', '.join(datasets)}",
+    )
+    parser.add_argument("--ready-file", help="File written once warm-up is complete")
+    parser.add_argument("--no-serve", action="store_true", help="Only warm up, don't start the app")
+    parser.add_argument("streamlit_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    versions = []
+    for name in args.datasets:
+        with selected_dataset(name):
+            print(f"Warming up dataset {name}")
+            configurations = read_configurations(args.configurations) if os.path.exists(args.configurations) else []
+            if not configurations:
+                print(f"No warm-up configurations read from {args.configurations}, warming up the data only")
+            warm_up(configurations)
+            versions.append(f"{name} {dataset_version()}\n")
+    if args.ready_file:
+        with open(args.ready_file, "w") as f:
+            f.writelines(versions)
+    if args.no_serve:
+        return
+
+    from streamlit.web import cli
+
+    streamlit_args = [a for a in args.streamlit_args if a != "--"]
+    sys.argv = ["streamlit", "run", "app.py", *streamlit_args]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
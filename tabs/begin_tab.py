@@ -2,15 +2,19 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 
-from graphics.charts import apply_chart_formatting
-from data_processing.data_processing import metrics, groups, load_and_preprocess_data
+from graphics.charts import add_uncertainty_bands, apply_chart_formatting
+from data_processing.data_processing import metrics, groups, load_and_preprocess_data, load_location_data
 from helpers.data_selectors import (
     export_settings_to_compare_tab,
     build_interactive_data_filter,
-    get_rep_postcode_from_postcode
 )
+from engine.payback import compute_payback
+from helpers.fragments import panel_fragment
+from tabs.compare_tab import prefetch_comparisons
+from engine.rankings import metric_values, option_columns, ranking_metrics, top_options
+from engine.scenarios import basic_heat_pump_config, counterfactual_configs, heat_pump_types, resolve_postcode
+from engine.uncertainty import cost_bands, payback_bands
 from data.system_configs import (
-    create_basic_heat_pump_config,
     create_solar_electric,
     create_electric,
     create_solar_thermal,
@@ -56,11 +60,11 @@ def render(data, postcode_df):
 
         rep_postcode = None
         if postcode and postcode.isdigit():
-            rep_postcode = get_rep_postcode_from_postcode(int(postcode), postcode_df)
+            rep_postcode = resolve_postcode(int(postcode))
         if not rep_postcode and postcode and postcode.isdigit():
             rep_postcode = int(postcode)
         if rep_postcode:
-            data = data[data["Location"] == rep_postcode]
+            data = load_location_data(rep_postcode)
         else:
             return
         
@@ -103,12 +107,27 @@ def render(data, postcode_df):
 
         data.insert(0, "System", "Your current hot water system")
 
+        # Prepare what each compare button below would show, while the results are being read
+        prefetch_comparisons([
+            [values, {**make_config(values.copy()), "location": rep_postcode}]
+            for make_config in counterfactual_configs.values()
+        ])
+
         st.markdown("<h3 style='color: #FFA000;'>Your estimated hot water costs:</h3>", unsafe_allow_html=True)
 
+        show_uncertainty = st.toggle(
+            "Show uncertainty ranges", key="toggle_uncertainty_begin",
+            help="Ranges from thousands of simulations with varying energy prices, hot water use, "
+                 "installation costs and rebate eligibility (bars run from the 10th to the 90th percentile).",
+        )
+        bands = cost_bands(data) if show_uncertainty else None
+
         with st.expander("Spending summary", expanded=True):
             cols = ["Up front cost ($)", "Rebates ($)", "Annual cost ($/yr)", "Decrease in solar export revenue ($/yr)"]
             chart = px.bar(data, x="System", y=cols, text_auto=True, barmode="group", height=200)
             apply_chart_formatting(chart, yaxes_title="Costs")
+            if show_uncertainty:
+                add_uncertainty_bands(chart, "Annual cost ($/yr)", bands["Annual cost ($/yr)"])
             st.plotly_chart(chart, use_container_width=True)
 
         with st.expander("Simple financial summary: Net present cost over 10yrs", expanded=True):
@@ -124,6 +143,8 @@ def render(data, postcode_df):
                 show_legend=False,
                 height=200,
             )
+            if show_uncertainty:
+                add_uncertainty_bands(bar_chart, "Net present cost ($)", bands["Net present cost ($)"])
 
             st.plotly_chart(
                 bar_chart,
@@ -135,178 +156,39 @@ def render(data, postcode_df):
         #if values["heater"] == "Electric" and values.get("heater_control") == "Active matching to solar":
            # return
 
-        # Payback period calculation and logic from Gas and Electric to HPs Systems
-
-        """If user select "Electric", "Gas Instant", "Gas Storage" as current system, Payback period question comes up and then there are options to select for End-of-life or standard payback period or not looking for changing system"""
-
-        # Define rep_postcode to state mapping (based on postcode_to_climatezone.csv)
-        rep_postcode_to_state = {
-            2600: "ACT", 2010: "NSW", 2400: "NSW", 2647: "NSW", 2880: "NSW",
-            800: "NT", 860: "NT", 870: "NT",
-            4000: "QLD", 4220: "QLD", 4720: "QLD", 4480: "QLD", 4822: "QLD",
-            5000: "SA", 5330: "SA", 5270: "SA",
-            7000: "TAS", 7330: "TAS",
-            3000: "VIC", 3570: "VIC", 3500: "VIC",
-            6000: "WA", 6430: "WA", 6640: "WA", 6720: "WA"
-        }
+        render_payback_and_emissions(data, all_systems_data, values, rep_postcode, show_uncertainty)
 
-        if values["heater"] in ["Electric", "Gas Instant", "Gas Storage"]:
-            if values["heater"] == "Electric" and values.get("heater_control") == "Diverter":
-                st.info("Payback period calculation is not available for Electric systems with 'Diverter' control.")
+        # Best options for the household, sliced from the precomputed rankings
+        with st.expander("Best options for you", expanded=True):
+            rank_by = st.radio("Rank options by:", list(ranking_metrics), horizontal=True, key="best_options_rank_by")
+            metric = ranking_metrics[rank_by]
+            profile = (rep_postcode, values["household_occupants"], values["hot_water_usage_pattern"], values["solar"])
+            options = top_options(profile, metric, k=5)
+            if options.empty:
+                st.info("No other options found for your household.")
             else:
-                st.markdown("<h3 style='color: #FFA000;'>Would you like to find out the finances and emissions after switching to a heat-pump?</h3>", unsafe_allow_html=True)
-                option = st.radio("Do you want to change to a heat pump?", ["Yes, my current system comes to the end of life and needs a replacement", "Yes, I just want a more efficient system", "No"], index=2)
-                if option != "No":
-                    discount_rate = st.selectbox("Select discount rate:", [0.02, 0.04, 0.06], index=0)
-                    payback_data = []
-                    for hp_type in ["Premium Heat Pump", "Standard Heat Pump"]:
-                        if values["heater"] in ["Gas Instant", "Gas Storage"]:
-                            hp_row = all_systems_data.loc[
-                                (all_systems_data["Location"] == rep_postcode) &
-                                (all_systems_data["Household occupants"] == values["household_occupants"]) &
-                                (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"]) &
-                                (all_systems_data["Heater control"] == values["heater_control"]) &
-                                (all_systems_data["Heater"] == hp_type) &
-                                (all_systems_data["Solar"] == "No") &
-                                (all_systems_data["Hot water billing type"] == "Flat rate electricity")
-                            ]
-                        elif values["heater"] == "Electric":
-                            hp_row = all_systems_data.loc[
-                                (all_systems_data["Location"] == rep_postcode) &
-                                (all_systems_data["Household occupants"] == values["household_occupants"]) &
-                                (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"]) &
-                                (all_systems_data["Heater control"] == values["heater_control"]) &
-                                (all_systems_data["Hot water billing type"] == values["hot_water_billing_type"]) &
-                                (all_systems_data["Solar"] == values["solar"]) &
-                                (all_systems_data["Heater"] == hp_type)
-                            ]
-                        if hp_row.empty:
-                            print(f"No hp_row match for {hp_type} with filters.")
-                            continue
-                        hp_row = hp_row.iloc[0]
-
-                        try:
-                            old_row = all_systems_data.loc[
-                                (all_systems_data["Location"] == rep_postcode) &
-                                (all_systems_data["Household occupants"] == values["household_occupants"]) &
-                                (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"]) &
-                                (all_systems_data["Heater control"] == values["heater_control"]) &
-                                (all_systems_data["Hot water billing type"] == values["hot_water_billing_type"]) &
-                                (all_systems_data["Solar"] == values["solar"]) &
-                                (all_systems_data["Heater"] == values["heater"])
-                            ]
-                        except Exception as e:
-                            print(f"Old row fallback triggered: {e}")
-                            old_row = all_systems_data.loc[
-                                (all_systems_data["Location"] == rep_postcode) &
-                                (all_systems_data["Household occupants"] == values["household_occupants"]) &
-                                (all_systems_data["Heater"] == values["heater"])
-                            ]
-                        if old_row.empty:
-                            print(f"No old_row match for heater: {values['heater']}")
-                            continue
-                        old_row = old_row.iloc[0]
-
-                        print(f"old row: {old_row}")
-                        print(f"hp row: {hp_row}")
-
-                        annual_savings = old_row["Annual cost ($/yr)"] + old_row["Annual supply cost ($/yr)"] - hp_row["Annual cost ($/yr)"]
-                        if annual_savings <= 0:
-                            continue
-
-                        upfront_cost = hp_row["Up front cost ($)"]
-
-                        # Rebate Logic ↓↓↓↓↓↓
-                        rebate_value = 0
-                        try:
-                            state = rep_postcode_to_state.get(rep_postcode)
-                            old_heater = values["heater"]
-                            is_heat_pump = hp_type.endswith("Heat Pump")
-                            if is_heat_pump:
-                                if state == "NSW":
-                                    rebate_value = 800 if old_heater == "Electric" else 0
-                                elif state == "VIC":
-                                    rebate_value = 840 if old_heater == "Electric" else 490
-                                elif state == "ACT":
-                                    if (upfront_cost / 2) < 500:
-                                        rebate_value = 500
-                                    elif (upfront_cost / 2) <= 2500:
-                                        rebate_value = upfront_cost / 2
-                                    else:
-                                        rebate_value = 2500
-                        except Exception as e:
-                            print(f"Rebate error for {state}: {e}")
-                        # Rebate Logic ↑↑↑↑↑↑
-
-                        upfront_cost -= rebate_value
-
-                        simple_payback = (upfront_cost - old_row["Up front cost ($)"]) / annual_savings if option.startswith("Yes, my current") else upfront_cost / annual_savings
-
-                        cumulative, year = 0, 0
-                        while cumulative < upfront_cost and year < 50:
-                            year += 1
-                            cumulative += annual_savings / (1 + discount_rate) ** year
-
-                        print(f"--- Payback Debug ---")
-                        print(f"Heat Pump Type: {hp_type}")
-                        print(f"Old Heater: {old_heater}")
-                        print(f"State: {state}")
-                        print(f"Upfront Cost (before rebate): {hp_row['Up front cost ($)']}")
-                        print(f"Rebate Applied: {rebate_value}")
-                        print(f"Upfront Cost (after rebate): {upfront_cost}")
-                        print(f"Annual Savings: {annual_savings}")
-                        print(f"Simple Payback: {simple_payback}")
-                        print(f"Discounted Payback (yrs): {year}")
-                        print("---------------------")
-
-                        payback_data.append({
-                            "Heat Pump Type": hp_type,
-                            "Simple Payback (yrs)": round(simple_payback, 1),
-                            "Discounted Payback (yrs)": year
-                        })
-
-                    with st.expander("Estimated Payback Period", expanded=True):
-                        if payback_data:
-                            df = pd.DataFrame(payback_data)
-                            chart = px.bar(df, x="Heat Pump Type", y=["Simple Payback (yrs)", "Discounted Payback (yrs)"],
-                                           barmode="group", text_auto=True, height=200,
-                                           color_discrete_sequence=["#1AFF00", "#0FB7E6"])
-                            apply_chart_formatting(chart, yaxes_title="Years")
-                            st.plotly_chart(chart, use_container_width=True)
-                        else:
-                            st.info("Could not find matching heat pump scenarios for payback calculation.")
-
-
-
-        #  Environmental summary 
-        """It slways comes up for current system, howver, ifPayback period question triggered it shows the emission comparison between current and HPs systems """
-
-        with st.expander("Environmental summary: Annual CO2 emissions (tons/year)", expanded=True):
-            env_rows = data[["System", "CO2 emissions (tons/yr)"]].copy()
-
-            if 'payback_data' in locals() and payback_data:
-                for hp in ["Premium Heat Pump", "Standard Heat Pump"]:
-                    hp_match = all_systems_data.loc[
-                        (all_systems_data["Location"] == rep_postcode) &
-                        (all_systems_data["Household occupants"] == values["household_occupants"]) &
-                        (all_systems_data["Heater"] == hp)
+                current_value = metric_values(data, metric).iloc[0]
+                is_current = (
+                    (options["Heater"] == values["heater"])
+                    & (options["Heater control"] == values["heater_control"])
+                    & (options["Hot water billing type"] == values["hot_water_billing_type"])
+                )
+                options.loc[is_current, "Heater"] = options.loc[is_current, "Heater"] + " (your system)"
+                st.dataframe(
+                    options[["Rank"] + option_columns + list(ranking_metrics.values())],
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={column: st.column_config.NumberColumn(format="%.2f") for column in ranking_metrics.values()},
+                )
+                if not is_current.any():
+                    profile_options = all_systems_data[
+                        (all_systems_data["Household occupants"] == values["household_occupants"])
+                        & (all_systems_data["Hot water usage pattern"] == values["hot_water_usage_pattern"])
+                        & (all_systems_data["Solar"] == values["solar"])
                     ]
-                    if not hp_match.empty:
-                        hp_row = hp_match.iloc[0]
-                        env_rows = pd.concat([
-                            env_rows,
-                            pd.DataFrame({
-                                "System": [hp.replace(" Heat Pump", "").title() + " Heat Pump"],
-                                "CO2 emissions (tons/yr)": [hp_row["CO2 emissions (tons/yr)"]]
-                            })
-                        ], ignore_index=True)
-            chart = px.bar(env_rows, x="System", y="CO2 emissions (tons/yr)", color ="System",
-                           text_auto=True, barmode="group", height=220, color_discrete_sequence=["#EA0C0C", "#1AFF00", "#0FB7E6"])
-            apply_chart_formatting(chart, yaxes_title="CO2 emissions (tons/yr)", show_legend=False)
-            chart.update_traces(texttemplate="%{y:.2f}")  # force two decimals on top
-            st.plotly_chart(chart, use_container_width=True)
+                    current_rank = int((metric_values(profile_options, metric) < current_value).sum()) + 1
+                    st.caption(f"Your current system ranks {current_rank} of {len(profile_options)} options.")
 
-        
         # Debug to check what data is passed before compare buttons
         #st.write("DEBUG data (filtered to postcode) before compare buttons:", data.head(5))
         #st.write("DEBUG all_systems_data (copied after postcode filter):", all_systems_data.head(5))
@@ -320,7 +202,7 @@ def render(data, postcode_df):
         st.markdown("<h3 style='color: #FFA000;'>Compare your hot water system with other options:</h3>", unsafe_allow_html=True)
         st.markdown("Please go to **Compare** tab if you would like to further explore saving opportunities with heat-pumps (i.e. solar-soak control).</h3>", unsafe_allow_html=True)
         compare_options = [
-            ("Compare to a Heat Pump", "If using 'Diverter' switches to 'On sunny hours'.", create_basic_heat_pump_config),
+            ("Compare to a Heat Pump", "If using 'Diverter' switches to 'On sunny hours'.", basic_heat_pump_config),
             ("Compare with adding solar electric system (PV)", "Converts to electric if starting with gas.", create_solar_electric),
             ("Compare with Electric", None, create_electric),
             ("Compare with Solar Thermal", None, create_solar_thermal),
@@ -341,3 +223,79 @@ def render(data, postcode_df):
                 st.session_state['tab'] = "Compare"
                 st.session_state['scroll_to_top'] = True
             st.button(text, key=text.lower().replace(" ", "_"), help=help, on_click=compare_callback, use_container_width=True)
+
+
+@panel_fragment("payback section")
+def render_payback_and_emissions(data, all_systems_data, values, rep_postcode, show_uncertainty):
+    """Heat pump payback (for Electric and gas systems) and the emissions summary.
+
+    The payback question and discount rate rerun only this section. The emissions
+    chart is part of it because it adds the heat pumps once payback is shown.
+    """
+    payback_data = []
+
+    # Payback period calculation and logic from Gas and Electric to HPs Systems
+
+    """If user select "Electric", "Gas Instant", "Gas Storage" as current system, Payback period question comes up and then there are options to select for End-of-life or standard payback period or not looking for changing system"""
+
+    if values["heater"] in ["Electric", "Gas Instant", "Gas Storage"]:
+        if values["heater"] == "Electric" and values.get("heater_control") == "Diverter":
+            st.info("Payback period calculation is not available for Electric systems with 'Diverter' control.")
+        else:
+            st.markdown("<h3 style='color: #FFA000;'>Would you like to find out the finances and emissions after switching to a heat-pump?</h3>", unsafe_allow_html=True)
+            option = st.radio("Do you want to change to a heat pump?", ["Yes, my current system comes to the end of life and needs a replacement", "Yes, I just want a more efficient system", "No"], index=2)
+            if option != "No":
+                discount_rate = st.selectbox("Select discount rate:", [0.02, 0.04, 0.06], index=0)
+                payback_data = compute_payback(values, option, discount_rate)
+
+                with st.expander("Estimated Payback Period", expanded=True):
+                    if payback_data:
+                        df = pd.DataFrame(payback_data)
+                        chart = px.bar(df, x="Heat Pump Type", y=["Simple Payback (yrs)", "Discounted Payback (yrs)"],
+                                       barmode="group", text_auto=True, height=200,
+                                       color_discrete_sequence=["#1AFF00", "#0FB7E6"])
+                        apply_chart_formatting(chart, yaxes_title="Years")
+                        if show_uncertainty:
+                            ranges = payback_bands(data.iloc[0], option, discount_rate).loc[df["Heat Pump Type"]]
+                            for payback in ["Simple Payback (yrs)", "Discounted Payback (yrs)"]:
+                                add_uncertainty_bands(
+                                    chart, payback, ranges[[f"{payback} p{p}" for p in (10, 50, 90)]].to_numpy().T
+                                )
+                        st.plotly_chart(chart, use_container_width=True)
+                        if show_uncertainty:
+                            chances = ", ".join(
+                                f"{hp_type}: {chance:.0%}" for hp_type, chance in ranges["Chance of saving money"].items()
+                            )
+                            st.caption(f"Chance of saving money across the simulations ({chances}).")
+                    else:
+                        st.info("Could not find matching heat pump scenarios for payback calculation.")
+
+
+
+    #  Environmental summary 
+    """It slways comes up for current system, howver, ifPayback period question triggered it shows the emission comparison between current and HPs systems """
+
+    with st.expander("Environmental summary: Annual CO2 emissions (tons/year)", expanded=True):
+        env_rows = data[["System", "CO2 emissions (tons/yr)"]].copy()
+
+        if payback_data:
+            for hp in heat_pump_types():
+                hp_match = all_systems_data.loc[
+                    (all_systems_data["Location"] == rep_postcode) &
+                    (all_systems_data["Household occupants"] == values["household_occupants"]) &
+                    (all_systems_data["Heater"] == hp)
+                ]
+                if not hp_match.empty:
+                    hp_row = hp_match.iloc[0]
+                    env_rows = pd.concat([
+                        env_rows,
+                        pd.DataFrame({
+                            "System": [hp],
+                            "CO2 emissions (tons/yr)": [hp_row["CO2 emissions (tons/yr)"]]
+                        })
+                    ], ignore_index=True)
+        chart = px.bar(env_rows, x="System", y="CO2 emissions (tons/yr)", color ="System",
+                       text_auto=True, barmode="group", height=220, color_discrete_sequence=["#EA0C0C", "#1AFF00", "#0FB7E6"])
+        apply_chart_formatting(chart, yaxes_title="CO2 emissions (tons/yr)", show_legend=False)
+        chart.update_traces(texttemplate="%{y:.2f}")  # force two decimals on top
+        st.plotly_chart(chart, use_container_width=True)
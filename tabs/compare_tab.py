@@ -1,156 +1,356 @@
+import functools
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+
+from graphics.charts import add_uncertainty_bands, apply_chart_formatting
+from data_processing.data_processing import metrics, groups
+from engine.npv import break_even_years, cost_curves, with_net_present_cost
+from engine.scenarios import key_columns, lookup_systems, profile_columns, resolve_selection
+from engine.uncertainty import cost_bands
+from engine.state_token import cached_result, canonical_selections, encode_state
+from engine.what_if import is_default, overrides_hash, what_if_data, what_if_rows
+from helpers.fragments import panel_fragment
+from helpers.prefetch import prefetch, prefetched
+from helpers.url_state import sync_url_state
+from helpers.data_selectors import (
+    MAX_COMPARE_SYSTEMS,
+    build_npv_settings,
+    build_system_selector,
+    build_what_if_overrides,
+    compare_key_versions,
+    npv_settings,
+)
+
+
+MAX_SYSTEMS = MAX_COMPARE_SYSTEMS
 
-from graphics.charts import apply_chart_formatting
-from data_processing.data_processing import metrics, groups, load_and_preprocess_data
-from helpers.data_selectors import build_interactive_data_filter, get_rep_postcode_from_postcode
+system_names = ["Current system", "Alternative system"] + [f"System {i}" for i in range(3, MAX_SYSTEMS + 1)]
+system_key_versions = compare_key_versions
 
 
 def render(data):
-    """Renders the Compare tab for side-by-side system comparison."""
-
-    # Load data and postcode mapping on each rerun
-    data, postcode_df = load_and_preprocess_data()
-    
-    # Ask for postcode to filter dataset to climate zone first
-    #postcode = st.text_input(
-        #"Enter your postcode",
-        #value="",
-        #max_chars=4,
-        #help="Type your postcode without spinner.",
-    #)
-
-    #rep_postcode = None
-    #if postcode and postcode.isdigit():
-        #rep_postcode = get_rep_postcode_from_postcode(int(postcode), postcode_df)
-        #if rep_postcode:
-            #data = data[data["Location"] == rep_postcode]
-        #else:
-            #st.warning("No data found for this postcode, please check your entry.")
-
-    #st.markdown(
-        #"<h3 style='text-align: center; color: #FFA000;'>Compare two hot water systems in detail</h1>",
-       # unsafe_allow_html=True,
-    #)
-    
-    # Remembering postcode input from Begin tab
-    data_two_slice = data.copy()
-    loc = st.session_state.get("select_location_two")
-    if loc:
-        data_two_slice = data_two_slice[data_two_slice["Location"] == loc]
-
-    data_three_slice = data.copy()
-    loc = st.session_state.get("select_location_three")
-    if loc:
-        data_three_slice = data_three_slice[data_three_slice["Location"] == loc]
-
-
-
-    #st.write("DEBUG data_two_slice first 3 rows:", data_two_slice.head(3))
-    #st.write("DEBUG data_three_slice first 3 rows:", data_three_slice.head(3))
-
-    # Create 3-column layout
+    """Renders the Compare tab for side-by-side comparison of 2 to MAX_SYSTEMS systems."""
+    # Up to MAX_SYSTEMS systems are compared. The first two keep the key versions the
+    # Begin tab's compare buttons export to ("two" and "three").
+    n_systems = st.number_input(
+        "Number of systems to compare", min_value=2, max_value=MAX_SYSTEMS, value=2, step=1,
+        key="number_compare_systems",
+    )
+    render_comparison(n_systems)
+
+
+@panel_fragment("comparison")
+def render_comparison(n_systems):
+    """The systems' selector panels and the chart column.
+
+    Changing a selection reruns only this, not the rest of the page.
+    """
+    names = system_names[:n_systems]
+    key_versions = system_key_versions[:n_systems]
+
+    # Create 3-column layout, with the systems' selectors alternating between the sides
     left, middle, right = st.columns([1.75, 5, 1.75])
 
-    with left:
-        st.markdown(
-            "<h4 style='text-align:center; font-size:20px;'><b>Current system</b></h4>",
-            unsafe_allow_html=True
-        )
-        with st.expander("Current system", expanded=True):
-            data_two, values_two = build_interactive_data_filter(data_two_slice, key_version="two")
-
-    with right:
-        st.markdown(
-            "<h4 style='text-align:center; font-size:20px;'><b>Alternative system</b></h4>",
-            unsafe_allow_html=True
-        )
-        with st.expander("Alternative system", expanded=True):
-            data_three, values_three = build_interactive_data_filter(data_three_slice, key_version="three")
-
-    #st.write("DEBUG COMPARE current system selected =", values_two)
-    #st.write("DEBUG COMPARE alternative system selected =", values_three)
+    selections = []
+    for i, (name, key_version) in enumerate(zip(names, key_versions)):
+        # Remembering postcode input from Begin tab; added systems start in the current system's area
+        location = st.session_state.get(f"select_location_{key_version}", st.session_state.get("select_location_two"))
+        with left if i % 2 == 0 else right:
+            st.markdown(
+                f"<h4 style='text-align:center; font-size:20px;'><b>{name}</b></h4>",
+                unsafe_allow_html=True
+            )
+            with st.expander(name, expanded=True):
+                selections.append(build_system_selector(key_version, location or None))
+
+    # Kept for the link to this view (the selectors' own keys also hold them)
+    st.session_state["compare_selections"] = selections
+    sync_url_state()
 
     with middle:
-        # Prepare data for comparison charts
-        current_system_data_chart = data_two.copy()
-        current_system_data_chart.insert(0, "System", "<span style='font-size:16px;'><b>Current system</b></span>")
+        render_chart_column(names, selections)
 
-        alternative_system_data_chart = data_three.copy()
-        alternative_system_data_chart.insert(0, "System", "<span style='font-size:16px;'><b>Alternative system</b></span>")
 
-        system_comparison_chart_data = pd.concat([current_system_data_chart, alternative_system_data_chart])
+def comparison_token(selections, names, overrides, show_uncertainty, rate, horizon):
+    """State token of a comparison and the chart options it is drawn with.
 
-        # System label for tables (plain text)
-        current_system_data_table = data_two.copy()
-        current_system_data_table.insert(0, "System", "Current system")
+    Keys the comparison's results in the shared result cache, so sessions
+    comparing the same systems with the same options share one computation.
+    """
+    return encode_state({
+        "systems": canonical_selections(selections),
+        "names": list(names),
+        "what_if": None if is_default(overrides) else overrides_hash(overrides),
+        "uncertainty": bool(show_uncertainty),
+        "rate": rate,
+        "horizon": horizon,
+    })
 
-        alternative_system_data_table = data_three.copy()
-        alternative_system_data_table.insert(0, "System", "Alternative system")
 
-        system_comparison_table_data = pd.concat([current_system_data_table, alternative_system_data_table])
+def chart_labels(table_data):
+    """The rows with system names formatted for chart axes."""
+    chart_data = table_data.copy()
+    chart_data["System"] = chart_data["System"].map(
+        lambda name: f"<span style='font-size:16px;'><b>{name}</b></span>"
+    )
+    return chart_data
 
 
-        # Spending comparison
-        with st.expander("Spending comparison", expanded=True):
-            columns_to_plot = [
-                "Up front cost ($)",
-                "Rebates ($)",
-                "Annual cost ($/yr)",
-                "Decrease in solar export revenue ($/yr)",
-            ]
-            bar_chart = px.bar(
-                system_comparison_chart_data, x="System", y=columns_to_plot,
-                text_auto=True, barmode="group", height=400
-            )
-            apply_chart_formatting(bar_chart, yaxes_title="Costs")
-            bar_chart.update_xaxes(
-                tickangle=0, automargin=True, tickfont=dict(size=12), ticklabelstandoff=15
-            )
-            bar_chart.update_layout(legend=dict(orientation="h", y=1.2, x=0.5, xanchor='center'))
-            st.plotly_chart(bar_chart, use_container_width=True, key="Spending")
-
-        # Net present cost plot
-        with st.expander("Simple financial comparison: over 10 years", expanded=False):
-            bar_chart = px.bar(
-                system_comparison_chart_data, x="System", y=["Net present cost ($)"],
-                text_auto=True, barmode="group"
-            )
-            apply_chart_formatting(bar_chart, yaxes_title="Net present cost ($)",
-                                   show_legend=False, height=250)
-            st.plotly_chart(bar_chart, use_container_width=True, key="Net present cost ($)")
-
-        # CO2 emissions
-        with st.expander("Environmental comparison", expanded=False):
-            bar_chart = px.bar(
-                system_comparison_chart_data, x="System", y=["CO2 emissions (tons/yr)"],
-                text_auto=True, barmode="group", height=250
-            )
-            apply_chart_formatting(bar_chart, yaxes_title="CO2 emissions (tons/yr)", show_legend=False)
-            bar_chart.update_traces(texttemplate="%{y:.2f}")
-            st.plotly_chart(bar_chart, use_container_width=True, key="Environmental")
-
-        # Tabular details
-        with st.expander("Tabular details comparison", expanded=False):
-            values_two["household_occupants"] = str(values_two["household_occupants"])
-            values_three["household_occupants"] = str(values_three["household_occupants"])
-            comp = pd.DataFrame({
-                "Option": list(map(str,values_two.keys())),
-                "Current system": list(map(str,values_two.values())),
-                "Alternative system": list(map(str,values_three.values())),
-            })
-            st.dataframe(comp, hide_index=True)
-
-        # Tabular metrics
-        with st.expander("Tabular performance comparison", expanded=False):
-            table_df = system_comparison_table_data.loc[:, ["System"] + groups + metrics]
-            st.dataframe(table_df, hide_index=True, column_config={
-                "Location": None,
-                "Household occupants": None,
-                "Hot water billing type": None,
-                "Heater": None,
-                "Heater control": None,
-                "Solar": None,
-                "Hot water usage pattern": None,
-            })
+def spending_chart(chart_data, show_uncertainty):
+    columns_to_plot = [
+        "Up front cost ($)",
+        "Rebates ($)",
+        "Annual cost ($/yr)",
+        "Decrease in solar export revenue ($/yr)",
+    ]
+    bar_chart = px.bar(
+        chart_data, x="System", y=columns_to_plot,
+        text_auto=True, barmode="group", height=400
+    )
+    apply_chart_formatting(bar_chart, yaxes_title="Costs")
+    bar_chart.update_xaxes(
+        tickangle=0, automargin=True, tickfont=dict(size=12), ticklabelstandoff=15
+    )
+    bar_chart.update_layout(legend=dict(orientation="h", y=1.2, x=0.5, xanchor='center'))
+    if show_uncertainty:
+        add_uncertainty_bands(bar_chart, "Annual cost ($/yr)", cost_bands(chart_data)["Annual cost ($/yr)"])
+    return bar_chart
+
+
+def net_present_cost_chart(chart_data, rate, horizon, show_uncertainty):
+    """Net present cost bars; chart_data must already have the net present cost for the rate and horizon."""
+    bar_chart = px.bar(
+        chart_data, x="System", y=["Net present cost ($)"],
+        text_auto=True, barmode="group"
+    )
+    apply_chart_formatting(bar_chart, yaxes_title="Net present cost ($)",
+                           show_legend=False, height=250)
+    if show_uncertainty:
+        bands = cost_bands(chart_data, rate, horizon)
+        add_uncertainty_bands(bar_chart, "Net present cost ($)", bands["Net present cost ($)"])
+    return bar_chart
+
+
+def emissions_chart(chart_data):
+    bar_chart = px.bar(
+        chart_data, x="System", y=["CO2 emissions (tons/yr)"],
+        text_auto=True, barmode="group", height=250
+    )
+    apply_chart_formatting(bar_chart, yaxes_title="CO2 emissions (tons/yr)", show_legend=False)
+    bar_chart.update_traces(texttemplate="%{y:.2f}")
+    return bar_chart
+
+
+def prepare_comparison(data, selections, names, show_uncertainty, rate, horizon):
+    """The rows and charts of a comparison for the given chart options.
+
+    Makes no Streamlit calls, so it can run in the background (see helpers.prefetch).
+
+    Returns:
+        {"table_data": rows from lookup_systems, "figures": charts keyed by the
+        chart and the options it was drawn with}
+    """
+    table_data = lookup_systems(data, selections, names)
+    chart_data = chart_labels(table_data)
+    return {
+        "table_data": table_data,
+        "figures": {
+            ("Spending", show_uncertainty): spending_chart(chart_data, show_uncertainty),
+            ("Net present cost ($)", rate, horizon, show_uncertainty): net_present_cost_chart(
+                with_net_present_cost(chart_data, rate, horizon), rate, horizon, show_uncertainty
+            ),
+            ("Environmental",): emissions_chart(chart_data),
+        },
+    }
+
+
+def prefetch_comparisons(comparisons):
+    """Prepare comparisons in the background, for the Compare tab to pick up when they are opened.
+
+    Uses the Compare tab's current chart options and what-if changes. Results go
+    in the shared result cache, so they also serve other sessions.
+
+    Args:
+        comparisons: Lists of selections, one list per comparison, each starting
+                     with the current and alternative systems
+    """
+    overrides = st.session_state.get("what_if_overrides")
+    data = what_if_data(overrides)
+    show_uncertainty = st.session_state.get("toggle_uncertainty_compare", False)
+    rate, horizon = npv_settings("compare")
+    prefetch(dict(
+        comparison_job(data, selections, overrides, show_uncertainty, rate, horizon)
+        for selections in comparisons
+    ))
+
+
+def comparison_job(data, selections, overrides, show_uncertainty, rate, horizon):
+    """A comparison's token and a function preparing it through the shared result cache.
+
+    The selections are resolved as the Compare tab's selectors would resolve them,
+    so the token matches the one the tab computes once the comparison is opened.
+
+    Returns:
+        (token, job), where job() returns the prepare_comparison result
+    """
+    selections = [resolve_selection(selection) for selection in selections]
+    names = system_names[:len(selections)]
+    token = comparison_token(selections, names, overrides, show_uncertainty, rate, horizon)
+    return token, functools.partial(
+        cached_result, token,
+        functools.partial(prepare_comparison, data, selections, names, show_uncertainty, rate, horizon),
+    )
+
+
+@panel_fragment("chart column")
+def render_chart_column(names, selections):
+    """Charts and tables of the selected systems.
+
+    Chart options (uncertainty, discount rate, extra options, what-if changes)
+    rerun only this column. Charts prefetched from the Begin tab are used when
+    they were drawn with the same options.
+    """
+    # Load data on each rerun, with any what-if price and emissions changes applied
+    overrides = st.session_state.get("what_if_overrides")
+    data = what_if_data(overrides)
+
+    # Every system's rows in one lookup and the charts, prefetched by the Begin tab or
+    # shared with other sessions with the same comparison when possible. Chart options
+    # are read from session state here, as the widgets are drawn further down.
+    show_uncertainty = st.session_state.get("toggle_uncertainty_compare", False)
+    rate, horizon = npv_settings("compare")
+    token = comparison_token(selections, names, overrides, show_uncertainty, rate, horizon)
+    prepared = prefetched(token)
+    if prepared is None:
+        prepared = cached_result(token, functools.partial(
+            prepare_comparison, data, selections, names, show_uncertainty, rate, horizon
+        ))
+    figures = prepared["figures"]
+    system_comparison_table_data = prepared["table_data"]
+    system_comparison_chart_data = chart_labels(system_comparison_table_data)
+
+    show_uncertainty = st.toggle(
+        "Show uncertainty ranges", key="toggle_uncertainty_compare",
+        help="Ranges from thousands of simulations with varying energy prices, hot water use, "
+             "installation costs and rebate eligibility (bars run from the 10th to the 90th percentile).",
+    )
+
+    # Spending comparison
+    with st.expander("Spending comparison", expanded=True):
+        bar_chart = figures.get(("Spending", show_uncertainty))
+        if bar_chart is None:
+            bar_chart = spending_chart(system_comparison_chart_data, show_uncertainty)
+        st.plotly_chart(bar_chart, use_container_width=True, key="Spending")
+
+    # Net present cost plot
+    with st.expander("Simple financial comparison: over 10 years", expanded=False):
+        # Net present cost is recomputed for the chosen rate and horizon, for the chart and the table below
+        rate, horizon = build_npv_settings("compare")
+        system_comparison_chart_data = with_net_present_cost(system_comparison_chart_data, rate, horizon)
+        system_comparison_table_data = with_net_present_cost(system_comparison_table_data, rate, horizon)
+        bar_chart = figures.get(("Net present cost ($)", rate, horizon, show_uncertainty))
+        if bar_chart is None:
+            bar_chart = net_present_cost_chart(system_comparison_chart_data, rate, horizon, show_uncertainty)
+        st.plotly_chart(bar_chart, use_container_width=True, key="Net present cost ($)")
+        render_cost_curves(what_if_rows(overrides), system_comparison_table_data, rate, horizon)
+
+    # CO2 emissions
+    with st.expander("Environmental comparison", expanded=False):
+        bar_chart = figures.get(("Environmental",))
+        if bar_chart is None:
+            bar_chart = emissions_chart(system_comparison_chart_data)
+        st.plotly_chart(bar_chart, use_container_width=True, key="Environmental")
+
+    with st.expander("What-if: prices and emissions", expanded=False):
+        build_what_if_overrides("compare")
+
+    # Tabular details
+    with st.expander("Tabular details comparison", expanded=False):
+        comp = pd.DataFrame({"Option": list(map(str, selections[0].keys()))})
+        for name, values in zip(names, selections):
+            comp[name] = [str(value) for value in values.values()]
+        st.dataframe(comp, hide_index=True)
+
+    # Tabular metrics
+    with st.expander("Tabular performance comparison", expanded=False):
+        table_df = system_comparison_table_data.loc[:, ["System"] + groups + metrics]
+        st.dataframe(table_df, hide_index=True, column_config={
+            "Location": None,
+            "Household occupants": None,
+            "Hot water billing type": None,
+            "Heater": None,
+            "Heater control": None,
+            "Solar": None,
+            "Hot water usage pattern": None,
+        })
+
+
+def option_label(row):
+    return f"{row['Heater']} ({row['Heater control']}, {row['Hot water billing type']})"
+
+
+def render_cost_curves(data, compared, rate, horizon):
+    """Cumulative cost over time of the compared systems and any extra candidates, with break-even points.
+
+    `data` must include the virtual Solar "Yes" gas rows (see engine.what_if.what_if_rows).
+    """
+    if compared.empty or compared["System"].iloc[0] != "Current system":
+        return
+    if compared["System"].duplicated().any():
+        st.caption("Enter your postcode on the Begin tab to see costs over time.")
+        return
+
+    # Extra candidates are the other options open to the current system's household
+    current = compared.iloc[0]
+    profile_options = data[(data[profile_columns] == current[profile_columns]).all(axis=1)].reset_index(drop=True)
+    compared_keys = compared[key_columns].apply(tuple, axis=1)
+    profile_options = profile_options[~profile_options[key_columns].apply(tuple, axis=1).isin(compared_keys)]
+    candidate_labels = dict(zip(profile_options.apply(option_label, axis=1), profile_options.index))
+
+    # Drop candidates that aren't options any more (e.g. after the current system's household changed)
+    key = "multiselect_cost_curve_candidates"
+    st.session_state[key] = [label for label in st.session_state.get(key, []) if label in candidate_labels]
+    candidates = st.multiselect("Add other options to the cost over time chart:", list(candidate_labels), key=key)
+
+    systems = pd.concat([compared, profile_options.loc[[candidate_labels[c] for c in candidates]]])
+    names = list(compared["System"]) + candidates
+    curves = cost_curves(systems, rate, horizon)
+    break_even = break_even_years(curves, curves[0])
+
+    years = list(range(horizon + 1))
+    chart = go.Figure()
+    for name, curve in zip(names, curves):
+        chart.add_trace(go.Scatter(
+            x=years, y=curve, mode="lines+markers", name=name,
+            hovertemplate=f"{name}<br>Year %{{x}}: $%{{y:,.0f}}<extra></extra>",
+        ))
+    # Mark where each system's cumulative cost drops below the current system's
+    crossings = [
+        (name, year, np.interp(year, years, curve))
+        for name, year, curve in zip(names[1:], break_even[1:], curves[1:])
+        if year > 0
+    ]
+    if crossings:
+        chart.add_trace(go.Scatter(
+            x=[year for _, year, _ in crossings], y=[cost for _, _, cost in crossings],
+            mode="markers", name="Break-even", marker=dict(symbol="x", size=12, color="black"),
+            hovertemplate="Break-even after %{x:.1f} years: $%{y:,.0f}<extra></extra>",
+        ))
+    apply_chart_formatting(chart, yaxes_title="Cumulative cost ($)", height=350)
+    chart.update_xaxes(title_text="Years")
+    chart.update_layout(legend=dict(orientation="h", y=1.25, x=0.5, xanchor="center"))
+    st.plotly_chart(chart, use_container_width=True, key="Cumulative cost")
+
+    notes = []
+    for name, year in zip(names[1:], break_even[1:]):
+        if np.isnan(year):
+            notes.append(f"{name} does not break even with the current system within {horizon} years.")
+        elif year == 0:
+            notes.append(f"{name} costs less than the current system from the start.")
+        else:
+            notes.append(f"{name} breaks even with the current system after {year:.1f} years.")
+    st.caption(" ".join(notes))
@@ -1,16 +1,64 @@
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
 
 from graphics.charts import apply_chart_formatting
 from data_processing.data_processing import metrics, groups, load_and_preprocess_data
-from helpers.data_selectors import get_rep_postcode_from_postcode
+from helpers.data_selectors import build_npv_settings, build_what_if_overrides
+from helpers.fragments import panel_fragment
+from engine.npv import DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS, with_net_present_cost
+from engine.rankings import is_pareto_optimal, pareto_mask
+from engine.scenarios import profile_columns, resolve_postcode
+from engine.what_if import is_default, what_if_rows
+
+
+def summarise_table(show_data, table_groups, summarise):
+    """Average the metrics over the chart groups (unless showing all rows) and sort by cost."""
+    if len(table_groups) > 0 and summarise == "Average":
+        agg_dict = {col: "mean" for col in metrics}
+        show_data = show_data.groupby(table_groups, as_index=False).agg(agg_dict)
+    return show_data.sort_values("Net present cost ($)")
+
+
+def render_frontier_chart(f_data, color, dataset_values=True):
+    """Scatter of cost vs emissions with each profile's Pareto frontier marked.
+
+    With the dataset's own costs and emissions the frontier comes from the
+    precomputed index, so this is a lookup per row rather than a skyline
+    computation per rerun. If they have been changed (another discount rate or
+    horizon, or what-if overrides), the frontier is computed for the rows shown.
+    """
+    cost, emissions = "Net present cost ($)", "CO2 emissions (tons/yr)"
+    rows = f_data.rename(columns={"Postcode": "Location"})
+    on_frontier = is_pareto_optimal(rows) if dataset_values else pareto_mask(rows)
+
+    chart = px.scatter(f_data, x=cost, y=emissions, color=color, opacity=0.5)
+    frontier = f_data[on_frontier].sort_values(cost)
+    chart.add_trace(go.Scatter(
+        x=frontier[cost],
+        y=frontier[emissions],
+        # Connect the frontier when it belongs to a single household profile
+        mode="markers+lines" if len(frontier[["Postcode"] + profile_columns[1:]].drop_duplicates()) == 1 else "markers",
+        name="Cost vs emissions frontier",
+        marker=dict(symbol="circle-open", size=12, color="black", line=dict(width=2)),
+        line=dict(color="black", dash="dot"),
+        hovertext=frontier["Heater"] + ", " + frontier["Heater control"],
+    ))
+    chart.update_layout(margin={"t": 20, "b": 20}, legend_title_text="", height=400)
+    st.plotly_chart(chart, use_container_width=True)
+    st.caption(
+        f"{int(on_frontier.sum())} of {len(f_data)} systems shown are on their household profile's "
+        "frontier: no other system for the same postcode, household size, usage pattern and solar "
+        "is both cheaper and lower in emissions."
+    )
 
 
 def render(data):
     """Renders the Advanced explorer tab with flexible data filtering and visualization."""
 
-    # Load data and postcode mapping
+    # Load data and postcode mapping, with any what-if price and emissions changes applied
     data, postcode_df = load_and_preprocess_data()
+    data = what_if_rows(st.session_state.get("what_if_overrides"))
 
     # Highlight this section is for advanced users
     st.markdown(
@@ -86,8 +134,7 @@ def render(data):
 
                         # Map each to representative postcode
                         rep_postcodes = []
-                        for pc in entered_postcodes:
-                            rep_pc = get_rep_postcode_from_postcode(pc, postcode_df)
+                        for pc, rep_pc in zip(entered_postcodes, resolve_postcode(entered_postcodes)):
                             if rep_pc:
                                 rep_postcodes.append(rep_pc)
                             else:
@@ -209,6 +256,21 @@ def render(data):
                     key="selectbox_metric"
                 )
 
+                rate, horizon = build_npv_settings("explore")
+
+                show_frontier = st.checkbox(
+                    "Show cost vs emissions frontier",
+                    key="checkbox_pareto",
+                    help="Plot net present cost against emissions and mark the systems that no other "
+                         "system in the same household profile beats on both.",
+                )
+
+            with st.expander("What-if: prices and emissions"):
+                build_what_if_overrides("explore")
+
+            # Net present cost for the chosen rate and horizon, on the already filtered rows
+            f_data = with_net_present_cost(f_data, rate, horizon)
+
             # Create copy of the data for displaying in a table
             show_data = f_data.loc[:, groups_fixed + metrics]
 
@@ -218,6 +280,12 @@ def render(data):
             chart.update_traces(width=2.0)
             apply_chart_formatting(chart)
             st.plotly_chart(chart, use_container_width=True)
+
+            if show_frontier:
+                render_frontier_chart(f_data, color, dataset_values=(
+                    (rate, horizon) == (DATASET_DISCOUNT_RATE, DATASET_HORIZON_YEARS)
+                    and is_default(st.session_state.get("what_if_overrides"))
+                ))
    
     # Write Subheading for the bottom table.
     with st.container():
@@ -227,12 +295,14 @@ def render(data):
         )
     # Create a container for displaying the chart data in a table.
     with st.container():
-        summarise = st.radio(
-            "Data display option", ["Average", "Show all"], label_visibility="collapsed"
-        )
-        table_groups = list(set((x, color)))
-        if len(table_groups) > 0 and summarise == "Average":
-            agg_dict = {col: "mean" for col in metrics}
-            show_data = show_data.groupby(table_groups, as_index=False).agg(agg_dict)
-        show_data = show_data.sort_values("Net present cost ($)")
-        st.dataframe(show_data.style.format(precision=2), hide_index=True)
+        render_table(show_data, list(set((x, color))))
+
+
+@panel_fragment("table")
+def render_table(show_data, table_groups):
+    """The table of the rows shown in the chart; switching between average and all rows reruns only this."""
+    summarise = st.radio(
+        "Data display option", ["Average", "Show all"], label_visibility="collapsed"
+    )
+    show_data = summarise_table(show_data, table_groups, summarise)
+    st.dataframe(show_data.style.format(precision=2), hide_index=True)
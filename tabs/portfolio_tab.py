@@ -0,0 +1,120 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+from graphics.charts import apply_chart_formatting
+from engine.portfolio import (
+    DEFAULT_CHUNK_SIZE,
+    PortfolioError,
+    portfolio_columns,
+    portfolio_template,
+    stream_portfolio,
+    summarise_portfolio,
+)
+
+
+def _evaluate_upload(uploaded_file, option, discount_rate):
+    """Evaluate an uploaded portfolio chunk by chunk, showing progress as it goes."""
+    # Count rows up front so the progress bar knows the total (minus the header)
+    total_rows = max(uploaded_file.getvalue().count(b"\n") - 1, 1)
+    uploaded_file.seek(0)
+
+    progress = st.progress(0.0, text="Evaluating households...")
+    preview = st.empty()
+    results, done = [], 0
+    chunks = pd.read_csv(uploaded_file, chunksize=DEFAULT_CHUNK_SIZE)
+    for chunk_results in stream_portfolio(chunks, option, discount_rate):
+        results.append(chunk_results)
+        done += len(chunk_results)
+        progress.progress(min(done / total_rows, 1.0), text=f"Evaluated {done:,} households")
+        preview.dataframe(chunk_results.head(100), hide_index=True)
+    progress.empty()
+    preview.empty()
+    return results
+
+
+def render():
+    """Renders the Portfolio tab: evaluate an uploaded CSV of households in bulk."""
+
+    st.markdown(
+        "<h3 style='text-align: center; color: #FFA000;'>Evaluate a portfolio of households</h3>",
+        unsafe_allow_html=True,
+    )
+    st.markdown(
+        "For installers and retailers: upload a CSV with one row per household and we will estimate "
+        "each household's current hot water costs, the lowest cost alternative system, its payback "
+        "period and the emissions saved."
+    )
+
+    with st.expander("CSV format", expanded=False):
+        st.markdown(
+            "The CSV needs these columns (any other columns, such as a customer ID, are kept in the results): "
+            + ", ".join(f"**{column}**" for column in portfolio_columns.values())
+            + ". Values use the same options as the **Begin** tab."
+        )
+        template = portfolio_template()
+        st.dataframe(template, hide_index=True)
+        st.download_button(
+            "Download template CSV",
+            template.to_csv(index=False),
+            file_name="solarshift_portfolio_template.csv",
+            mime="text/csv",
+        )
+
+    uploaded_file = st.file_uploader("Upload portfolio CSV", type="csv", key="portfolio_upload")
+
+    left, right = st.columns(2)
+    with left:
+        option = st.radio(
+            "Are the current systems at the end of their life?",
+            ["Yes, my current system comes to the end of life and needs a replacement",
+             "Yes, I just want a more efficient system"],
+            index=1,
+            key="portfolio_option",
+        )
+    with right:
+        discount_rate = st.selectbox("Select discount rate:", [0.02, 0.04, 0.06], index=0, key="portfolio_discount_rate")
+
+    if uploaded_file is None:
+        return
+
+    # Keep the results for this upload and these settings, so reruns (e.g. the
+    # download button) don't evaluate the portfolio again
+    results_key = (uploaded_file.file_id, option, discount_rate)
+    if st.session_state.get("portfolio_results_key") != results_key:
+        try:
+            results = _evaluate_upload(uploaded_file, option, discount_rate)
+        except (PortfolioError, pd.errors.ParserError, UnicodeDecodeError) as e:
+            st.error(f"Could not read the portfolio: {e}")
+            return
+        if not results:
+            st.warning("The uploaded portfolio has no households.")
+            return
+        st.session_state["portfolio_results"] = pd.concat(results, ignore_index=True)
+        st.session_state["portfolio_results_key"] = results_key
+    results = st.session_state["portfolio_results"]
+
+    st.markdown("<h3 style='color: #FFA000;'>Portfolio summary</h3>", unsafe_allow_html=True)
+    summary = summarise_portfolio([results])
+    st.dataframe(summary, hide_index=True)
+
+    with st.expander("Best alternative systems", expanded=True):
+        counts = (
+            results[results["Status"] == "OK"]
+            .groupby("Best alternative heater", as_index=False)
+            .size()
+            .rename(columns={"size": "Households", "Best alternative heater": "System"})
+        )
+        chart = px.bar(counts, x="System", y="Households", text_auto=True, height=250)
+        apply_chart_formatting(chart, yaxes_title="Households", show_legend=False)
+        st.plotly_chart(chart, use_container_width=True)
+
+    st.markdown("<h3 style='color: #FFA000;'>Household results</h3>", unsafe_allow_html=True)
+    st.dataframe(results, hide_index=True)
+    st.download_button(
+        "Download results CSV",
+        results.to_csv(index=False),
+        file_name="solarshift_portfolio_results.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
@@ -42,7 +42,7 @@ def create(tab_names: List[str]) -> None:
         return func
 
     # Create buttons in equal-width columns
-    for name, col in zip(tab_names, st.columns([1, 1, 1, 1, 1])):
+    for name, col in zip(tab_names, st.columns([1] * len(tab_names))):
         with col:
             # Create full-width button with click handler
             st.button(